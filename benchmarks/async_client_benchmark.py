@@ -0,0 +1,80 @@
+# Latency of weather requests against a local mock of the Open-Meteo API (fixed server delay per request):
+# sequential blocking requests.get calls (legacy) versus the async client fanning the requests out over its
+# connection pool, for 1, 10 and 100 requests at once.
+# Run from the project root: python -m benchmarks.async_client_benchmark
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import modules.open_meteo_api as open_meteo_api
+from modules.rate_limiter import OPEN_METEO_LIMITS, RateLimiter
+
+SERVER_DELAY = 0.05
+BODY = json.dumps({'hourly': {'time': ['2024-01-01T00:00'] * 48, 'temperature_2m': [1.0] * 48}}).encode()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(SERVER_DELAY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def legacy_requests(url, queries):
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        response = requests.get(url, params=query)
+        response.raise_for_status()
+        response.json()['hourly']
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+def main():
+    server = MockServer(('127.0.0.1', 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/v1/archive'
+    # Keep the benchmark off the shared rate limiter budget
+    open_meteo_api.get_rate_limiter = lambda: RateLimiter(OPEN_METEO_LIMITS)
+    open_meteo_api.open_meteo_request(start_date='2024-01-01', end_date='2024-01-02', base_url=url)  # warm up
+
+    for count in [1, 10, 100]:
+        queries = [dict(start_date='2024-01-01', end_date='2024-01-02', latitude=47.3 + i * 0.01, longitude=8.5,
+                        base_url=url) for i in range(count)]
+
+        start_time = time.perf_counter()
+        latencies = legacy_requests(url, [{'latitude': query['latitude']} for query in queries])
+        legacy_total = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        results = open_meteo_api.open_meteo_request_many(queries, concurrency=100)
+        async_total = time.perf_counter() - start_time
+        assert all(result is not None for result in results)
+
+        print(f"{count:>3} requests: legacy {legacy_total * 1000:7.1f} ms total "
+              f"(median {statistics.median(latencies) * 1000:5.1f} ms each), "
+              f"async fan-out {async_total * 1000:7.1f} ms total")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# Benchmark of the lookup table based assign_average_volume against the former per-period merge.
+# Run from the project root: python -m benchmarks.average_volume_benchmark
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules.utils import assign_average_volume, build_volume_table
+
+
+def merge_assign_average_volume(df, volume, number_of_stations, number_of_periods):
+    """The former implementation: one merge per period and one column assignment per station."""
+    result_df = df.copy()
+    for p in range(number_of_periods):
+        temp_merge_df = result_df[['month', 'weekday']].copy()
+        temp_merge_df['hour_shifted'] = (result_df['hour'] + p) % 24
+        merged = temp_merge_df.merge(volume, how='left',
+                                     left_on=['month', 'weekday', 'hour_shifted'],
+                                     right_on=['month', 'weekday', 'hour'])
+        for s in range(number_of_stations):
+            result_df[f"traffic_volume_{s}_period_{p}"] = merged['traffic']
+            result_df[f"pedestrian_volume_{s}_period_{p}"] = merged['pedestrian']
+    return result_df
+
+
+def measure(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    volume = pd.read_csv('data/inference/average_volume.csv')
+    table = build_volume_table(volume)
+    rng = np.random.default_rng(0)
+
+    print(f"{'rows':>10} | {'merge':>12} | {'lookup table':>12} | {'speed-up':>8}")
+    for rows in [1, 50, 10_000, 1_000_000]:
+        df = pd.DataFrame({
+            'month': rng.integers(1, 13, size=rows),
+            'weekday': rng.integers(1, 8, size=rows),
+            'hour': rng.integers(0, 24, size=rows),
+        })
+        repeats = max(1, 200 // (rows // 10_000 + 1))
+        merge_time, expected = measure(lambda: merge_assign_average_volume(df, volume, 3, 2), repeats)
+        table_time, result = measure(lambda: assign_average_volume(df, table, 3, 2), repeats)
+        pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+        print(f"{rows:>10,} | {merge_time * 1e3:>9.3f} ms | {table_time * 1e3:>9.3f} ms | {merge_time / table_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Date imputation of the accident cleaning step: the iterrows loop of Data Cleaning.ipynb (legacy) versus the
+# vectorized impute_accident_dates. Rows that do not go back in time get a deterministic date and have to match
+# the legacy result exactly, rows that go back in time get a random day with the right weekday and month.
+# Run from the project root: python -m benchmarks.date_imputation_benchmark [RoadTrafficAccidentLocations.csv]
+# Without an argument a mostly chronologically ordered synthetic dataset with the size of the full dataset is used.
+import calendar
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from modules.cleaning import impute_accident_dates
+
+
+def make_accidents(rows, rng):
+    dates = pd.DatetimeIndex(np.sort(pd.Timestamp('2011-01-01') +
+                                     pd.to_timedelta(rng.integers(0, 13 * 365, size=rows), unit='D')))
+    year, month, weekday = dates.year.to_numpy(), dates.month.to_numpy(), dates.dayofweek.to_numpy() + 1
+    # Some neighbouring rows out of order, the walk wraps around at the end of the month
+    swapped = rng.choice(rows - 1, size=rows // 500, replace=False)
+    weekday[swapped], weekday[swapped + 1] = weekday[swapped + 1], weekday[swapped].copy()
+    # A few late-reported accidents of an earlier month
+    late = rng.choice(np.flatnonzero(month > 2), size=rows // 2000, replace=False)
+    month[late] -= 2
+    return pd.DataFrame({'AccidentYear': year, 'AccidentMonth': month, 'AccidentWeekDay': weekday,
+                         'AccidentHour': rng.integers(0, 24, size=rows)})
+
+
+def legacy_impute(accidents):
+    accidents = accidents.copy()
+    accidents['DateTime'] = None
+
+    def get_month_days(year, month, weekday):
+        return [day for day in range(1, calendar.monthrange(year, month)[1] + 1)
+                if calendar.weekday(year, month, day) == weekday - 1]
+
+    current_date = datetime(accidents.loc[0, 'AccidentYear'], accidents.loc[0, 'AccidentMonth'], 1)
+    while current_date.isoweekday() != accidents.loc[0, 'AccidentWeekDay']:
+        current_date += timedelta(days=1)
+
+    for idx, row in accidents.iterrows():
+        hour, weekday, month, year = row['AccidentHour'], row['AccidentWeekDay'], row['AccidentMonth'], row['AccidentYear']
+        if (year < current_date.year) | ((month < current_date.month) & (month != 1)):
+            days = get_month_days(year, month, weekday)
+            current_date = datetime(year, month, days[random.randint(0, len(days) - 1)])
+        if current_date.month != month:
+            current_date = datetime(year, month, 1)
+            while current_date.isoweekday() != weekday:
+                current_date += timedelta(days=1)
+        while current_date.isoweekday() != weekday:
+            current_date += timedelta(days=1)
+            if current_date.month != month:
+                current_date = datetime(year, month, 1)
+        accidents.at[idx, 'DateTime'] = current_date.replace(hour=hour)
+    return pd.to_datetime(accidents['DateTime'])
+
+
+def main(path=None):
+    if path:
+        accidents = pd.read_csv(path)
+        accidents['AccidentWeekDay'] = accidents['AccidentWeekDay'].str[-1].astype(int)
+    else:
+        accidents = make_accidents(61058, np.random.default_rng(0))
+
+    start_time = time.perf_counter()
+    expected = legacy_impute(accidents)
+    legacy_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    result = impute_accident_dates(accidents, seed=42)
+    vectorized_seconds = time.perf_counter() - start_time
+
+    year, month = accidents['AccidentYear'], accidents['AccidentMonth']
+    backwards = (year < year.shift(fill_value=year.iloc[0])) | \
+                ((month < month.shift(fill_value=month.iloc[0])) & (month != 1))
+    # Rows after a random day depend on it, compare the rows up to the first backwards row of their month
+    month_id = ((year != year.shift()) | (month != month.shift()) | backwards).cumsum()
+    random_dependent = backwards.groupby(month_id).cummax()
+    deterministic = ~random_dependent
+    assert (result[deterministic] == expected[deterministic]).all()
+    assert (result.dt.dayofweek + 1 == accidents['AccidentWeekDay']).all()
+    assert (result.dt.month == month).all() and (result.dt.year == year).all()
+    assert result.equals(impute_accident_dates(accidents, seed=42))
+
+    print(f"{len(accidents):,} accidents, {int(backwards.sum())} going back in time, "
+          f"{int(deterministic.sum()):,} deterministic rows identical to the legacy loop")
+    print(f"legacy iterrows loop:  {legacy_seconds * 1000:8.1f} ms")
+    print(f"impute_accident_dates: {vectorized_seconds * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,135 @@
+# Downloads from a local stand-in HTTP server: the legacy sequential requests.get with 1 KiB chunks versus the
+# Downloader (pooled session, large chunks, parallel), plus a re-run (ETag skip) and an interrupted transfer
+# that is resumed with a Range request. The server throttles every connection to --rate MB/s, like a remote host.
+# Run from the project root: python -m benchmarks.downloader_benchmark [--files 4] [--size-mb 16] [--rate 50]
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from modules.downloader import Downloader
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves in-memory files with ETag, Range/If-Range and If-None-Match support."""
+
+    files = {}
+    rate = 50 * 2**20
+    # Paths whose next transfer is cut after this number of bytes
+    cut_after = {}
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get('Range')))
+        content = self.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.md5(content).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', etag) == etag:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+
+        end = min(len(content), start + self.cut_after.pop(self.path, len(content)))
+        block = 256 * 1024
+        for offset in range(start, end, block):
+            self.wfile.write(content[offset:min(offset + block, end)])
+            time.sleep(min(block, end - offset) / self.rate)
+        if end < len(content):
+            # Drop the connection in the middle of the body
+            self.close_connection = True
+            self.connection.shutdown(2)
+
+
+def legacy_download(url, path):
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    with open(path, 'wb') as file:
+        for chunk in response.iter_content(chunk_size=1024):
+            file.write(chunk)
+
+
+def timed(function):
+    start_time = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start_time, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--size-mb', type=float, default=16)
+    parser.add_argument('--rate', type=float, default=50, help="Throughput per connection in MB/s.")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 2**20)
+    StandInHandler.files = {f'/resource_{i}.csv': os.urandom(size) for i in range(args.files)}
+    StandInHandler.rate = args.rate * 2**20
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    total_mb = args.files * size / 2**20
+
+    with tempfile.TemporaryDirectory() as directory:
+        def items(prefix):
+            return [(base_url + name, os.path.join(directory, prefix + name.strip('/')), None)
+                    for name in StandInHandler.files]
+
+        seconds, _ = timed(lambda: [legacy_download(url, path) for url, path, _ in items('legacy_')])
+        print(f"legacy sequential, 1 KiB chunks: {seconds:6.2f} s ({total_mb / seconds:6.1f} MB/s)")
+
+        for workers in [1, 4]:
+            downloader = Downloader(max_workers=workers, progress=False)
+            seconds, results = timed(lambda: downloader.download_many(items(f'pool{workers}_')))
+            assert all(result.status == 'downloaded' for result in results)
+            print(f"Downloader, {workers} worker(s):           {seconds:6.2f} s ({total_mb / seconds:6.1f} MB/s)")
+
+        for url, path, _ in items('pool4_'):
+            with open(path, 'rb') as file:
+                assert file.read() == StandInHandler.files['/' + os.path.basename(path)[len('pool4_'):]]
+
+        seconds, results = timed(lambda: downloader.download_many(items('pool4_')))
+        print(f"re-run, unchanged files:           {seconds:6.2f} s ({[result.status for result in results]})")
+
+        # Cut the first transfer of one file in the middle, the retry continues from the partial file
+        name = next(iter(StandInHandler.files))
+        StandInHandler.cut_after[name] = size // 2
+        StandInHandler.requests_seen.clear()
+        url, path, _ = items('resume_')[0]
+        seconds, result = timed(lambda: downloader.download(url, path))
+        with open(path, 'rb') as file:
+            assert file.read() == StandInHandler.files[name]
+        print(f"interrupted at 50%, resumed:       {seconds:6.2f} s, status {result.status}, "
+              f"{result.bytes_transferred / 2**20:.1f} MB after resuming, requests {StandInHandler.requests_seen}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Latency of the sidebar filters of the Analyse Historic Data page: pandas isin/between masks (legacy) versus
+# the bitmap FilterIndex, uncached and memoized.
+# Run from the project root: python -m benchmarks.filter_index_benchmark [rows]
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules.filter_index import FilterIndex
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+ACCIDENT_TYPES = [f'Accident type {i}' for i in range(11)]
+SEVERITIES = ['Accident with fatalities', 'Accident with severe injuries', 'Accident with light injuries',
+              'Accident with property damage']
+ROAD_TYPES = ['Principal road', 'Minor road', 'Other']
+INVOLVEMENT_COLUMNS = ['AccidentInvolvingPedestrian', 'AccidentInvolvingBicycle', 'AccidentInvolvingMotorcycle']
+FILTER_COLUMNS = ['year', 'month', 'WeekdayDesc', 'hour', 'AccidentTypeDesc', 'AccidentSeverityDesc',
+                  'RoadTypeDesc'] + INVOLVEMENT_COLUMNS
+
+
+def make_historic(rows, rng):
+    df = pd.DataFrame({
+        'year': rng.integers(2011, 2024, size=rows).astype(np.int16),
+        'month': rng.integers(1, 13, size=rows).astype(np.int8),
+        'WeekdayDesc': pd.Categorical(rng.choice(WEEKDAYS, size=rows)),
+        'hour': rng.integers(0, 24, size=rows).astype(np.int8),
+        'AccidentTypeDesc': pd.Categorical(rng.choice(ACCIDENT_TYPES, size=rows)),
+        'AccidentSeverityDesc': pd.Categorical(rng.choice(SEVERITIES, size=rows)),
+        'RoadTypeDesc': pd.Categorical(rng.choice(ROAD_TYPES, size=rows)),
+        'lat': rng.normal(47.3769, 0.012, size=rows),
+        'lon': rng.normal(8.5417, 0.025, size=rows),
+    })
+    for column in INVOLVEMENT_COLUMNS:
+        df[column] = rng.random(rows) < 0.1
+    return df
+
+
+def make_selection(rng):
+    return {
+        'years': sorted(rng.choice(np.arange(2011, 2024), size=rng.integers(1, 4), replace=False).tolist()),
+        'months': sorted(rng.choice(np.arange(1, 13), size=rng.integers(6, 13), replace=False).tolist()),
+        'weekdays': WEEKDAYS[:5],
+        'types': ACCIDENT_TYPES[:3],
+        'severities': SEVERITIES[:2],
+        'road_types': ROAD_TYPES[:2],
+        'hours': (int(rng.integers(0, 8)), int(rng.integers(16, 24))),
+        'involvements': INVOLVEMENT_COLUMNS[:int(rng.integers(0, 2))],
+    }
+
+
+def legacy_filter(df, selection):
+    filtered_df = df[
+        df['year'].isin(selection['years']) &
+        df['month'].isin(selection['months']) &
+        df['WeekdayDesc'].isin(selection['weekdays']) &
+        df['AccidentTypeDesc'].isin(selection['types']) &
+        df['AccidentSeverityDesc'].isin(selection['severities']) &
+        df['RoadTypeDesc'].isin(selection['road_types']) &
+        df['hour'].between(*selection['hours'])
+    ]
+    for column in selection['involvements']:
+        filtered_df = filtered_df[filtered_df[column] == 1]
+    return filtered_df
+
+
+def index_filter(index, selection):
+    return index.filter({
+        'year': selection['years'],
+        'month': selection['months'],
+        'WeekdayDesc': selection['weekdays'],
+        'AccidentTypeDesc': selection['types'],
+        'AccidentSeverityDesc': selection['severities'],
+        'RoadTypeDesc': selection['road_types'],
+        'hour': range(selection['hours'][0], selection['hours'][1] + 1),
+        **{column: [True] for column in selection['involvements']},
+    })
+
+
+def measure(function, selections):
+    start_time = time.perf_counter()
+    results = [function(selection) for selection in selections]
+    return (time.perf_counter() - start_time) / len(selections), results
+
+
+def main(rows=570000):
+    rng = np.random.default_rng(0)
+    df = make_historic(rows, rng)
+    selections = [make_selection(rng) for _ in range(50)]
+
+    start_time = time.perf_counter()
+    index = FilterIndex(df, FILTER_COLUMNS)
+    print(f"{rows:,} rows, index built in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+
+    legacy_seconds, expected = measure(lambda selection: legacy_filter(df, selection), selections)
+    cold_seconds, results = measure(lambda selection: index_filter(index, selection), selections)
+    warm_seconds, _ = measure(lambda selection: index_filter(index, selection), selections)
+    assert all(a.index.equals(b.index) for a, b in zip(expected, results))
+
+    print(f"legacy pandas masks: {legacy_seconds * 1000:6.2f} ms per filter")
+    print(f"FilterIndex, cold:   {cold_seconds * 1000:6.2f} ms per filter")
+    print(f"FilterIndex, memo:   {warm_seconds * 1000:6.2f} ms per filter ({index.hits} hits, {index.misses} misses)")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
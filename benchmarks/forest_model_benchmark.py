@@ -0,0 +1,108 @@
+# Model loading and prediction: the pickled RandomForestClassifier (legacy) versus the flat forest bundle
+# (memory-mapped .npy node arrays and a vectorized predictor). The forest is a stand-in trained on synthetic
+# data with the hyperparameters of the final model of Modeling.ipynb (586 trees, depth 13) and the 99 features
+# of the preprocessor. Every load runs in a fresh process, the reported memory is its resident set size (Linux).
+# The bundle probabilities have to be identical to the sklearn probabilities.
+# Run from the project root: python -m benchmarks.forest_model_benchmark [rows] [trees]
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from benchmarks.historic_data_benchmark import current_rss_mb
+from modules.forest_model import FlatForest, export_model, load_model
+
+FEATURES = 99
+REPEATS = 200
+
+
+def child(path):
+    rss_before = current_rss_mb()
+    start_time = time.perf_counter()
+    model = load_model(path)
+    load_seconds = time.perf_counter() - start_time
+    load_rss_mb = current_rss_mb() - rss_before
+
+    X = np.random.default_rng(1).random((5, FEATURES))
+    start_time = time.perf_counter()
+    model.predict_proba(X)
+    first_seconds = time.perf_counter() - start_time
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'load_rss_mb': load_rss_mb,
+        'first_seconds': first_seconds,
+        'rss_mb': current_rss_mb() - rss_before,
+    }))
+
+
+def measure_load(path, repeats=3):
+    results = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.forest_model_benchmark', '--child', path],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return min(results, key=lambda result: result['load_seconds'])
+
+
+def measure(function, repeats=REPEATS):
+    function()
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start_time) / repeats
+
+
+def main(rows=20000, trees=586):
+    rng = np.random.default_rng(0)
+    X = rng.random((int(rows), FEATURES))
+    y = (X[:, :10].sum(axis=1) + rng.normal(0, 1, len(X)) > 5.5).astype(int)
+    model = RandomForestClassifier(bootstrap=False, max_depth=13, max_features=0.15, min_samples_leaf=7,
+                                   n_estimators=int(trees), random_state=42).fit(X, y)
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'finalized_model.sav')
+        with open(model_path, 'wb') as file:
+            pickle.dump(model, file)
+        start_time = time.perf_counter()
+        bundle = export_model(model_path)
+        export_seconds = time.perf_counter() - start_time
+        bundle_size = sum(os.path.getsize(os.path.join(bundle, name)) for name in os.listdir(bundle))
+
+        forest = FlatForest.load(bundle)
+        X_test = rng.random((5000, FEATURES))
+        assert np.array_equal(forest.predict_proba(X_test), model.predict_proba(X_test))
+
+        # load_model prefers the bundle next to the pickle, hide it to time the pickle
+        os.replace(bundle, bundle + '.hidden')
+        pickle_load = measure_load(model_path)
+        os.replace(bundle + '.hidden', bundle)
+        bundle_load = measure_load(bundle)
+
+        request = X_test[:5]
+        sklearn_request = measure(lambda: model.predict_proba(request), 50)
+        forest_request = measure(lambda: forest.predict_proba(request))
+        sklearn_batch = measure(lambda: model.predict_proba(X_test), 3)
+        forest_batch = measure(lambda: forest.predict_proba(X_test), 3)
+
+        print(f"{len(model.estimators_)} trees, {forest.arrays['children'].shape[0]:,} nodes, "
+              f"probabilities identical to sklearn on {len(X_test):,} rows")
+        print(f"pickle {os.path.getsize(model_path) / 1e6:.1f} MB, bundle {bundle_size / 1e6:.1f} MB "
+              f"(export {export_seconds:.2f} s)")
+        for name, result in (('pickle', pickle_load), ('bundle', bundle_load)):
+            print(f"{name} load: {result['load_seconds'] * 1000:7.1f} ms, +{result['load_rss_mb']:6.1f} MB RSS, "
+                  f"first prediction {result['first_seconds'] * 1000:6.1f} ms, +{result['rss_mb']:6.1f} MB RSS after")
+        print(f"5-row request:   sklearn {sklearn_request * 1000:7.2f} ms, flat forest {forest_request * 1000:7.2f} ms")
+        print(f"5,000-row batch: sklearn {sklearn_batch * 1000:7.1f} ms, flat forest {forest_batch * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2])
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,101 @@
+# Cold start of the Analyse Historic Data page: CSV + translate_columns + convert_lv95_to_wgs84 (legacy)
+# versus loading the page columns from the columnar artifact. Every variant runs in a fresh process, the
+# reported memory is the resident set size of that process (Linux) after the imports and after loading.
+# Run from the project root: python -m benchmarks.historic_data_benchmark [historic_data.csv]
+# Without an argument a synthetic dataset shaped like the merged dataset (~60 columns) is generated.
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as file:
+        line = next(line for line in file if line.startswith('VmRSS'))
+    return int(line.split()[1]) / 1024
+
+
+def make_historic_csv(path, rows, rng):
+    from tests.inputs import make_inputs
+
+    df = make_inputs(rows, rng)
+    df.insert(0, 'AccidentUID', [f'{value:032X}' for value in rng.integers(0, 2**62, size=rows)])
+    df['AccidentSeverityCategory'] = rng.choice(['as1', 'as2', 'as3', 'as4'], size=rows, p=[0.01, 0.09, 0.4, 0.5])
+    df['year'] = rng.integers(2011, 2024, size=rows)
+    df['x'] = rng.uniform(2676000, 2689000, size=rows)
+    df['y'] = rng.uniform(1241000, 1254000, size=rows)
+    df.to_csv(path, index=False)
+
+
+def run_legacy(csv_path):
+    from modules.utils import convert_lv95_to_wgs84, translate_columns
+
+    df = pd.read_csv(csv_path)
+    df = translate_columns(df)
+    return convert_lv95_to_wgs84(df)
+
+
+def run_columnar(dataset_path):
+    from modules.historic_data import load_historic_dataset
+
+    return load_historic_dataset(path=dataset_path)
+
+
+def child(variant, path):
+    import modules.utils  # noqa: F401, imported by both variants
+
+    rss_before = current_rss_mb()
+    start_time = time.perf_counter()
+    df = run_legacy(path) if variant == 'legacy' else run_columnar(path)
+    elapsed = time.perf_counter() - start_time
+    print(json.dumps({
+        'seconds': elapsed,
+        'rss_mb': current_rss_mb(),
+        'load_rss_mb': current_rss_mb() - rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'frame_mb': df.memory_usage(deep=True).sum() / 2**20,
+        'shape': df.shape,
+    }))
+
+
+def measure(variant, path, repeats=3):
+    results = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.historic_data_benchmark', '--child', variant, path],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return min(results, key=lambda result: result['seconds'])
+
+
+def main(csv_path=None):
+    from modules.historic_data import build_historic_dataset
+
+    with tempfile.TemporaryDirectory() as directory:
+        if csv_path is None:
+            csv_path = os.path.join(directory, 'historic_data.csv')
+            make_historic_csv(csv_path, 60000, np.random.default_rng(0))
+        dataset_path = os.path.join(directory, 'historic_data.feather')
+
+        start_time = time.perf_counter()
+        build_historic_dataset(csv_path, dataset_path)
+        print(f"Offline build: {time.perf_counter() - start_time:.2f} s, "
+              f"CSV {os.path.getsize(csv_path) / 2**20:.1f} MB -> artifact {os.path.getsize(dataset_path) / 2**20:.1f} MB")
+
+        for variant, path in [('legacy', csv_path), ('columnar', dataset_path)]:
+            result = measure(variant, path)
+            print(f"{variant:>8}: {result['seconds'] * 1000:7.1f} ms, shape {tuple(result['shape'])}, "
+                  f"frame {result['frame_mb']:6.1f} MB, RSS {result['rss_mb']:6.1f} MB (+{result['load_rss_mb']:.1f} MB "
+                  f"for loading), peak RSS {result['peak_rss_mb']:6.1f} MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,104 @@
+# Render time and HTML payload of the historic accident map: one folium marker per accident and the full
+# point list for the heatmap (legacy) versus server-side grid aggregation (modules/historic_map.py) drawn with
+# folium markers and heatmap.
+# Run from the project root: python -m benchmarks.historic_map_benchmark
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import HeatMap, MarkerCluster
+
+from modules.historic_map import aggregate_accidents, heatmap_points
+
+SEVERITY_COLOR_MAPPING = {
+    'Accident with fatalities': 'red',
+    'Accident with severe injuries': 'orange',
+    'Accident with light injuries': 'yellow',
+    'Accident with property damage': 'blue',
+}
+ZOOM = 12
+
+
+def make_accidents(rows, rng):
+    return pd.DataFrame({
+        'lat': rng.normal(47.3769, 0.012, size=rows),
+        'lon': rng.normal(8.5417, 0.025, size=rows),
+        'AccidentSeverityDesc': pd.Categorical(rng.choice(list(SEVERITY_COLOR_MAPPING), size=rows,
+                                                          p=[0.01, 0.09, 0.4, 0.5])),
+        'AccidentTypeDesc': 'Accident with rear-end collision',
+        'RoadTypeDesc': 'Principal road',
+        'WeekdayDesc': 'Monday',
+        'year': 2023,
+        'month': 6,
+        'hour': 8,
+    })
+
+
+def legacy_map(data):
+    m = folium.Map(location=[47.3778, 8.5405], zoom_start=ZOOM, tiles='CartoDB Positron')
+    marker_cluster = MarkerCluster(name='Accident Markers').add_to(m)
+    for _, row in data.iterrows():
+        severity = row['AccidentSeverityDesc']
+        color = SEVERITY_COLOR_MAPPING.get(severity, 'gray')
+        popup_text = f"""
+            <b>Accident Type:</b> {row['AccidentTypeDesc']}<br>
+            <b>Severity:</b> {severity}<br>
+            <b>Road Type:</b> {row['RoadTypeDesc']}<br>
+            <b>Date:</b> {row['year']}-{row['month']} (Weekday: {row['WeekdayDesc']})<br>
+            <b>Time:</b> {row['hour']}:00<br>
+        """
+        folium.CircleMarker(location=[row['lat'], row['lon']], radius=5, popup=folium.Popup(popup_text, max_width=300),
+                            color=color, fill=True, fill_color=color, fill_opacity=0.7).add_to(marker_cluster)
+    HeatMap(data[['lat', 'lon']].dropna().values.tolist(), radius=10, blur=15, max_zoom=1, name='Heatmap').add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def add_cell_markers(m, cells, color_mapping, name='Accident Clusters'):
+    """One folium marker per cell of aggregate_accidents, sized by its count and colored by its most severe category."""
+    layer = folium.FeatureGroup(name=name).add_to(m)
+    categories = [column for column in cells.columns if column not in ('lat', 'lon', 'count')]
+    breakdown = cells[categories].to_numpy()
+    top_category = np.argmax(breakdown > 0, axis=1)
+    radius = 6 + 4 * np.log10(cells['count'].to_numpy())
+    for i, (lat, lon, count) in enumerate(zip(cells['lat'], cells['lon'], cells['count'])):
+        color = color_mapping.get(categories[top_category[i]], 'gray')
+        lines = ''.join(f"{category}: {n}<br>" for category, n in zip(categories, breakdown[i]) if n)
+        folium.CircleMarker(location=[lat, lon], radius=float(radius[i]),
+                            popup=folium.Popup(f"<b>Accidents:</b> {count}<br>{lines}", max_width=300),
+                            tooltip=f"{count} accidents", color=color, fill=True, fill_color=color,
+                            fill_opacity=0.7).add_to(layer)
+    return layer
+
+
+def add_heatmap(m, data, zoom, name='Heatmap'):
+    return HeatMap(heatmap_points(data, zoom), radius=10, blur=15, max_zoom=1,
+                   gradient={0.2: 'blue', 0.4: 'lime', 0.6: 'yellow', 0.8: 'orange', 1.0: 'red'}, name=name).add_to(m)
+
+
+def aggregated_map(data):
+    m = folium.Map(location=[47.3778, 8.5405], zoom_start=ZOOM, tiles='CartoDB Positron')
+    add_cell_markers(m, aggregate_accidents(data, ZOOM, list(SEVERITY_COLOR_MAPPING)), SEVERITY_COLOR_MAPPING)
+    add_heatmap(m, data, ZOOM)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def measure(build, data):
+    start_time = time.perf_counter()
+    html = build(data).get_root().render()
+    return time.perf_counter() - start_time, len(html.encode())
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for rows in [1000, 10000, 50000]:
+        data = make_accidents(rows, rng)
+        for name, build in [('legacy', legacy_map), ('aggregated', aggregated_map)]:
+            seconds, size = measure(build, data)
+            print(f"{rows:>6} accidents {name:>10}: {seconds * 1000:8.1f} ms, {size / 2**20:6.2f} MB HTML")
+
+
+if __name__ == '__main__':
+    main()
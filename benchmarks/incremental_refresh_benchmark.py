@@ -0,0 +1,148 @@
+# Incremental refresh of the merged accident dataset: a full rebuild of all months through cleaning and the
+# station volume and weather merge (what a rerun of Data Cleaning.ipynb and Data Merging.ipynb recomputes) versus
+# the refresh of one new month with modules.incremental_refresh. Checks that the refresh leaves the earlier months
+# untouched and that the new month matches the full rebuild, and times a refresh without new data.
+# Run from the project root: python -m benchmarks.incremental_refresh_benchmark [accidents per month] [stations]
+# Synthetic sources in the format of the raw data are written to a temporary directory.
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from modules.historic_data import write_historic_dataset
+from modules.incremental_refresh import export_merged_data, load_merged_data, refresh
+from modules.traffic_ingestion import write_traffic_dataset
+from modules.utils import WEATHER_FEATURES
+
+FIRST_YEAR, LAST_YEAR = 2012, 2023
+
+
+def make_accidents(months, per_month, rng):
+    frames = []
+    for month_start in months:
+        days = pd.Timestamp(month_start).days_in_month
+        dates = pd.DatetimeIndex(np.sort(pd.Timestamp(month_start) +
+                                         pd.to_timedelta(rng.integers(0, days, size=per_month), unit='D')))
+        frames.append(pd.DataFrame({
+            'AccidentUID': [f'{i:032X}' for i in rng.integers(0, 2**62, size=per_month)],
+            'AccidentType': rng.choice([f'at{i}' for i in range(10)], size=per_month),
+            'AccidentType_en': 'Accident with rear-end collision',
+            'AccidentSeverityCategory': rng.choice(['as1', 'as2', 'as3', 'as4'], p=[0.01, 0.09, 0.3, 0.6], size=per_month),
+            'AccidentSeverityCategory_en': 'Accident with property damage',
+            'AccidentInvolvingPedestrian': rng.random(per_month) < 0.1,
+            'AccidentInvolvingBicycle': rng.random(per_month) < 0.15,
+            'AccidentInvolvingMotorcycle': rng.random(per_month) < 0.1,
+            'RoadType': rng.choice(['rt432', 'rt433', 'rt439'], size=per_month),
+            'RoadType_en': 'Minor road',
+            'AccidentLocation_CHLV95_E': rng.integers(2676000, 2689000, size=per_month),
+            'AccidentLocation_CHLV95_N': rng.integers(1241000, 1254000, size=per_month),
+            'CantonCode': 'ZH', 'MunicipalityCode': 261,
+            'AccidentYear': dates.year, 'AccidentMonth': dates.month, 'AccidentMonth_en': dates.month_name(),
+            'AccidentWeekDay': [f'aw40{d}' for d in dates.dayofweek + 1], 'AccidentWeekDay_en': dates.day_name(),
+            'AccidentHour': rng.integers(0, 24, size=per_month), 'AccidentHour_text': '',
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_sources(root, start, end, stations, rng):
+    hours = pd.date_range(start, end, freq='h')
+    msid = np.repeat([f'Z{i:03d}M001' for i in range(stations)], len(hours))
+    volume = rng.integers(0, 1500, size=len(msid)).astype('float32')
+    volume[rng.random(len(msid)) < 0.02] = np.nan
+    write_traffic_dataset(pd.DataFrame({
+        'MSID': msid, 'EKoord': np.repeat(2676000 + rng.random(stations) * 13000, len(hours)).astype('float32'),
+        'NKoord': np.repeat(1241000 + rng.random(stations) * 13000, len(hours)).astype('float32'),
+        'MessungDatZeit': np.tile(hours.to_numpy(dtype='datetime64[s]'), stations), 'AnzFahrzeuge': volume,
+    }), os.path.join(root, 'traffic_data'))
+
+    counters = stations // 2
+    for year in range(hours[0].year, hours[-1].year + 1):
+        year_hours = hours[hours.year == year]
+        path = os.path.join(root, f'{year}_verkehrszaehlungen_werte_fussgaenger_velo.csv')
+        pedestrian = pd.DataFrame({
+            'FK_STANDORT': np.repeat(np.arange(counters) + 100, len(year_hours)),
+            'OST': np.repeat(2676000 + rng.integers(0, 13000, counters), len(year_hours)),
+            'NORD': np.repeat(1241000 + rng.integers(0, 13000, counters), len(year_hours)),
+            'DATUM': np.tile(year_hours.strftime('%Y-%m-%dT%H:%M'), counters),
+            **{column: rng.integers(0, 50, size=counters * len(year_hours)) for column in
+               ['VELO_IN', 'VELO_OUT', 'FUSS_IN', 'FUSS_OUT']},
+        })
+        # A new month is appended to the yearly file of its year
+        pedestrian.to_csv(path, mode='a' if os.path.exists(path) else 'w', header=not os.path.exists(path), index=False)
+
+    os.makedirs(os.path.join(root, 'weather_data'), exist_ok=True)
+    for month_start in pd.date_range(start, end, freq='MS'):
+        month_end = month_start + pd.offsets.MonthEnd(0)
+        times = pd.date_range(month_start, month_end + pd.Timedelta(hours=23), freq='h')
+        table = pa.table({'time': pa.array(times.to_numpy(dtype='datetime64[s]')),
+                          **{feature: pa.array(rng.random(len(times)) * 10) for feature in WEATHER_FEATURES}})
+        pq.write_table(table, os.path.join(root, 'weather_data',
+                                           f'{month_start.date().isoformat()}_{month_end.date().isoformat()}.parquet'))
+
+
+def main(per_month=400, stations=60):
+    rng = np.random.default_rng(0)
+    per_month, stations = int(per_month), int(stations)
+    with tempfile.TemporaryDirectory() as root:
+        paths = {
+            'raw_path': os.path.join(root, 'RoadTrafficAccidentLocations.csv'),
+            'traffic_path': os.path.join(root, 'traffic_data'),
+            'pedestrian_pattern': os.path.join(root, '{year}_verkehrszaehlungen_werte_fussgaenger_velo.csv'),
+            'weather_path': os.path.join(root, 'weather_data'),
+        }
+        exports = {'csv_paths': [os.path.join(root, 'merged.csv'), os.path.join(root, 'historic_data.csv')],
+                   'dataset_path': os.path.join(root, 'historic_data.feather'),
+                   'locations_path': os.path.join(root, 'locations.csv')}
+        months = pd.date_range(f'{FIRST_YEAR}-01-01', f'{LAST_YEAR}-12-01', freq='MS')
+        make_accidents(months, per_month, rng).to_csv(paths['raw_path'], index=False)
+        write_sources(root, f'{FIRST_YEAR}-01-01', f'{LAST_YEAR}-12-31 23:00', stations, rng)
+        store, state = os.path.join(root, 'merged_data'), os.path.join(root, 'refresh_state.json')
+
+        start_time = time.perf_counter()
+        refresh(store_path=store, state_path=state, **paths, **exports)
+        full_seconds = time.perf_counter() - start_time
+        before = load_merged_data(store)
+
+        # January of the next year arrives in every source
+        make_accidents([f'{LAST_YEAR + 1}-01-01'], per_month, rng).to_csv(paths['raw_path'], mode='a', header=False,
+                                                                      index=False)
+        write_sources(root, f'{LAST_YEAR + 1}-01-01', f'{LAST_YEAR + 1}-01-31 23:00', stations, rng)
+        start_time = time.perf_counter()
+        refreshed = refresh(store_path=store, state_path=state, **paths, **exports)
+        incremental_seconds = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        assert refresh(store_path=store, state_path=state, **paths, **exports) == []
+        noop_seconds = time.perf_counter() - start_time
+        after = load_merged_data(store)
+        appended = {name: pd.read_csv(path) for name, path in
+                    [('csv', exports['csv_paths'][1]), ('locations', exports['locations_path'])]}
+        start_time = time.perf_counter()
+        export_merged_data(load_merged_data(store, refreshed), refreshed, store, **exports)
+        export_seconds = time.perf_counter() - start_time
+
+        assert refreshed == [f'{LAST_YEAR + 1}-01']
+        pd.testing.assert_frame_equal(after.iloc[:len(before)], before)
+        # The rows appended by the refresh match a rewrite of the files
+        pd.testing.assert_frame_equal(appended['csv'], pd.read_csv(exports['csv_paths'][1]))
+        pd.testing.assert_frame_equal(appended['locations'], pd.read_csv(exports['locations_path']))
+        # The months replaced in the artifact match a rewrite of the artifact
+        rebuilt = write_historic_dataset(after, os.path.join(root, 'rebuilt.feather'))
+        pd.testing.assert_frame_equal(pd.read_feather(exports['dataset_path']), pd.read_feather(rebuilt),
+                                      check_categorical=False, check_dtype=False)
+        rebuilt_store = os.path.join(root, 'rebuilt_data')
+        refresh(store_path=rebuilt_store, state_path=os.path.join(root, 'rebuilt_state.json'), export=False, **paths)
+        pd.testing.assert_frame_equal(load_merged_data(rebuilt_store), after)
+
+    print(f"{len(after):,} accidents in {len(months) + 1} months, {stations} traffic stations")
+    print(f"full rebuild of {len(months)} months:    {full_seconds:6.2f} s")
+    print(f"refresh of one new month:       {incremental_seconds:6.2f} s (rewriting the exported files instead of "
+          f"appending takes {export_seconds:.2f} s)")
+    print(f"refresh without new data:       {noop_seconds:6.2f} s")
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
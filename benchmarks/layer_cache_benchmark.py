@@ -0,0 +1,109 @@
+# Reruns of the Analyse Historic Data page: building and rendering the map from the filtered accidents on every
+# rerun (folium markers and heatmap, legacy) versus the serialized layers of the layer cache. A session switches
+# between a few filter combinations and map types, so most reruns return to a combination seen before.
+# Reports the map time per rerun (build + HTML render, as st_folium does), the hit rate and the cached bytes.
+# Run from the project root: python -m benchmarks.layer_cache_benchmark [accidents] [reruns]
+import sys
+import time
+import warnings
+
+import folium
+import numpy as np
+from folium.plugins import MarkerCluster
+
+from benchmarks.historic_map_benchmark import SEVERITY_COLOR_MAPPING, add_cell_markers, add_heatmap, make_accidents
+from modules.filter_index import FilterIndex
+from modules.historic_map import (GeoJsonPayload, HeatMapPayload, aggregate_accidents, cell_payload, heatmap_payload,
+                                  marker_payload)
+from modules.layer_cache import LayerCache
+
+ZOOM = 12
+MARKER_THRESHOLD = 2000
+MAP_TYPES = ["Markers", "Heatmap", "Both"]
+
+
+def legacy_map(data, map_type):
+    m = folium.Map(location=[47.3778, 8.5405], zoom_start=ZOOM, tiles='CartoDB Positron')
+    if map_type in ["Markers", "Both"] and len(data) <= MARKER_THRESHOLD:
+        marker_cluster = MarkerCluster(name='Accident Markers').add_to(m)
+        for _, row in data.iterrows():
+            color = SEVERITY_COLOR_MAPPING.get(row['AccidentSeverityDesc'], 'gray')
+            popup_text = f"""
+                <b>Accident Type:</b> {row['AccidentTypeDesc']}<br>
+                <b>Severity:</b> {row['AccidentSeverityDesc']}<br>
+                <b>Road Type:</b> {row['RoadTypeDesc']}<br>
+                <b>Date:</b> {row['year']}-{row['month']} (Weekday: {row['WeekdayDesc']})<br>
+                <b>Time:</b> {row['hour']}:00<br>
+            """
+            folium.CircleMarker(location=[row['lat'], row['lon']], radius=5,
+                                popup=folium.Popup(popup_text, max_width=300), color=color, fill=True,
+                                fill_color=color, fill_opacity=0.7).add_to(marker_cluster)
+    elif map_type in ["Markers", "Both"]:
+        add_cell_markers(m, aggregate_accidents(data, ZOOM, list(SEVERITY_COLOR_MAPPING)), SEVERITY_COLOR_MAPPING)
+    if map_type in ["Heatmap", "Both"]:
+        add_heatmap(m, data, ZOOM)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def cached_map(data, signature, map_type, layer_cache):
+    m = folium.Map(location=[47.3778, 8.5405], zoom_start=ZOOM, tiles='CartoDB Positron')
+    if map_type in ["Markers", "Both"] and len(data) <= MARKER_THRESHOLD:
+        payload = layer_cache.get_or_render((signature, 'markers'),
+                                            lambda: marker_payload(data, SEVERITY_COLOR_MAPPING))
+        GeoJsonPayload(payload, 'Accident Markers', cluster=True).add_to(m)
+    elif map_type in ["Markers", "Both"]:
+        payload = layer_cache.get_or_render(
+            (signature, 'cells', ZOOM),
+            lambda: cell_payload(aggregate_accidents(data, ZOOM, list(SEVERITY_COLOR_MAPPING)), SEVERITY_COLOR_MAPPING))
+        GeoJsonPayload(payload, 'Accident Clusters').add_to(m)
+    if map_type in ["Heatmap", "Both"]:
+        payload = layer_cache.get_or_render((signature, 'heatmap', ZOOM), lambda: heatmap_payload(data, ZOOM))
+        HeatMapPayload(payload).add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+def main(accidents=60000, reruns=60):
+    warnings.filterwarnings('ignore', message='CartoDB tiles')
+    rng = np.random.default_rng(0)
+    df = make_accidents(int(accidents), rng)
+    df['year'] = rng.integers(2012, 2024, size=len(df))
+    df['AccidentTypeDesc'] = rng.choice(['Accident with rear-end collision', 'Accident involving pedestrian(s)',
+                                         'Accident when parking'], size=len(df))
+    index = FilterIndex(df, ['year', 'AccidentTypeDesc', 'AccidentSeverityDesc'])
+    views = [
+        {'year': [2023]},
+        {'year': [2023], 'AccidentSeverityDesc': ['Accident with fatalities', 'Accident with severe injuries']},
+        {'year': [2022, 2023], 'AccidentTypeDesc': ['Accident involving pedestrian(s)']},
+        {'year': None},
+    ]
+    session = [(views[i], MAP_TYPES[j]) for i, j in zip(rng.integers(0, len(views), int(reruns)),
+                                                        rng.integers(0, len(MAP_TYPES), int(reruns)))]
+
+    layer_cache = LayerCache()
+    # The default view is precomputed at startup, like the page does
+    for map_type in MAP_TYPES:
+        cached_map(index.filter(views[0]), FilterIndex.signature(views[0]), map_type, layer_cache)
+    legacy_seconds, cached_seconds = [], []
+    for filters, map_type in session:
+        data = index.filter(filters)
+        start_time = time.perf_counter()
+        legacy_html = legacy_map(data, map_type).get_root().render()
+        legacy_seconds.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        cached_html = cached_map(data, FilterIndex.signature(filters), map_type, layer_cache).get_root().render()
+        cached_seconds.append(time.perf_counter() - start_time)
+    stats = layer_cache.stats()
+
+    print(f"{len(df):,} accidents, {len(session)} reruns over {len(views)} filter combinations x {len(MAP_TYPES)} map types")
+    print(f"legacy map per rerun:       {np.mean(legacy_seconds) * 1000:8.1f} ms (p95 {np.percentile(legacy_seconds, 95) * 1000:.1f} ms), "
+          f"{len(legacy_html.encode()) / 2**20:.2f} MB last HTML")
+    print(f"layer cache map per rerun:  {np.mean(cached_seconds) * 1000:8.1f} ms (p95 {np.percentile(cached_seconds, 95) * 1000:.1f} ms), "
+          f"{len(cached_html.encode()) / 2**20:.2f} MB last HTML")
+    print(f"layer cache: {stats['hit_rate']:.0%} hits, {stats['layers']} layers, {stats['bytes'] / 2**20:.1f} MB, "
+          f"{stats['mean_render_seconds'] * 1000:.1f} ms per layer render")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
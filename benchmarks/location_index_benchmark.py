@@ -0,0 +1,66 @@
+# Benchmark of the KD-tree location index against the full-scan nearest location lookup.
+# Run from the project root: python -m benchmarks.location_index_benchmark
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules.location_index import LocationIndex
+
+# Rough LV95 bounding box of the city of Zürich
+X_RANGE = (2676000, 2690000)
+Y_RANGE = (1241000, 1254000)
+
+
+def make_locations(size, rng):
+    return pd.DataFrame({
+        'x': rng.integers(*X_RANGE, size=size),
+        'y': rng.integers(*Y_RANGE, size=size),
+        'RoadType': rng.choice(['rt432', 'rt433', 'rt439'], size=size),
+    })
+
+
+def full_scan(locations, x, y, k):
+    distances = (locations['x'] - x) ** 2 + (locations['y'] - y) ** 2
+    return distances.nsmallest(k).index.to_numpy()
+
+
+def benchmark(size, k=5, queries=200, batch=10000, seed=42):
+    rng = np.random.default_rng(seed)
+    locations = make_locations(size, rng)
+    query_x = rng.uniform(*X_RANGE, size=max(queries, batch))
+    query_y = rng.uniform(*Y_RANGE, size=max(queries, batch))
+
+    start = time.perf_counter()
+    index = LocationIndex(locations)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(queries):
+        index.query_xy(query_x[i], query_y[i], k)
+    single_time = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    index.query_xy(query_x[:batch], query_y[:batch], k)
+    batch_time = (time.perf_counter() - start) / batch
+
+    scan_queries = max(queries // (size // 50000 + 1), 5)
+    start = time.perf_counter()
+    for i in range(scan_queries):
+        expected = full_scan(locations, query_x[i], query_y[i], k)
+        if not np.array_equal(expected, index.query_xy(query_x[i], query_y[i], k)[0]):
+            raise AssertionError(f"Index result differs from the full scan for query {i}")
+    scan_time = (time.perf_counter() - start) / scan_queries
+
+    print(f"{size:>10,} | {build_time * 1e3:>9.1f} ms | {single_time * 1e6:>9.1f} us | "
+          f"{batch_time * 1e6:>9.2f} us | {scan_time * 1e3:>9.2f} ms")
+
+
+def main():
+    print(f"{'locations':>10} | {'build':>12} | {'per query':>12} | {'batched':>12} | {'full scan':>12}")
+    for size in [57_580, 500_000, 5_000_000]:
+        benchmark(size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Scaling benchmark of the multi-process scorer at 1, 2, 4 and 8 workers: scoring of assembled partitions, and
+# scoring while the caller assembles the next partitions (weather and volume lookups), as the batch scorer does.
+# Run from the project root: python -m benchmarks.parallel_scoring_benchmark [model path] [rows]
+# Without a model at the path a stand-in forest of the size of the notebook model is fitted and exported.
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from config import MODEL_PATH
+from modules.forest_model import export_model
+from modules.parallel_scoring import ParallelScorer
+from modules.preprocessing import get_preprocessing_service
+from modules.scoring import load_model, predict_severity
+from tests.inputs import make_inputs
+
+PARTITION_SIZE = 10_000
+
+
+def fit_stand_in(directory, rng, trees=586):
+    X = get_preprocessing_service().transform_matrix(make_inputs(20_000, rng))
+    model = RandomForestClassifier(bootstrap=False, max_depth=13, max_features=0.15, min_samples_leaf=7,
+                                   n_estimators=trees, random_state=42).fit(X, rng.integers(0, 2, X.shape[0]))
+    model_path = os.path.join(directory, 'finalized_model.sav')
+    with open(model_path, 'wb') as file:
+        pickle.dump(model, file)
+    export_model(model_path)
+    return model_path
+
+
+def run(model_path, rows):
+    partitions = [make_inputs(PARTITION_SIZE, np.random.default_rng(i)) for i in range(rows // PARTITION_SIZE)]
+    print(f"Scoring {rows:,} rows in partitions of {PARTITION_SIZE:,} on {os.cpu_count()} core(s)")
+
+    model = load_model(model_path)
+    start = time.perf_counter()
+    expected = np.concatenate([predict_severity(partition, model)[0] for partition in partitions])
+    baseline = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(len(partitions)):
+        predict_severity(make_inputs(PARTITION_SIZE, np.random.default_rng(i)), model)
+    assembled_baseline = time.perf_counter() - start
+    print(f"{'workers':>10} | {'scoring':>7}   | {'rows/s':>9}        | speed-up | with assembly | speed-up")
+    print(f"{'in process':>10} | {baseline:>7.2f} s | {rows / baseline:>9,.0f} rows/s | {1:>7.2f}x | "
+          f"{assembled_baseline:>11.2f} s | {1:>7.2f}x")
+
+    for workers in [1, 2, 4, 8]:
+        with ParallelScorer(workers, model_path=model_path) as scorer:
+            # Warm up the workers so loading the model is not part of the measurement
+            list(scorer.score((partition, None) for partition in partitions[:workers]))
+            start = time.perf_counter()
+            results = [probabilities for _, probabilities, _ in scorer.score((p, None) for p in partitions)]
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            assembled = [probabilities for _, probabilities, _ in scorer.score(
+                (make_inputs(PARTITION_SIZE, np.random.default_rng(i)), None) for i in range(len(partitions)))]
+            assembled_elapsed = time.perf_counter() - start
+        for result in (results, assembled):
+            if not np.array_equal(np.concatenate(result), expected):
+                raise AssertionError(f"Results with {workers} workers differ from the in-process results")
+        print(f"{workers:>10} | {elapsed:>7.2f} s | {rows / elapsed:>9,.0f} rows/s | {baseline / elapsed:>7.2f}x | "
+              f"{assembled_elapsed:>11.2f} s | {assembled_baseline / assembled_elapsed:>7.2f}x")
+
+
+def main():
+    model_path = sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    if os.path.exists(model_path):
+        run(model_path, rows)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"No model at {model_path}, fitting a stand-in forest")
+        run(fit_stand_in(directory, np.random.default_rng(0)), rows)
+
+
+if __name__ == '__main__':
+    main()
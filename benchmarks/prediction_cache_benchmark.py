@@ -0,0 +1,81 @@
+# Prediction page requests with and without the prediction cache. A stream of requests clustered around a few
+# hotspots (clicks within ~30 m, a handful of accident types and hours) is answered by the local part of the
+# prediction (input frame, preprocessing, a stand-in forest); the weather request of a miss is not included,
+# so the real saving per hit is larger. Reports the hit rate, the hit and miss latency and the hit latency
+# from the SQLite store after a restart, and checks that touching the model file invalidates the cache.
+# Run from the project root: python -m benchmarks.prediction_cache_benchmark [requests]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from tests.inputs import make_inputs
+from modules.prediction_cache import PredictionCache
+from modules.preprocessing import get_preprocessing_service
+
+
+def make_requests(count, rng):
+    hotspots = np.column_stack([rng.uniform(47.36, 47.39, 20), rng.uniform(8.48, 8.60, 20)])
+    spots = hotspots[rng.integers(0, len(hotspots), count)] + rng.normal(0, 0.0002, (count, 2))
+    hours = pd.Timestamp('2024-06-14') + pd.to_timedelta(rng.choice([8, 12, 17, 18], count), unit='h') \
+        + pd.to_timedelta(rng.integers(0, 60, count), unit='min')
+    return [dict(lat=lat, lon=lon, when=when, accident_type=accident_type, count=count)
+            for (lat, lon), when, accident_type, count in
+            zip(spots, hours, rng.choice(['at0', 'at2', 'at8'], count), rng.choice([1, 1, 1, 5], count))]
+
+
+def main(requests=2000):
+    rng = np.random.default_rng(0)
+    service = get_preprocessing_service()
+    X = service.transform(make_inputs(2000, rng))
+    model = RandomForestClassifier(n_estimators=100, max_depth=13, random_state=42).fit(X, rng.integers(0, 2, len(X)))
+    stream = make_requests(int(requests), rng)
+
+    def compute(request):
+        df = make_inputs(request['count'], np.random.default_rng(0))
+        return {'probabilities': model.predict_proba(service.transform(df))[:, 1]}
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, 'finalized_model.sav')
+        with open(model_path, 'w') as file:
+            file.write('model')
+        cache = PredictionCache([model_path], path=os.path.join(directory, 'predictions.sqlite'))
+
+        start_time = time.perf_counter()
+        for request in stream[:50]:
+            compute(request)
+        uncached_seconds = (time.perf_counter() - start_time) / 50
+
+        hit_seconds, miss_seconds = [], []
+        for request in stream:
+            signature = cache.signature(request['lat'], request['lon'], request['when'],
+                                        accident_type=request['accident_type'], count=request['count'])
+            start_time = time.perf_counter()
+            _, cached = cache.get_or_compute(signature, lambda: compute(request))
+            (hit_seconds if cached else miss_seconds).append(time.perf_counter() - start_time)
+        stats = cache.stats()
+
+        restarted = PredictionCache([model_path], path=cache.path)
+        start_time = time.perf_counter()
+        assert restarted.get(signature) is not None
+        restart_seconds = time.perf_counter() - start_time
+
+        time.sleep(0.01)
+        with open(model_path, 'w') as file:
+            file.write('retrained model')
+        assert cache.get(signature) is None and restarted.get(signature) is None
+
+    print(f"{len(stream):,} requests, {stats['misses']} distinct signatures, hit rate {stats['hit_rate']:.1%}")
+    print(f"without cache:        {uncached_seconds * 1000:8.2f} ms per request (without the weather request)")
+    print(f"cache miss:           {np.mean(miss_seconds) * 1000:8.2f} ms per request")
+    print(f"cache hit:            {np.mean(hit_seconds) * 1e6:8.1f} us per request")
+    print(f"hit after a restart:  {restart_seconds * 1e6:8.1f} us (SQLite)")
+    print("changing the model file invalidates memory and SQLite entries")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
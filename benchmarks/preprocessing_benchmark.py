@@ -0,0 +1,46 @@
+# Timing breakdown of the preprocessing: loading preprocessor.pkl versus transforming model inputs.
+# Run from the project root: python -m benchmarks.preprocessing_benchmark
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import load
+
+from config import PREPROCESSOR_PATH
+from modules.preprocessing import PreprocessingService
+from tests.inputs import make_inputs
+
+def reload_and_transform(df, feature_names):
+    """The former utils.transform: unpickle the preprocessor on every call and wrap the result in a DataFrame."""
+    preprocessor = load(PREPROCESSOR_PATH)
+    transformed = preprocessor.transform(df.drop(columns=['dateTime']))
+    return pd.DataFrame(transformed, columns=feature_names, index=df.index)
+
+
+def measure(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start) / repeats * 1e3, result
+
+
+def main():
+    service = PreprocessingService()
+    print(f"First load of preprocessor.pkl: {service.load_time * 1e3:.1f} ms (includes importing scikit-learn)")
+    warm_load_time, _ = measure(lambda: load(PREPROCESSOR_PATH), 20)
+    print(f"Warm reload of preprocessor.pkl: {warm_load_time:.2f} ms")
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} | {'reload per call':>15} | {'transform_many':>14} | {'as DataFrame':>12}")
+    for rows in [1, 50, 10_000, 100_000]:
+        df = make_inputs(rows, rng)
+        repeats = 20 if rows <= 10_000 else 3
+        reload_time, expected = measure(lambda: reload_and_transform(df, service.feature_names), repeats)
+        matrix_time, _ = measure(lambda: service.transform_many(df), repeats)
+        frame_time, result = measure(lambda: service.transform(df, as_frame=True), repeats)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{rows:>8,} | {reload_time:>12.2f} ms | {matrix_time:>11.2f} ms | {frame_time:>9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# LV95 -> WGS84 projection: the former convert_lv95_to_wgs84 (new Transformer on every call, whole arrays at
+# once, columns written into the input frame) versus modules.projection (cached transformer, in-place
+# transform of one float64 copy in chunks). Reports time and peak traced memory from 10k to 10M points,
+# checks that the results are identical and the WGS84 -> LV95 round trip error, and times a single point.
+# Run from the project root: python -m benchmarks.projection_benchmark [largest]
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from modules.projection import add_wgs84_columns, get_transformer, LV95, WGS84, wgs84_to_lv95
+
+
+def legacy_convert(df):
+    transformer = Transformer.from_crs("EPSG:2056", "EPSG:4326", always_xy=True)
+    df['lon'], df['lat'] = transformer.transform(df['x'].values, df['y'].values)
+    return df
+
+
+def measure(function, df):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function(df)
+    elapsed = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main(largest=10_000_000):
+    rng = np.random.default_rng(0)
+    get_transformer(LV95, WGS84)
+    print(f"{'points':>12} {'legacy':>10} {'peak':>9} {'new':>10} {'peak':>9} {'round trip error':>17}")
+    size = 10_000
+    while size <= int(largest):
+        df = pd.DataFrame({'x': rng.uniform(2676000, 2689000, size), 'y': rng.uniform(1241000, 1254000, size)})
+        expected, legacy_seconds, legacy_peak = measure(legacy_convert, df.copy())
+        result, new_seconds, new_peak = measure(add_wgs84_columns, df)
+        assert np.array_equal(result['lon'], expected['lon']) and np.array_equal(result['lat'], expected['lat'])
+        assert 'lon' not in df
+
+        x, y = wgs84_to_lv95(result['lon'].to_numpy(), result['lat'].to_numpy())
+        error = max(np.abs(x - df['x'].to_numpy()).max(), np.abs(y - df['y'].to_numpy()).max())
+        print(f"{size:>12,} {legacy_seconds * 1000:8.1f}ms {legacy_peak:7.1f}MB "
+              f"{new_seconds * 1000:8.1f}ms {new_peak:7.1f}MB {error * 1000:14.2f} mm")
+        size *= 10
+
+    # A clicked point, as projected per request by the prediction page
+    repeats = 200
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        Transformer.from_crs("EPSG:4326", "EPSG:2056", always_xy=True).transform(8.54, 47.37)
+    legacy_seconds = (time.perf_counter() - start_time) / repeats
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        wgs84_to_lv95(8.54, 47.37)
+    new_seconds = (time.perf_counter() - start_time) / repeats
+    print(f"single WGS84 point: new transformer {legacy_seconds * 1e6:.0f} us, cached {new_seconds * 1e6:.0f} us")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
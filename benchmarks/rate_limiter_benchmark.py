@@ -0,0 +1,76 @@
+# Benchmark of the per-call overhead of the rate limiter compared to the former JSON file request tracker.
+# Run from the project root: python -m benchmarks.rate_limiter_benchmark
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from modules.rate_limiter import RateLimiter
+
+LIMITS = {"daily": (10 ** 9, 86400), "hourly": (10 ** 9, 3600), "minutely": (10 ** 9, 60)}
+
+
+def json_tracker_call(path):
+    """The former tracker: check_tracker and update_tracker each load (and possibly rewrite) the JSON file."""
+    def get_tracker_data():
+        current = {
+            "daily": {"date": date.today().isoformat(), "requests": 0},
+            "hourly": {"datetime": datetime.now().strftime("%Y-%m-%d %H"), "requests": 0},
+            "minutely": {"datetime": datetime.now().strftime("%Y-%m-%d %H:%M"), "requests": 0},
+        }
+        if os.path.exists(path):
+            with open(path) as file:
+                data = json.load(file)
+        else:
+            data = current
+        changed = False
+        for name, key in [("daily", "date"), ("hourly", "datetime"), ("minutely", "datetime")]:
+            if data[name][key] != current[name][key]:
+                data[name] = current[name]
+                changed = True
+        if changed:
+            with open(path, "w") as file:
+                json.dump(data, file)
+        return data
+
+    data = get_tracker_data()
+    allowed = data["daily"]["requests"] < 10 ** 9
+    data = get_tracker_data()
+    for name in data:
+        data[name]["requests"] += 1
+    with open(path, "w") as file:
+        json.dump(data, file)
+    return allowed
+
+
+def measure(label, call, calls=2000):
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / calls * 1e6:>9.1f} us per call")
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    measure("JSON tracker (before)", lambda: json_tracker_call(os.path.join(directory, "tracker.json")))
+
+    shared = RateLimiter(LIMITS, path=os.path.join(directory, "rate_limit.sqlite"))
+    measure("SQLite token bucket (after)", shared.acquire)
+
+    in_memory = RateLimiter(LIMITS)
+    measure("In-memory token bucket", in_memory.acquire)
+
+    # Contention: 8 threads sharing the SQLite store
+    calls = 4000
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: shared.acquire(), range(calls)))
+    elapsed = time.perf_counter() - start
+    print(f"{'SQLite token bucket, 8 threads':<34} {elapsed / calls * 1e6:>9.1f} us per call")
+
+
+if __name__ == '__main__':
+    main()
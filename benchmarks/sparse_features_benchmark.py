@@ -0,0 +1,137 @@
+# Sparse feature matrices: the dense path of Data Processing.ipynb (StandardScaler, densified into a float64
+# DataFrame and written to X_train.csv/X_test.csv, or to the dense float32 .npz) versus the sparse path (the
+# ColumnTransformer returns CSR, saved with save_training_data and fed to the models as is). Reports the size of
+# the training matrices on disk and in memory, their load time, the fit of a forest from dense and CSR rows and
+# the prediction from a DataFrame versus CSR, and checks that the forest predicts the same from CSR and dense rows.
+# Run from the project root: python -m benchmarks.sparse_features_benchmark [rows] [trees]
+# The model inputs are synthetic, with the dry hours and the hours without snow of the Zurich weather.
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from tests.inputs import make_inputs
+from modules.forest_model import FlatForest
+from modules.preprocessing import get_preprocessing_service
+from modules.training import dense_rows, load_training_data, save_training_data
+
+# Share of hours without precipitation, snowfall and snow cover
+ZERO_SHARES = {'precipitation': 0.88, 'snowfall': 0.98, 'snow_depth': 0.95}
+
+
+def make_accidents(rows, rng):
+    df = make_inputs(rows, rng)
+    for column in df.columns:
+        feature = column.rsplit('_period_', 1)[0]
+        if feature in ZERO_SHARES:
+            df[column] = np.where(rng.random(rows) < ZERO_SHARES[feature], 0.0, rng.exponential(1.0, rows))
+    logit = 0.8 * (df['AccidentType'] == 'at8') + 0.5 * df['AccidentInvolvingMotorcycle'] \
+        + 0.3 * df['precipitation_period_0'] - 1.0
+    return df, (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype(int)
+
+
+def make_preprocessor(features, sparse):
+    numerical = [name for name in features if '_period_' in name]
+    categorical = [name for name in features if name not in numerical]
+    return ColumnTransformer(
+        transformers=[('num', Pipeline([('scaler', StandardScaler(with_mean=not sparse))]), numerical),
+                      ('cat', Pipeline([('onehot', OneHotEncoder(handle_unknown='ignore'))]), categorical)],
+        sparse_threshold=1.0 if sparse else 0.3)
+
+
+def measure(func, repeats=1):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start_time) / repeats, result
+
+
+def main(rows=40000, trees=30):
+    rows, trees = int(rows), int(trees)
+    rng = np.random.default_rng(0)
+    service = get_preprocessing_service()
+    df, y = make_accidents(rows, rng)
+    train_rows = int(rows * 0.8)
+    inputs = df[service.input_features]
+    train, test = inputs.iloc[:train_rows], inputs.iloc[train_rows:]
+
+    dense_preprocessor = make_preprocessor(service.input_features, sparse=False).fit(train)
+    sparse_preprocessor = make_preprocessor(service.input_features, sparse=True).fit(train)
+    feature_names = list(dense_preprocessor.get_feature_names_out())
+    X_dense = pd.DataFrame(dense_preprocessor.transform(train), columns=feature_names)
+    X_dense_test = pd.DataFrame(dense_preprocessor.transform(test), columns=feature_names)
+    X_sparse, X_sparse_test = sparse_preprocessor.transform(train), sparse_preprocessor.transform(test)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {name: os.path.join(directory, name) for name in
+                 ('X_train.csv', 'X_test.csv', 'dense.npz', 'sparse.npz', 'uncompressed.npz')}
+        X_dense.to_csv(paths['X_train.csv'], index=False)
+        X_dense_test.to_csv(paths['X_test.csv'], index=False)
+        np.savez(paths['dense.npz'], X_train=X_dense.to_numpy('float32'), X_test=X_dense_test.to_numpy('float32'),
+                 y_train=y[:train_rows].astype('int8'), y_test=y[train_rows:].astype('int8'))
+        save_training_data(X_sparse, X_sparse_test, y[:train_rows], y[train_rows:], feature_names,
+                           paths['sparse.npz'])
+        with np.load(paths['sparse.npz']) as arrays:
+            np.savez(paths['uncompressed.npz'], **arrays)
+        disk = {name: os.path.getsize(paths[f'{name}.npz']) for name in ('dense', 'sparse', 'uncompressed')}
+        disk['csv'] = os.path.getsize(paths['X_train.csv']) + os.path.getsize(paths['X_test.csv'])
+        csv_seconds, _ = measure(lambda: (pd.read_csv(paths['X_train.csv']), pd.read_csv(paths['X_test.csv'])))
+        dense_seconds, _ = measure(lambda: dict(np.load(paths['dense.npz'])))
+        sparse_seconds, data = measure(lambda: load_training_data(paths['sparse.npz']))
+
+    X_csr, y_train = data['X_train'], data['y_train']
+    memory = {'frame': X_dense.memory_usage(index=False).sum(), 'dense': X_dense.shape[0] * X_dense.shape[1] * 4,
+              'sparse': X_csr.data.nbytes + X_csr.indices.nbytes + X_csr.indptr.nbytes}
+
+    params = dict(n_estimators=trees, max_features=0.3, min_samples_leaf=5, random_state=42)
+    dense_fit_seconds, dense_model = measure(
+        lambda: RandomForestClassifier(**params).fit(X_dense.to_numpy('float32'), y_train))
+    csr_fit_seconds, csr_model = measure(lambda: RandomForestClassifier(**params).fit(X_csr, y_train))
+    rows_fit_seconds, model = measure(lambda: RandomForestClassifier(**params).fit(dense_rows(X_csr), y_train))
+    forest = FlatForest.from_sklearn(model)
+
+    # Inference: the former utils.transform (dense DataFrame) versus the CSR matrix, per request and per batch
+    timings = {}
+    for count in (1, 1000):
+        batch = test.iloc[:count]
+        timings[count] = [
+            measure(lambda: model.predict_proba(pd.DataFrame(dense_preprocessor.transform(batch),
+                                                             columns=feature_names).to_numpy()), 10)[0],
+            measure(lambda: model.predict_proba(sparse_preprocessor.transform(batch)), 10)[0],
+            measure(lambda: forest.predict_proba(dense_preprocessor.transform(batch)), 10)[0],
+            measure(lambda: forest.predict_proba(sparse_preprocessor.transform(batch)), 10)[0],
+        ]
+    dense_auc = roc_auc_score(data['y_test'], dense_model.predict_proba(X_dense_test.to_numpy('float32'))[:, 1])
+    csr_probabilities = csr_model.predict_proba(data['X_test'])[:, 1]
+    probabilities = forest.predict_proba(data['X_test'])[:, 1]
+    assert np.array_equal(probabilities, model.predict_proba(data['X_test'])[:, 1])
+    assert np.array_equal(csr_probabilities, probabilities)
+
+    print(f"{rows:,} accidents x {len(feature_names)} features, {X_csr.nnz / np.prod(X_csr.shape):.0%} non-zero "
+          f"in the sparse training matrix")
+    print(f"on disk (X_train + X_test):  CSV {disk['csv'] / 2**20:6.2f} MB, dense npz {disk['dense'] / 2**20:6.2f} MB, "
+          f"sparse npz {disk['sparse'] / 2**20:6.2f} MB ({disk['csv'] / disk['sparse']:.1f}x / "
+          f"{disk['dense'] / disk['sparse']:.1f}x smaller, {disk['uncompressed'] / 2**20:.2f} MB uncompressed)")
+    print(f"load time:                   CSV {csv_seconds:6.2f} s,  dense npz {dense_seconds:6.2f} s,  "
+          f"sparse npz {sparse_seconds:6.2f} s")
+    print(f"X_train in memory:           float64 DataFrame {memory['frame'] / 2**20:6.2f} MB, float32 "
+          f"{memory['dense'] / 2**20:6.2f} MB, CSR {memory['sparse'] / 2**20:6.2f} MB "
+          f"({memory['frame'] / memory['sparse']:.1f}x / {memory['dense'] / memory['sparse']:.1f}x smaller)")
+    print(f"fit of {trees} trees:            dense {dense_fit_seconds:6.2f} s, CSR {csr_fit_seconds:6.2f} s, "
+          f"CSR densified per fit {rows_fit_seconds:6.2f} s; test ROC AUC dense path {dense_auc:.4f}, "
+          f"sparse path {roc_auc_score(data['y_test'], probabilities):.4f}")
+    for count, (frame, csr, flat_dense, flat_csr) in timings.items():
+        print(f"predict {count:>5} row(s):        sklearn DataFrame {frame * 1e3:7.1f} ms, CSR {csr * 1e3:7.1f} ms; "
+              f"flat forest dense {flat_dense * 1e3:7.1f} ms, CSR {flat_csr * 1e3:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,78 @@
+# Inference volume features: the city-wide average table (assign_average_volume) versus the per-station
+# (month, weekday, hour) store, which fills every station slot from the stations closest to the location.
+# Reports build time, artifact size and load time, and the per-request latency of a prediction as the
+# prediction page makes it (5 rows). The store result is checked against a brute-force pandas computation.
+# Run from the project root: python -m benchmarks.station_store_benchmark
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.station_volume_benchmark import make_data
+from modules.station_volume import StationVolumeStore
+from modules.utils import assign_average_volume, build_volume_table
+
+REPEATS = 2000
+
+
+def brute_force(volume, x, y, when, number_of_stations):
+    """Average of the closest stations that measured in the month, weekday and hour of `when`."""
+    times = pd.to_datetime(volume['dateTime'])
+    slot = volume[(times.dt.month == when.month) & (times.dt.dayofweek == when.dayofweek) &
+                  (times.dt.hour == when.hour)]
+    means = slot.groupby(['ID', 'x', 'y'])['volume'].mean().reset_index()
+    means['distance'] = np.hypot(means['x'] - x, means['y'] - y)
+    return means.nsmallest(number_of_stations, 'distance')['volume'].to_numpy()
+
+
+def measure(function):
+    function()
+    start_time = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start_time) / REPEATS
+
+
+def main():
+    rng = np.random.default_rng(0)
+    _, traffic = make_data(1, 200, 4, rng)
+    _, pedestrian = make_data(1, 150, 4, rng)
+
+    start_time = time.perf_counter()
+    store = StationVolumeStore.build(traffic, pedestrian)
+    build_seconds = time.perf_counter() - start_time
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'station_volume.npz')
+        store.save(path)
+        size = os.path.getsize(path)
+        start_time = time.perf_counter()
+        store = StationVolumeStore.load(path)
+        load_seconds = time.perf_counter() - start_time
+
+    when = pd.Timestamp('2024-06-14 17:00')
+    x, y = 2678000 + rng.random(5) * 10000, 1242000 + rng.random(5) * 10000
+    df = pd.DataFrame({'dateTime': [when] * 5, 'month': when.month, 'weekday': when.isoweekday(), 'hour': when.hour})
+
+    result = store.assign(df, x, y, 3, 2)
+    for i in range(len(df)):
+        for name, volume in (('traffic', traffic), ('pedestrian', pedestrian)):
+            expected = brute_force(volume, x[i], y[i], when, 3)
+            got = result.loc[i, [f'{name}_volume_{s}_period_0' for s in range(3)]].to_numpy(dtype='float64')
+            assert np.allclose(got, expected, rtol=1e-6)
+
+    table = build_volume_table(pd.read_csv('data/inference/average_volume.csv'))
+    average_seconds = measure(lambda: assign_average_volume(df, table, 3, 2))
+    lookup_seconds = measure(lambda: store.profiles['traffic'].closest(x, y, df['dateTime'], 3, 2))
+    assign_seconds = measure(lambda: store.assign(df, x, y, 3, 2))
+
+    print(f"{len(traffic) + len(pedestrian):,} volume rows of 350 stations, matches the brute-force averages")
+    print(f"store build {build_seconds:.2f} s, {size / 1e6:.2f} MB .npz, load {load_seconds * 1000:.1f} ms")
+    print(f"assign_average_volume (city-wide):     {average_seconds * 1e6:7.0f} us per request")
+    print(f"station lookup (5 points, 2 periods):  {lookup_seconds * 1e6:7.0f} us per request")
+    print(f"StationVolumeStore.assign:             {assign_seconds * 1e6:7.0f} us per request")
+
+
+if __name__ == '__main__':
+    main()
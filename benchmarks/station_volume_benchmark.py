@@ -0,0 +1,96 @@
+# Assignment of the closest station volumes to accidents: the per-timestamp KD-tree loop of Data Merging.ipynb
+# (legacy) versus assign_closest_volume (one KD-tree over the stations, dense hour x station volume matrix,
+# one gather). The legacy loop runs on a sample of the accidents, the results have to be identical.
+# Run from the project root: python -m benchmarks.station_volume_benchmark [accidents] [stations] [years]
+# Synthetic traffic counts with gaps (stations measuring only some years, missing hours) are used.
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from modules.station_volume import StationVolumes, assign_closest_volume
+
+SAMPLE = 3000
+
+
+def make_data(accidents, stations, years, rng):
+    hours = pd.date_range('2012-01-01', periods=years * 8760, freq='h')
+    ids = np.repeat(np.arange(stations), len(hours))
+    volume = pd.DataFrame({
+        'ID': ids,
+        'x': (2678000 + rng.random(stations) * 10000)[ids],
+        'y': (1242000 + rng.random(stations) * 10000)[ids],
+        'dateTime': np.tile(hours, stations),
+        'volume': rng.integers(0, 1500, size=len(ids)).astype('float64'),
+    })
+    # Stations that only measure part of the years and single missing hours, both dropped like in traffic_clean
+    first = rng.integers(0, len(hours), size=stations) * (rng.random(stations) < 0.4)
+    missing = (np.arange(len(ids)) % len(hours) < first[ids]) | (rng.random(len(ids)) < 0.05)
+    volume = volume[~missing].reset_index(drop=True)
+
+    df = pd.DataFrame({
+        'x': 2678000 + rng.random(accidents) * 10000,
+        'y': 1242000 + rng.random(accidents) * 10000,
+        'dateTime': hours[rng.integers(2, len(hours), size=accidents)],
+    })
+    return df, volume
+
+
+def legacy_assign(A, B, name, number_of_stations, number_of_periods):
+    A = A.copy()
+    volume_columns = [f'{name}_volume_{station}_period_{period}'
+                      for period in range(number_of_periods)
+                      for station in range(number_of_stations)]
+    for col in volume_columns:
+        A[col] = np.full(len(A), np.nan, dtype='float64')
+
+    B_grouped = B.groupby('dateTime')
+    for period in range(number_of_periods):
+        adjusted_timestamps = A['dateTime'] - pd.to_timedelta(period, unit='h')
+        valid_timestamps = set(adjusted_timestamps.unique()).intersection(B_grouped.groups.keys())
+        timestamp_to_indices = adjusted_timestamps.groupby(adjusted_timestamps).groups
+        for timestamp in valid_timestamps:
+            idxs = timestamp_to_indices.get(timestamp, [])
+            B_filtered = B_grouped.get_group(timestamp)
+            kd_tree = cKDTree(B_filtered[['x', 'y']].values)
+            _, indices = kd_tree.query(A.loc[idxs, ['x', 'y']].values, k=number_of_stations)
+            if indices.ndim == 1:
+                indices = indices[:, np.newaxis]
+            volumes = B_filtered['volume'].values[indices]
+            for station in range(number_of_stations):
+                A.loc[idxs, f'{name}_volume_{station}_period_{period}'] = volumes[:, station]
+    return A
+
+
+def main(accidents=61058, stations=200, years=12):
+    rng = np.random.default_rng(0)
+    df, volume = make_data(int(accidents), int(stations), int(years), rng)
+    sample = df.sample(SAMPLE, random_state=0)
+
+    start_time = time.perf_counter()
+    expected = legacy_assign(sample, volume, 'traffic', 3, 2)
+    legacy_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    station_volumes = StationVolumes(volume)
+    build_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    result = assign_closest_volume(df, station_volumes, 'traffic', 3, 2)
+    assign_seconds = time.perf_counter() - start_time
+
+    columns = [column for column in result.columns if column.startswith('traffic_volume')]
+    assert np.array_equal(result.loc[sample.index, columns].to_numpy(), expected[columns].to_numpy(), equal_nan=True)
+
+    print(f"{len(volume):,} volume rows of {stations} stations over {years} years, {len(df):,} accidents")
+    print(f"legacy per-timestamp loop: {legacy_seconds:7.2f} s for {SAMPLE:,} accidents "
+          f"(~{legacy_seconds / SAMPLE * len(df):.0f} s for all)")
+    print(f"StationVolumes build:      {build_seconds:7.2f} s, "
+          f"{station_volumes.values.nbytes / 1e6:.0f} MB volume matrix")
+    print(f"assign_closest_volume:     {assign_seconds:7.2f} s for all {len(df):,} accidents, "
+          f"identical on the sample")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,110 @@
+# Ingestion of the yearly OD2031 traffic counts: the pandas read_csv / groupby trim loop of Data Cleaning.ipynb
+# (legacy) versus ingest_traffic_data (parallel pyarrow CSV reads, categorical MSID, vectorized trim, Parquet
+# dataset partitioned by year), and reading one station for one week from the CSV versus from the dataset.
+# Run from the project root: python -m benchmarks.traffic_ingestion_benchmark [years] [stations]
+# Synthetic yearly files in the format of the raw data are written to a temporary directory.
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from modules.traffic_ingestion import ingest_traffic_data, load_traffic_data
+
+
+def write_year(path_pattern, year, stations, rng):
+    hours = pd.date_range(f'{year}-01-01', f'{year}-12-31 23:00', freq='h')
+    msid = np.repeat([f'Z{i // 2 + 1:03d}M{i % 2 + 1:03d}' for i in range(stations)], len(hours))
+    volume = rng.integers(0, 1500, size=len(msid)).astype(float)
+    volume[rng.random(len(msid)) < 0.02] = np.nan
+    # Stations that start measuring late or stop early
+    for i in rng.choice(stations, size=stations // 5, replace=False):
+        cut = rng.integers(0, len(hours))
+        if rng.random() < 0.5:
+            volume[i * len(hours):i * len(hours) + cut] = np.nan
+        else:
+            volume[i * len(hours) + cut:(i + 1) * len(hours)] = np.nan
+    pd.DataFrame({
+        'MSID': msid, 'MSName': 'Unbekannt', 'ZSID': [m[:4] for m in msid], 'ZSName': 'Seestrasse',
+        'Achse': 'Seestrasse', 'HNr': '451', 'Hoehe': 'Unbekannt',
+        'EKoord': np.repeat(2680000 + rng.random(stations) * 8000, len(hours)).round(3),
+        'NKoord': np.repeat(1244000 + rng.random(stations) * 8000, len(hours)).round(3),
+        'Richtung': 'auswaerts', 'MessungDatZeit': np.tile(hours.strftime('%Y-%m-%dT%H:%M:%S'), stations),
+        'AnzFahrzeuge': volume, 'AnzFahrzeugeStatus': 'Gemessen',
+    }).to_csv(path_pattern.format(year=year), index=False)
+
+
+def legacy_read(path_pattern, years):
+    def read_traffic_data(year):
+        df = pd.read_csv(path_pattern.format(year=year), dtype={'MSID': str},
+                         usecols=['MSID', 'EKoord', 'NKoord', 'MessungDatZeit', 'AnzFahrzeuge'],
+                         parse_dates=['MessungDatZeit'])
+        df['AnzFahrzeuge'] = pd.to_numeric(df['AnzFahrzeuge'], downcast='integer')
+        df['EKoord'] = pd.to_numeric(df['EKoord'], downcast='float')
+        df['NKoord'] = pd.to_numeric(df['NKoord'], downcast='float')
+        return df
+
+    with ThreadPoolExecutor() as executor:
+        traffic_data = pd.concat(list(executor.map(read_traffic_data, years)), ignore_index=True)
+
+    trimmed_data = []
+    for msid, group in traffic_data.groupby('MSID'):
+        first_valid = group['AnzFahrzeuge'].first_valid_index()
+        last_valid = group['AnzFahrzeuge'].last_valid_index()
+        trimmed_data.append(group.loc[first_valid:last_valid])
+    return pd.concat(trimmed_data, ignore_index=True)
+
+
+def main(years=4, stations=150):
+    years = range(2020, 2020 + int(years))
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path_pattern = os.path.join(directory, 'sid_dav_verkehrszaehlung_miv_OD2031_{year}.csv')
+        dataset_path = os.path.join(directory, 'traffic_data')
+        for year in years:
+            write_year(path_pattern, year, int(stations), rng)
+        csv_size = sum(os.path.getsize(path_pattern.format(year=year)) for year in years)
+
+        start_time = time.perf_counter()
+        expected = legacy_read(path_pattern, years)
+        legacy_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        result = ingest_traffic_data(years, path=dataset_path, path_pattern=path_pattern)
+        ingest_seconds = time.perf_counter() - start_time
+
+        assert len(result) == len(expected)
+        assert (result['MSID'].astype(str).to_numpy() == expected['MSID'].to_numpy()).all()
+        assert (result['MessungDatZeit'].to_numpy() == expected['MessungDatZeit'].to_numpy()).all()
+        assert np.array_equal(result['AnzFahrzeuge'].to_numpy(), expected['AnzFahrzeuge'].to_numpy(), equal_nan=True)
+        dataset_size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, names in os.walk(dataset_path) for name in names)
+
+        print(f"{len(expected):,} rows of {stations} stations over {len(years)} years, "
+              f"identical after the trim")
+        print(f"legacy read_csv + groupby loop: {legacy_seconds:7.2f} s, "
+              f"{expected.memory_usage(deep=True).sum() / 1e6:7.1f} MB in memory, {csv_size / 1e6:7.1f} MB CSV")
+        print(f"ingest_traffic_data:            {ingest_seconds:7.2f} s, "
+              f"{result.memory_usage(deep=True).sum() / 1e6:7.1f} MB in memory, {dataset_size / 1e6:7.1f} MB Parquet")
+
+        msid, start, end = f'Z{int(stations) // 4:03d}M001', f'{years[-1]}-03-02 00:00', f'{years[-1]}-03-08 23:00'
+        start_time = time.perf_counter()
+        week = pd.read_csv(path_pattern.format(year=years[-1]), parse_dates=['MessungDatZeit'])
+        week = week[(week['MSID'] == msid) & week['MessungDatZeit'].between(start, end)]
+        csv_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        result_week = load_traffic_data([msid], start, end, path=dataset_path)
+        dataset_seconds = time.perf_counter() - start_time
+        expected_week = expected[(expected['MSID'] == msid) & expected['MessungDatZeit'].between(start, end)]
+        assert len(result_week) == len(expected_week) and len(week) == 168
+
+        print(f"one station, one week: CSV scan {csv_seconds * 1000:7.1f} ms, "
+              f"Parquet dataset {dataset_seconds * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
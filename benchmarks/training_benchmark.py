@@ -0,0 +1,96 @@
+# Hyperparameter search of the severity model: the RandomizedSearchCV of Modeling.ipynb (70 candidates, 5 folds,
+# n_jobs=2, training matrices read from CSV) versus modules.training (the same 70 candidates with successive
+# halving, n_jobs=-1, matrices read from the .npz file). Reports the wall-clock time of both searches, the
+# ROC AUC of their winners on the test set, and the time of a rerun that takes all folds from the trial log.
+# Run from the project root: python -m benchmarks.training_benchmark [rows] [candidates] [tree scale]
+# The training matrices are synthetic with the columns of Data Processing.ipynb. To keep the legacy search
+# within minutes the number of trees of the search space is divided by the tree scale for both searches.
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import randint
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import RandomizedSearchCV, StratifiedKFold
+
+from modules.training import (PARAM_DISTRIBUTIONS, TrialLog, load_training_data, sample_candidates,
+                              save_training_data, successive_halving)
+
+CATEGORIES = {'AccidentType': 11, 'AccidentInvolvingPedestrian': 2, 'AccidentInvolvingBicycle': 2,
+              'AccidentInvolvingMotorcycle': 2, 'RoadType': 4, 'month': 12, 'weekday': 7, 'hour': 24}
+
+
+def make_matrix(rows, rng):
+    numeric = rng.normal(size=(rows, 36))
+    columns = [f'numeric_{i}' for i in range(36)]
+    blocks, logit = [numeric], 0.6 * numeric[:, 0] - 0.4 * numeric[:, 12] - 1.0
+    for name, size in CATEGORIES.items():
+        codes = rng.integers(0, size, size=rows)
+        blocks.append(np.eye(size)[codes])
+        columns += [f'{name}_{i}' for i in range(size)]
+        logit = logit + rng.normal(scale=0.5, size=size)[codes]
+    y = (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype(int)
+    return pd.DataFrame(np.hstack(blocks), columns=columns), pd.Series(y, name='AccidentSeverityCategory')
+
+
+def main(rows=5000, candidates=70, tree_scale=10):
+    rows, candidates, tree_scale = int(rows), int(candidates), int(tree_scale)
+    rng = np.random.default_rng(0)
+    X, y = make_matrix(int(rows * 1.25), rng)
+    distributions = dict(PARAM_DISTRIBUTIONS, n_estimators=randint(400 // tree_scale, 1000 // tree_scale))
+
+    with tempfile.TemporaryDirectory() as directory:
+        X_train, X_test, y_train, y_test = X[:rows], X[rows:], y[:rows], y[rows:]
+        for name, frame in [('X_train', X_train), ('X_test', X_test), ('y_train', y_train), ('y_test', y_test)]:
+            frame.to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+        npz_path = save_training_data(X_train, X_test, y_train, y_test, path=os.path.join(directory, 'training.npz'))
+        csv_bytes = sum(os.path.getsize(os.path.join(directory, f'{name}.csv')) for name in ('X_train', 'X_test'))
+        npz_bytes = os.path.getsize(npz_path)
+
+        start_time = time.perf_counter()
+        X_csv = pd.read_csv(os.path.join(directory, 'X_train.csv'))
+        y_csv = pd.read_csv(os.path.join(directory, 'y_train.csv')).values.ravel()
+        legacy_search = RandomizedSearchCV(
+            RandomForestClassifier(random_state=74), distributions, n_iter=candidates,
+            cv=StratifiedKFold(n_splits=5, shuffle=True, random_state=74), scoring='roc_auc', n_jobs=2,
+            random_state=74)
+        legacy_search.fit(X_csv, y_csv)
+        legacy_seconds = time.perf_counter() - start_time
+        legacy_model = RandomForestClassifier(random_state=42, **legacy_search.best_params_).fit(X_csv, y_csv)
+        legacy_auc = roc_auc_score(y_test, legacy_model.predict_proba(X_test)[:, 1])
+
+        trials_path = os.path.join(directory, 'trials.jsonl')
+        start_time = time.perf_counter()
+        data = load_training_data(npz_path)
+        best_params, results = successive_halving(data['X_train'], data['y_train'],
+                                                  sample_candidates(candidates, distributions), n_jobs=-1,
+                                                  trials=TrialLog(trials_path))
+        halving_seconds = time.perf_counter() - start_time
+        model = RandomForestClassifier(random_state=42, **best_params).fit(data['X_train'], data['y_train'])
+        halving_auc = roc_auc_score(data['y_test'], model.predict_proba(data['X_test'])[:, 1])
+
+        start_time = time.perf_counter()
+        resumed_params, _ = successive_halving(data['X_train'], data['y_train'],
+                                               sample_candidates(candidates, distributions), n_jobs=-1,
+                                               trials=TrialLog(trials_path))
+        resumed_seconds = time.perf_counter() - start_time
+        assert resumed_params == best_params
+
+    fits = results.groupby('round').agg(candidates=('candidate', 'size'), rows=('rows', 'first'))
+    print(f"{rows:,} training rows x {X.shape[1]} features, {candidates} candidates, 5 folds, "
+          f"{os.cpu_count()} CPU(s), trees / {tree_scale}")
+    print(f"training matrices: CSV {csv_bytes / 2**20:.1f} MB, npz {npz_bytes / 2**20:.1f} MB")
+    print(f"RandomizedSearchCV:  {legacy_seconds:7.1f} s, {candidates * 5} fits on {int(rows * 0.8):,} rows, "
+          f"test ROC AUC {legacy_auc:.4f}")
+    print(f"successive halving:  {halving_seconds:7.1f} s, rounds " +
+          ", ".join(f"{r.candidates} x {r.rows:,} rows" for r in fits.itertuples()) +
+          f", test ROC AUC {halving_auc:.4f}")
+    print(f"rerun from the trial log: {resumed_seconds:.2f} s")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
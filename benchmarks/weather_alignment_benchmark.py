@@ -0,0 +1,59 @@
+# Benchmark of the array based assign_weather against the former per-period merge.
+# Run from the project root: python -m benchmarks.weather_alignment_benchmark
+import time
+
+import numpy as np
+import pandas as pd
+
+from modules.utils import assign_weather, build_weather_array
+
+FEATURES = ['temperature_2m', 'precipitation', 'snowfall', 'snow_depth', 'surface_pressure', 'cloud_cover']
+
+
+def merge_assign_weather(df, weather, number_of_periods, features):
+    """The former implementation: one copy of the weather and one left merge per period."""
+    df = df.copy()
+    for p in range(number_of_periods):
+        temp = weather.copy()
+        temp['dateTime'] = temp['dateTime'] + pd.Timedelta(hours=p)
+        temp.rename(columns={feature: f'{feature}_period_{p}' for feature in features}, inplace=True)
+        df = df.merge(temp, on=['dateTime'], how='left')
+    return df
+
+
+def measure(func, repeats=3):
+    """Best of a few runs, the first run pays for warming up pandas."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rng = np.random.default_rng(0)
+    # 12 years of hourly weather with a few gaps
+    hours = pd.date_range('2012-01-01', '2023-12-31 23:00', freq='h')
+    weather = pd.DataFrame(rng.normal(size=(len(hours), len(FEATURES))), columns=FEATURES)
+    weather.insert(0, 'dateTime', hours)
+    weather = weather.drop(index=rng.choice(len(weather), size=500, replace=False)).reset_index(drop=True)
+
+    start = time.perf_counter()
+    weather_array = build_weather_array(weather, FEATURES)
+    print(f"Building the weather array: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    print(f"{'rows':>10} | {'merge':>12} | {'array':>12} | {'prebuilt array':>14}")
+    for rows in [1, 10_000, 100_000, 1_000_000]:
+        df = pd.DataFrame({'dateTime': hours[rng.integers(0, len(hours), size=rows)]})
+
+        merge_time, expected = measure(lambda: merge_assign_weather(df, weather, 4, FEATURES))
+        array_time, result = measure(lambda: assign_weather(df, weather, 4, FEATURES))
+        prebuilt_time, _ = measure(lambda: assign_weather(df, weather_array, 4, FEATURES))
+
+        pd.testing.assert_frame_equal(result, expected[result.columns])
+        print(f"{rows:>10,} | {merge_time * 1e3:>9.1f} ms | {array_time * 1e3:>9.1f} ms | {prebuilt_time * 1e3:>11.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
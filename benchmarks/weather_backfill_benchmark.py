@@ -0,0 +1,95 @@
+# Weather backfill against a stand-in for the Open-Meteo archive (latency of a fixed part per request plus a part
+# per requested day, synthetic hourly data): one request for the whole span written with csv.DictWriter (legacy)
+# versus monthly windows fetched in parallel into Parquet parts. Reports run time and peak traced memory for
+# growing spans, then a resumed run.
+# Run from the project root: python -m benchmarks.weather_backfill_benchmark
+import csv
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from modules.open_meteo_api import DEFAULT_HOURLY
+from modules.rate_limiter import OPEN_METEO_LIMITS, RateLimiter
+from modules.weather_backfill import backfill_weather, export_csv
+
+LATENCY = 0.1
+LATENCY_PER_DAY = 0.002
+
+
+class StandInArchive:
+    """Returns synthetic hourly data after a delay, optionally failing the first requests of some windows."""
+
+    def __init__(self, fail_windows=()):
+        self.rate_limiter = RateLimiter(OPEN_METEO_LIMITS)
+        self.fail_windows = set(fail_windows)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, start_date, end_date, hourly=None, blocking=False, **kwargs):
+        self.rate_limiter.acquire(blocking=blocking)
+        with self._lock:
+            self.calls += 1
+            if start_date in self.fail_windows:
+                self.fail_windows.discard(start_date)
+                return None
+        times = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(hours=23), freq='h')
+        time.sleep(LATENCY + LATENCY_PER_DAY * len(times) / 24)
+        rng = np.random.default_rng(len(times))
+        data = {'time': times.strftime('%Y-%m-%dT%H:%M').tolist()}
+        for variable in hourly or DEFAULT_HOURLY:
+            data[variable] = rng.normal(size=len(times)).round(1).tolist()
+        return data
+
+
+def legacy_download(fetch, start_date, end_date, csv_file_path):
+    data = fetch(start_date=start_date, end_date=end_date)
+    with open(csv_file_path, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=data.keys())
+        writer.writeheader()
+        for row in zip(*data.values()):
+            writer.writerow(dict(zip(data.keys(), row)))
+
+
+def traced(function):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2**20, result
+
+
+def main():
+    for years in [1, 4, 12]:
+        end_date = f"{2011 + years}-12-31"
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, peak, _ = traced(lambda: legacy_download(StandInArchive(), "2012-01-01", end_date,
+                                                              os.path.join(directory, 'legacy.csv')))
+            print(f"{years:>2} year(s) legacy:   {seconds:6.2f} s, peak {peak:6.1f} MB")
+
+            parts = os.path.join(directory, 'parts')
+            seconds, peak, failed = traced(lambda: backfill_weather("2012-01-01", end_date, path=parts,
+                                                                    fetch=StandInArchive()))
+            assert not failed
+            print(f"{years:>2} year(s) backfill: {seconds:6.2f} s, peak {peak:6.1f} MB "
+                  f"({sum(name.endswith('.parquet') for name in os.listdir(parts))} monthly parts)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Two windows fail on every attempt of the first run and are fetched by the second run only
+        archive = StandInArchive(fail_windows=['2013-03-01', '2013-07-01'])
+        failed = backfill_weather("2012-01-01", "2013-12-31", path=directory, retries=0, fetch=archive)
+        first_calls = archive.calls
+        failed_again = backfill_weather("2012-01-01", "2013-12-31", path=directory, retries=0, fetch=archive)
+        rows = export_csv(directory, os.path.join(directory, 'weather_data.csv'))
+        print(f"resume: first run failed {failed} ({first_calls} requests), second run "
+              f"{archive.calls - first_calls} requests, failed {failed_again}, {rows:,} rows exported")
+
+
+if __name__ == '__main__':
+    main()
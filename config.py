@@ -4,5 +4,19 @@ import os
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 
 # Define common paths relative to the project root
-TRACKER_PATH = os.path.join(PROJECT_ROOT, "data", "api", "request_tracker.json")
 DATA_PATH = os.path.join(PROJECT_ROOT, "data")
+WEATHER_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "weather")
+RATE_LIMIT_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "rate_limit.sqlite")
+PREDICTION_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "predictions.sqlite")
+PREPROCESSOR_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "preprocessor.pkl")
+MODEL_PATH = os.path.join(PROJECT_ROOT, "data", "models", "finalized_model.sav")
+THRESHOLD_PATH = os.path.join(PROJECT_ROOT, "data", "models", "threshold.json")
+SEARCH_TRIALS_PATH = os.path.join(PROJECT_ROOT, "data", "models", "search_trials.jsonl")
+TRAINING_DATA_PATH = os.path.join(PROJECT_ROOT, "data", "training", "training_data.npz")
+LOCATIONS_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "locations.csv")
+AVERAGE_VOLUME_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "average_volume.csv")
+HISTORIC_DATA_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "historic_data.csv")
+HISTORIC_DATASET_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "historic_data.feather")
+STATION_VOLUME_PATH = os.path.join(PROJECT_ROOT, "data", "inference", "station_volume.npz")
+MERGED_DATASET_PATH = os.path.join(PROJECT_ROOT, "data", "clean", "merged_data")
+REFRESH_STATE_PATH = os.path.join(PROJECT_ROOT, "data", "clean", "refresh_state.json")
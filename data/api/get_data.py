@@ -1,9 +1,8 @@
 from modules.ckan_api import get_ckan_data
-from modules.open_meteo_api import open_meteo_request
+from modules.downloader import Downloader
+from modules.weather_backfill import WEATHER_PARTS_PATH, backfill_weather, export_csv
 from config import DATA_PATH
 import os
-import csv
-from tqdm import tqdm
 
 # This file is a "script" that you can run to automatically download all the data that we used in our project.
 
@@ -54,10 +53,14 @@ def ckan_data_download() -> bool:
     downloaded_datasets = 0
     failed_datasets = []
 
+    # One downloader for all datasets, so connections are reused. Running the script again resumes
+    # interrupted downloads and skips the files that are up to date.
+    downloader = Downloader(max_workers=4)
+
     for dataset_name, dataset_id in dataset_ids.items():
         print(f"\nDownloading dataset: {dataset_name} (ID: {dataset_id})")
         try:
-            filepath = get_ckan_data(dataset_id)
+            filepath = get_ckan_data(dataset_id, downloader=downloader)
             if filepath:
                 print(f"Successfully downloaded and saved: {filepath}")
                 downloaded_datasets += 1
@@ -82,44 +85,30 @@ def open_meteo_data_download() -> bool:
     """
     Function to download datasets using the OPEN-METEO API.
 
+    The range is fetched month by month into Parquet parts (see modules/weather_backfill.py), running the
+    script again only fetches the months that are missing.
+
     Returns:
         bool: True if all datasets were downloaded successfully, False otherwise.
     """
     start_date = "2012-01-01"
     end_date = "2023-12-31"
-    base_url = "https://archive-api.open-meteo.com/v1/archive"
-
-    data = open_meteo_request(
-        start_date=start_date,
-        end_date=end_date,
-        base_url=base_url,
-    )
 
-    if data is None:
-        print("Failed to retrieve data.")
+    failed_windows = backfill_weather(start_date=start_date, end_date=end_date, window='month', workers=4)
+    if failed_windows:
+        print(f"Failed to retrieve {len(failed_windows)} month(s) of weather data: {failed_windows}")
         return False
 
     try:
-        total_rows = len(next(iter(data.values())))
-        csv_file_path = os.path.join('..', 'raw', 'weather_data.csv')
-        with open(csv_file_path, mode='w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=data.keys())
-            writer.writeheader()
-            # Transpose rows by zipping dictionary values
-            for row in tqdm(zip(*data.values()), total=total_rows, desc="Saving data"):
-                writer.writerow(dict(zip(data.keys(), row)))
+        csv_file_path = os.path.join(raw_folder_path, 'weather_data.csv')
+        export_csv(WEATHER_PARTS_PATH, csv_file_path, start_date, end_date)
         print(f"Weather data saved successfully at {csv_file_path}.")
-        success = True
     except IOError as e:
         print(f"Error writing to CSV file: {e}")
         return False
 
-
-    if success:
-        print("Weather data downloaded successfully.")
-    else:
-        print("Failed to download weather data.")
-    return success
+    print("Weather data downloaded successfully.")
+    return True
 
 
 if __name__ == '__main__':
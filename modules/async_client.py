@@ -0,0 +1,85 @@
+# Contains the asyncio HTTP layer: a pooled httpx.AsyncClient on a background event loop, with a sync facade
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Dict, Iterable, List, Optional
+
+import httpx
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+class AsyncHTTP:
+    """
+    Runs an event loop in a background thread with one pooled `httpx.AsyncClient`.
+
+    Synchronous code (Streamlit pages, scripts, worker threads) submits coroutines with `run` and waits for
+    their result, so the pages keep their blocking call style while concurrent requests share the pool of
+    keep-alive connections.
+
+    Parameters:
+    - max_connections (int): Maximum number of open connections.
+    - max_keepalive_connections (int): Maximum number of idle connections kept open for reuse.
+    - timeout (httpx.Timeout): Connect, read, write and pool timeouts of every request.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: httpx.Timeout = DEFAULT_TIMEOUT):
+        self.pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-http', daemon=True)
+        self._thread.start()
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def run(self, coroutine: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the background loop and wait for its result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncHTTP.run() cannot be called from the event loop, await the coroutine instead.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        GET url and decode the JSON body.
+
+        Raises:
+        - httpx.HTTPError: If the request fails or the status is not 2xx.
+        - ValueError: If the body is not valid JSON.
+        """
+        response = await self.client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self) -> None:
+        self.run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_instance: Optional[AsyncHTTP] = None
+_instance_lock = threading.Lock()
+
+
+def get_async_http() -> AsyncHTTP:
+    """Process-wide AsyncHTTP, created again in a forked process where the loop thread does not exist."""
+    global _instance
+    with _instance_lock:
+        if _instance is None or _instance.pid != os.getpid():
+            _instance = AsyncHTTP()
+        return _instance
+
+
+def run(coroutine: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Sync facade: run a coroutine on the shared background loop and return its result."""
+    return get_async_http().run(coroutine, timeout)
+
+
+async def gather_limited(coroutines: Iterable[Awaitable], limit: int) -> List[Any]:
+    """Await coroutines concurrently, at most `limit` at a time, and return their results in order."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
@@ -0,0 +1,141 @@
+# Command-line batch scorer for accident severity predictions.
+#
+# Usage (from the project root):
+#   python -m modules.batch_scoring scenarios.csv predictions.csv [--chunk-size 50000] [--threshold 0.2]
+#
+# The input (CSV or Parquet) needs the columns lat, lon, dateTime and AccidentType (code, e.g. 'at2'), the
+# involvement flags AccidentInvolvingPedestrian/Bicycle/Motorcycle are optional. The input is streamed in
+# chunks and every chunk is written to the output (CSV or Parquet) as soon as it is scored, so memory use
+# depends on the chunk size only. The output holds the input columns plus RoadType, probability and prediction.
+# With --workers N the preprocessing and inference of the chunks run in N processes, the row order stays the same.
+import argparse
+import os
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import MODEL_PATH
+from modules.parallel_scoring import ParallelScorer
+from modules.scoring import (assemble_features, load_location_index, load_model, load_station_volume,
+                             load_threshold, load_volume_table, predict_severity)
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Appends scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet_writer = None
+        self._header_written = False
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+        else:
+            chunk.to_csv(self.path, mode='a' if self._header_written else 'w',
+                         header=not self._header_written, index=False)
+            self._header_written = True
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def score_file(input_path: str, output_path: str, chunk_size: int = 50000,
+               threshold: Optional[float] = None, seed: Optional[int] = 42, model_path: str = MODEL_PATH,
+               workers: int = 1) -> int:
+    """
+    Score all scenarios of input_path and write them to output_path.
+
+    Parameters:
+    - input_path (str): CSV or Parquet file with the scenarios.
+    - output_path (str): CSV or Parquet file for the results.
+    - chunk_size (int): Number of rows scored at once.
+    - threshold (float, optional): Probability from which an accident is predicted as severe, defaults to the
+      threshold saved with the model.
+    - seed (int, optional): Seed for the road type lookup, None for a random one.
+    - model_path (str): Location of the pickled model.
+    - workers (int): Number of worker processes for preprocessing and inference, 1 scores in this process.
+
+    Returns:
+    - int: Number of scored rows.
+    """
+    if threshold is None:
+        threshold = load_threshold()
+    location_index = load_location_index()
+    # Station volumes when the store has been built, the city-wide averages otherwise
+    volume_table = load_station_volume() or load_volume_table()
+    rng = np.random.default_rng(seed)
+
+    def assembled_chunks():
+        # Feature assembly stays in this process, it shares the weather cache and the rate limiter
+        for chunk in read_chunks(input_path, chunk_size):
+            features = assemble_features(chunk, location_index, volume_table, rng)
+            yield features, chunk.assign(RoadType=features['RoadType'].to_numpy())
+
+    if workers > 1:
+        scorer = ParallelScorer(workers, model_path=model_path, threshold=threshold)
+        results = scorer.score(assembled_chunks())
+    else:
+        scorer = None
+        model = load_model(model_path)
+        results = ((chunk, *predict_severity(features, model, threshold)) for features, chunk in assembled_chunks())
+
+    writer = ChunkWriter(output_path)
+    total_rows = 0
+    start_time = time.perf_counter()
+    try:
+        for chunk, probabilities, predictions in results:
+            writer.write(chunk.assign(probability=probabilities, prediction=predictions))
+            total_rows += len(chunk)
+            print(f"Scored {total_rows:,} rows ({total_rows / (time.perf_counter() - start_time):,.0f} rows/s)")
+    finally:
+        writer.close()
+        if scorer is not None:
+            scorer.close()
+
+    print(f"Done: {total_rows:,} rows in {time.perf_counter() - start_time:.1f} s, results saved at {output_path}.")
+    return total_rows
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Score accident severity for a file of scenarios.")
+    parser.add_argument('input', help="CSV or Parquet file with the columns lat, lon, dateTime, AccidentType.")
+    parser.add_argument('output', help="CSV or Parquet file for the results.")
+    parser.add_argument('--chunk-size', type=int, default=50000, help="Number of rows scored at once.")
+    parser.add_argument('--threshold', type=float,
+                        help="Probability from which an accident is predicted as severe, defaults to the threshold "
+                             "saved with the model (data/models/threshold.json) and 0.2 without one.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the road type lookup.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Location of the pickled model.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes for preprocessing and inference.")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        parser.error(f"Input file '{args.input}' does not exist.")
+
+    score_file(args.input, args.output, chunk_size=args.chunk_size, threshold=args.threshold, seed=args.seed,
+               model_path=args.model, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,19 @@
+import json
 import requests
-from typing import Optional, Dict, Any
+import httpx
+from typing import Optional, Dict, Any, List
 import os
-from tqdm import tqdm
 from config import DATA_PATH
+from modules.async_client import gather_limited, get_async_http, run
+from modules.downloader import Downloader
 
-def ckan_request(
+async def ckan_request_async(
     action: str,
     params: Optional[Dict[str, Any]] = None,
     base_url: str = 'https://opendata.swiss/api/3/action/'
 ) -> Optional[Dict[str, Any]]:
     """
-    Makes a request to the CKAN API and returns the result.
+    Makes a request to the CKAN API and returns the result, asynchronously.
 
     Parameters:
     - base_url (str): The base URL of the CKAN API.
@@ -22,21 +25,57 @@ def ckan_request(
     """
     url = f"{base_url}{action}"
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = await get_async_http().get_json(url, params=params)
         if data.get('success'):
             print()
             return data['result']
         else:
             print(f"API Error: {data.get('error', 'Unknown error')}")
             return None
-    except requests.RequestException as e:
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
         print(f"HTTP Error: {e}")
         return None
 
 
-def get_ckan_data(id: str) -> Optional[str]:
+def ckan_request(
+    action: str,
+    params: Optional[Dict[str, Any]] = None,
+    base_url: str = 'https://opendata.swiss/api/3/action/'
+) -> Optional[Dict[str, Any]]:
+    """
+    Makes a request to the CKAN API and returns the result, the blocking version of `ckan_request_async`.
+    """
+    return run(ckan_request_async(action, params=params, base_url=base_url))
+
+
+def ckan_request_many(requests_params: List[Dict[str, Any]], concurrency: int = 10) -> List[Optional[Dict[str, Any]]]:
+    """
+    Makes several requests to the CKAN API concurrently.
+
+    Parameters:
+    - requests_params (list): Keyword arguments of `ckan_request_async` per request.
+    - concurrency (int): Maximum number of requests in flight.
+
+    Returns:
+    - list: The result of every request in order, None for failed requests.
+    """
+    return run(gather_limited((ckan_request_async(**kwargs) for kwargs in requests_params), concurrency))
+
+
+def get_ckan_data(id: str, downloader: Optional[Downloader] = None) -> Optional[str]:
+    """
+    Downloads the CSV resources of a CKAN dataset into data/raw.
+
+    Resources are downloaded in parallel, interrupted downloads are resumed and resources that did not
+    change since the last run are skipped (see modules/downloader.py).
+
+    Parameters:
+    - id (str): The dataset ID.
+    - downloader (Downloader, optional): Downloader to use, e.g. one shared between several datasets.
+
+    Returns:
+    - str: The path of the last CSV resource if all resources were downloaded, otherwise None.
+    """
     base_url = 'https://opendata.swiss/api/3/action/'
     action = 'package_show'
     params = {"id": id}
@@ -56,37 +95,31 @@ def get_ckan_data(id: str) -> Optional[str]:
         if not os.path.exists(raw_dir):
             raise FileNotFoundError(f"Directory '{raw_dir}' does not exist.")
 
-        # Process each resource
-        last_saved_file = None
-        for idx, resource in enumerate(tqdm(resources, desc="Processing resources")):
+        # Collect the CSV resources
+        items = []
+        for idx, resource in enumerate(resources):
             if resource['url'].endswith('.csv'):
                 # Generate the filename
                 filename = resource['title'].get('en') or resource['title'].get('de') or f"{id}_{idx}.csv"
-                filepath = os.path.join(raw_dir, filename)
-
-                # Download the file with progress
-                response = requests.get(resource['url'], stream=True)
-                response.raise_for_status()
-
-                total_size = int(response.headers.get('content-length', 0))
-                with open(filepath, 'wb') as file, tqdm(
-                    desc=f"Downloading {filename}",
-                    total=total_size,
-                    unit='B',
-                    unit_scale=True,
-                    unit_divisor=1024,
-                ) as bar:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        file.write(chunk)
-                        bar.update(len(chunk))
-
-                print(f"File saved as: {filepath}")
-                last_saved_file = filepath
-
-        if not last_saved_file:
+                items.append((resource['url'], os.path.join(raw_dir, filename), resource.get('hash')))
+
+        if not items:
             raise ValueError(f"No CSV resource found in dataset ID: {id}")
 
-        return last_saved_file
+        downloader = downloader or Downloader()
+        results = downloader.download_many(items)
+        for download in results:
+            if download.status == 'failed':
+                print(f"Failed to download {download.url}: {download.error}")
+            elif download.status == 'skipped':
+                print(f"File is up to date: {download.path}")
+            else:
+                print(f"File saved as: {download.path}")
+
+        if any(download.status == 'failed' for download in results):
+            raise ValueError(f"Not all resources of dataset ID {id} were downloaded, run again to resume.")
+
+        return results[-1].path
 
     except requests.RequestException as e:
         print(f"HTTP error occurred while accessing the API: {e}")
@@ -0,0 +1,145 @@
+# Contains cleaning steps of `Data Cleaning.ipynb`, vectorized and shared with the incremental refresh of the merged dataset
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+ACCIDENT_COLUMNS_TO_DROP = [
+    "AccidentUID",
+    "AccidentType_de", "AccidentType_fr", "AccidentType_it", "AccidentType_en",
+    "AccidentSeverityCategory_de", "AccidentSeverityCategory_fr", "AccidentSeverityCategory_it", "AccidentSeverityCategory_en",
+    "RoadType_de", "RoadType_fr", "RoadType_it", "RoadType_en",
+    "AccidentMonth_de", "AccidentMonth_fr", "AccidentMonth_it", "AccidentMonth_en",
+    "AccidentWeekDay_de", "AccidentWeekDay_fr", "AccidentWeekDay_it", "AccidentWeekDay_en",
+    "AccidentHour_text",
+    "CantonCode",
+    "MunicipalityCode",
+]
+ACCIDENT_COLUMN_NAMES = {
+    'DateTime': 'dateTime', 'AccidentHour': 'hour', 'AccidentWeekDay': 'weekday', 'AccidentMonth': 'month',
+    'AccidentYear': 'year', 'AccidentLocation_CHLV95_E': 'x', 'AccidentLocation_CHLV95_N': 'y',
+}
+TRAFFIC_COLUMN_NAMES = {'MSID': 'ID', 'MessungDatZeit': 'dateTime', 'AnzFahrzeuge': 'volume', 'EKoord': 'x', 'NKoord': 'y'}
+PEDESTRIAN_COLUMN_NAMES = {'FK_STANDORT': 'ID', 'DATUM': 'dateTime', 'OST': 'x', 'NORD': 'y'}
+PEDESTRIAN_COUNTS = ['VELO_IN', 'VELO_OUT', 'FUSS_IN', 'FUSS_OUT']
+FIRST_ACCIDENT_DATE = pd.Timestamp('2012-01-01')
+
+
+def month_tables(year: np.ndarray, month: np.ndarray):
+    """
+    Calendar facts of every (year, month).
+
+    Returns:
+    - tuple: (first_weekday, month_length, month_start) where first_weekday is the ISO weekday (Monday=1)
+      of the first day and month_start is the first day as datetime64[D].
+    """
+    month_start = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    first_day = month_start.astype('datetime64[D]')
+    month_length = ((month_start + 1).astype('datetime64[D]') - first_day).astype(np.int64)
+    # 1970-01-01 was a Thursday
+    first_weekday = (first_day.astype(np.int64) + 3) % 7 + 1
+    return first_weekday, month_length, first_day
+
+
+def impute_accident_dates(accidents: pd.DataFrame, seed: Optional[int] = None) -> pd.Series:
+    """
+    Assign every accident a date and hour from its year, month, weekday and hour.
+
+    The accident data only has the year, month and weekday of an accident. The rows are in chronological
+    order, so within a month every change of the weekday moves to the next day with that weekday; after the
+    end of the month it starts over at the first such day. A row that goes back in time (earlier year, or an
+    earlier month other than January) gets a random day with its weekday in its month, the following rows
+    continue from there.
+
+    The walk is computed with array operations: the days are a cumulative sum of the weekday steps within
+    segments that start at every new month, every backwards row and every overflow of the month end.
+
+    Parameters:
+    - accidents (pd.DataFrame): Rows with 'AccidentYear', 'AccidentMonth', 'AccidentWeekDay' (ISO weekday, Monday=1)
+      and 'AccidentHour'.
+    - seed (int, optional): Seed for the random days, the same seed gives the same dates.
+
+    Returns:
+    - pd.Series: The datetime of every accident, indexed like accidents.
+    """
+    year = accidents['AccidentYear'].to_numpy(dtype=np.int64)
+    month = accidents['AccidentMonth'].to_numpy(dtype=np.int64)
+    weekday = accidents['AccidentWeekDay'].to_numpy(dtype=np.int64)
+    hour = accidents['AccidentHour'].to_numpy(dtype=np.int64)
+    n = len(accidents)
+    if n == 0:
+        return pd.Series(pd.to_datetime([]), index=accidents.index, dtype='datetime64[ns]')
+
+    # Weekday-in-month tables, computed once per distinct month
+    month_key, inverse = np.unique((year - 1970) * 12 + month - 1, return_inverse=True)
+    first_weekday, month_length, first_day = month_tables(month_key // 12 + 1970, month_key % 12 + 1)
+    first_weekday, month_length, first_day = first_weekday[inverse], month_length[inverse], first_day[inverse]
+    first_occurrence = 1 + (weekday - first_weekday) % 7
+    occurrences = (month_length - first_occurrence) // 7 + 1
+    random_day = first_occurrence + 7 * np.random.default_rng(seed).integers(0, occurrences)
+
+    previous_year = np.r_[year[0], year[:-1]]
+    previous_month = np.r_[month[0], month[:-1]]
+    backwards = (year < previous_year) | ((month < previous_month) & (month != 1))
+    starts = backwards | (year != previous_year) | (month != previous_month)
+    starts[0] = True
+    start_day = np.where(backwards, random_day, first_occurrence)
+    # Days to the next day with the weekday of the row
+    step = (weekday - np.r_[weekday[0], weekday[:-1]]) % 7
+
+    while True:
+        segment_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+        cumulative = np.cumsum(np.where(starts, 0, step))
+        day = start_day[segment_start] + cumulative - cumulative[segment_start]
+        overflow = day > month_length
+        if not overflow.any():
+            break
+        # Within a segment the days only grow, its first overflow starts over at the first day with the weekday
+        first_overflow = overflow & ~np.r_[False, overflow[:-1] & ~starts[1:]]
+        starts |= first_overflow
+        start_day = np.where(first_overflow, first_occurrence, start_day)
+
+    dates = first_day + (day - 1) + hour.astype('timedelta64[h]')
+    return pd.Series(dates.astype('datetime64[ns]'), index=accidents.index)
+
+
+def clean_accidents(accidents: pd.DataFrame, seed: Optional[int] = 42) -> pd.DataFrame:
+    """
+    The accident cleaning of Data Cleaning.ipynb: drop the translated and unused columns, impute the dates
+    and keep the accidents since 2012 under the column names of the merged dataset.
+
+    Parameters:
+    - accidents (pd.DataFrame): Rows of RoadTrafficAccidentLocations.csv in file order, all months or a
+      run of consecutive months.
+    - seed (int, optional): Seed for the random days of rows that go back in time.
+
+    Returns:
+    - pd.DataFrame: The cleaned accidents.
+    """
+    accidents = accidents.drop(columns=ACCIDENT_COLUMNS_TO_DROP, errors='ignore')
+    if accidents['AccidentWeekDay'].dtype == object:
+        accidents['AccidentWeekDay'] = accidents['AccidentWeekDay'].str[-1].astype(int)
+    accidents['DateTime'] = impute_accident_dates(accidents, seed=seed)
+    accidents = accidents.rename(columns=ACCIDENT_COLUMN_NAMES)
+    return accidents[accidents['dateTime'] >= FIRST_ACCIDENT_DATE]
+
+
+def clean_traffic_data(traffic: pd.DataFrame, excluded_stations: Iterable = ()) -> pd.DataFrame:
+    """
+    Traffic counts of the traffic dataset in the volume format of the merge ('ID', 'dateTime', 'volume', 'x', 'y').
+
+    Missing counts are dropped instead of imputed, excluded stations (anomalous counts) are left out.
+    """
+    traffic = traffic[~traffic['MSID'].isin(list(excluded_stations)) & traffic['AnzFahrzeuge'].notna()]
+    return traffic.rename(columns=TRAFFIC_COLUMN_NAMES)
+
+
+def clean_pedestrian_data(pedestrian: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pedestrian and bicycle counts in the volume format of the merge: missing counts are 0 and the volume is
+    the sum of both directions of pedestrians and bicycles.
+    """
+    pedestrian = pedestrian.fillna(0)
+    pedestrian['DATUM'] = pd.to_datetime(pedestrian['DATUM'])
+    pedestrian['volume'] = pedestrian[PEDESTRIAN_COUNTS].sum(axis=1)
+    return pedestrian.drop(columns=PEDESTRIAN_COUNTS).rename(columns=PEDESTRIAN_COLUMN_NAMES)
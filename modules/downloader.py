@@ -0,0 +1,222 @@
+# Contains the download engine for CKAN resources: pooled connections, resumable transfers and parallel downloads
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+# Hash algorithms by the length of their hex digest, for checksums given without an algorithm prefix
+DIGEST_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+# Responses that are retried with backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: str
+    status: str  # 'downloaded', 'resumed', 'skipped' or 'failed'
+    bytes_transferred: int = 0
+    error: Optional[str] = None
+
+
+def file_checksum(path: str, algorithm: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_checksum(checksum: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Split a checksum like 'sha256:ab12...' or a bare hex digest into (algorithm, digest).
+
+    Returns:
+    - tuple: (algorithm, digest), or None if the checksum is empty or of an unknown form.
+    """
+    if not checksum:
+        return None
+    algorithm, _, digest = checksum.strip().lower().rpartition(':')
+    algorithm = algorithm or DIGEST_LENGTHS.get(len(digest))
+    if algorithm not in hashlib.algorithms_available:
+        return None
+    return algorithm, digest
+
+
+def content_range_start(response: requests.Response) -> Optional[int]:
+    """First byte of a partial response from its Content-Range header ('bytes 100-199/200'), None without one."""
+    unit, _, byte_range = response.headers.get('Content-Range', '').partition(' ')
+    start = byte_range.split('-', 1)[0]
+    return int(start) if unit == 'bytes' and start.isdigit() else None
+
+
+class Downloader:
+    """
+    Downloads files over a pooled `requests.Session`.
+
+    - Connections are reused between requests. Failed connections, interrupted transfers and 429/5xx responses
+      are retried with exponential backoff by `download`, the session itself does not retry.
+    - A transfer is written to `<path>.part`. If it is interrupted, the next attempt (in the same or a later
+      run) continues from the partial file with an HTTP Range request. If-Range makes the server send the whole
+      file instead if it changed in between, and a partial response that does not start at the end of the
+      partial file starts the download over.
+    - The ETag and Last-Modified headers of every finished file are kept in `<path>.meta.json`. A file is not
+      downloaded again if its expected checksum matches, or if the server answers the conditional request with
+      304 Not Modified.
+    - `download_many` downloads several files at once in a bounded thread pool.
+
+    Parameters:
+    - session (requests.Session, optional): Session to use, e.g. with custom headers. A pooled one by default.
+    - chunk_size (int): Bytes read from the network and written at once.
+    - max_workers (int): Number of parallel downloads in `download_many`.
+    - retries (int): Attempts per file after a failed connection, an interrupted transfer or a 429/5xx response.
+    - backoff (float): Wait before the first retry in seconds, doubled for every further one.
+    - timeout (float): Connect and read timeout in seconds.
+    - progress (bool): Show a progress bar per file.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, chunk_size: int = 1 << 20, max_workers: int = 4,
+                 retries: int = 3, backoff: float = 1, timeout: float = 60, progress: bool = True):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.progress = progress
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    @staticmethod
+    def _read_meta(path: str) -> dict:
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_meta(path: str, response: requests.Response) -> None:
+        meta = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        with open(path, 'w') as file:
+            json.dump(meta, file)
+
+    def _transfer(self, url: str, path: str) -> DownloadResult:
+        part_path = path + '.part'
+        part_meta_path = part_path + '.meta.json'
+        meta = self._read_meta(path + '.meta.json') if os.path.exists(path) else {}
+        part_meta = self._read_meta(part_meta_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        headers = {}
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        if offset and validator:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        elif meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        elif meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                return DownloadResult(url, path, 'skipped')
+            if response.status_code == 416 or (response.status_code == 206 and
+                                               content_range_start(response) != offset):
+                # The partial file does not fit the resource anymore, or the server sent another range: start over
+                os.remove(part_path)
+                return self._transfer(url, path)
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                status, mode = 'resumed', 'ab'
+            else:
+                # The server ignored the range or the resource changed, start over
+                status, mode, offset = 'downloaded', 'wb', 0
+                self._write_meta(part_meta_path, response)
+
+            total_size = int(response.headers.get('content-length', 0)) + offset
+            transferred = 0
+            with open(part_path, mode) as file, tqdm(
+                desc=f"Downloading {os.path.basename(path)}",
+                total=total_size or None,
+                initial=offset,
+                unit='B',
+                unit_scale=True,
+                unit_divisor=1024,
+                disable=not self.progress,
+            ) as bar:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+                    transferred += len(chunk)
+                    bar.update(len(chunk))
+
+        os.replace(part_path, path)
+        os.replace(part_meta_path, path + '.meta.json')
+        return DownloadResult(url, path, status, transferred)
+
+    def download(self, url: str, path: str, checksum: Optional[str] = None) -> DownloadResult:
+        """
+        Download url to path unless the file at path is up to date.
+
+        Parameters:
+        - url (str): URL of the file.
+        - path (str): Destination of the file.
+        - checksum (str, optional): Expected checksum, 'algorithm:hexdigest' or a bare md5/sha1/sha256/sha512 digest.
+          If the existing file matches, no request is made. A downloaded file that does not match raises ValueError.
+
+        Returns:
+        - DownloadResult: What was done and how many bytes were transferred.
+        """
+        expected = parse_checksum(checksum)
+        if expected and os.path.exists(path) and file_checksum(path, expected[0]) == expected[1]:
+            return DownloadResult(url, path, 'skipped')
+
+        for attempt in range(self.retries + 1):
+            try:
+                result = self._transfer(url, path)
+                break
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout,
+                    requests.HTTPError) as e:
+                # The partial file stays, the next attempt continues from it. Other HTTP errors are final.
+                retryable = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRY_STATUSES
+                if attempt == self.retries or not retryable:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+        if expected and result.status != 'skipped' and file_checksum(path, expected[0]) != expected[1]:
+            os.remove(path)
+            raise ValueError(f"Checksum mismatch for {url}")
+        return result
+
+    def download_many(self, items: Iterable[Tuple[str, str, Optional[str]]]) -> List[DownloadResult]:
+        """
+        Download several files in parallel.
+
+        Parameters:
+        - items (iterable): (url, path, checksum) per file, checksum may be None.
+
+        Returns:
+        - list: A DownloadResult per item in the order of the items, failed downloads have the status 'failed'.
+        """
+        items = list(items)
+
+        def download_item(item):
+            url, path, checksum = item
+            try:
+                return self.download(url, path, checksum)
+            except (requests.RequestException, ValueError, OSError) as e:
+                return DownloadResult(url, path, 'failed', error=str(e))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(download_item, items))
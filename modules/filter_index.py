@@ -0,0 +1,108 @@
+# Contains the filter index of the Analyse Historic Data page: precomputed bitmaps per filter value
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _normalize(value):
+    # NumPy scalars (e.g. from Series.unique) and Python values must give the same signature
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class FilterIndex:
+    """
+    Answers combinations of "column in values" filters with bitwise operations on precomputed bitmaps.
+
+    For every filter column the rows of every distinct value are stored once as a packed bitmap (one bit per
+    row). A filter ORs the bitmaps of the selected values of a column and ANDs the result over the columns,
+    so no comparison on the column values is done per filter. The row positions of recently used filter
+    combinations are kept in memory.
+
+    Parameters:
+    - df (pd.DataFrame): The data to filter.
+    - columns (list): Columns that can be filtered on.
+    - cache_size (int): Maximum number of filter combinations kept in memory.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Iterable[str], cache_size: int = 64):
+        self.df = df
+        self.size = len(df)
+        self.cache_size = cache_size
+        self._bitmaps: Dict[str, Dict[object, np.ndarray]] = {}
+        for column in columns:
+            categorical = pd.Categorical(df[column])
+            codes = categorical.codes
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(categorical.categories) + 1))
+            bitmaps = {}
+            for code, value in enumerate(categorical.categories):
+                mask = np.zeros(self.size, dtype=bool)
+                mask[order[bounds[code]:bounds[code + 1]]] = True
+                bitmaps[_normalize(value)] = np.packbits(mask)
+            self._bitmaps[column] = bitmaps
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        self._none = np.zeros_like(self._all)
+        self._cache: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def values(self, column: str) -> List:
+        """Sorted distinct values of a filter column."""
+        return list(self._bitmaps[column])
+
+    @staticmethod
+    def signature(filters: Mapping[str, Optional[Iterable]]) -> Tuple:
+        """
+        Normalized, hashable form of a filter combination: columns without a selection are dropped,
+        the order of the columns and of the selected values does not matter.
+        """
+        return tuple(sorted((column, tuple(sorted({_normalize(value) for value in values}, key=repr)))
+                            for column, values in filters.items() if values is not None))
+
+    def _compute(self, signature: Tuple) -> np.ndarray:
+        bits = self._all
+        for column, values in signature:
+            bitmaps = self._bitmaps[column]
+            selected = self._none
+            for value in values:
+                bitmap = bitmaps.get(value)
+                if bitmap is not None:
+                    selected = selected | bitmap
+            bits = bits & selected
+        return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+    def positions(self, filters: Mapping[str, Optional[Iterable]]) -> np.ndarray:
+        """
+        Row positions matching all filters.
+
+        Parameters:
+        - filters (dict): Allowed values per column. None leaves a column unfiltered, an empty selection
+          matches no rows.
+
+        Returns:
+        - np.ndarray: Ascending positions of the matching rows.
+        """
+        signature = self.signature(filters)
+        with self._lock:
+            positions = self._cache.get(signature)
+            if positions is not None:
+                self._cache.move_to_end(signature)
+                self.hits += 1
+                return positions
+
+        positions = self._compute(signature)
+        with self._lock:
+            self.misses += 1
+            self._cache[signature] = positions
+            self._cache.move_to_end(signature)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return positions
+
+    def filter(self, filters: Mapping[str, Optional[Iterable]]) -> pd.DataFrame:
+        """Rows of the data matching all filters, in their original order."""
+        return self.df.take(self.positions(filters))
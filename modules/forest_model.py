@@ -0,0 +1,278 @@
+# Contains the export of the fitted random forest into flat node arrays and the matching vectorized predictor.
+#
+# Usage (from the project root):
+#   python -m modules.forest_model [--model data/models/finalized_model.sav] [--path data/models/finalized_model_forest]
+#
+# The bundle is a directory of .npy files that are memory-mapped on load: loading reads only the file headers,
+# the node arrays are paged in on first use and shared between all processes through the page cache.
+# Every export writes a new version directory inside the bundle and then replaces the CURRENT file that names
+# it, a mapped file is never overwritten: processes with an earlier version loaded keep reading its files.
+# The bundle records the size, modification time and hash of the pickle it was exported from. A pickle saved
+# again later (e.g. from Modeling.ipynb) no longer matches, load_model then loads the pickle until it is exported.
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from config import MODEL_PATH
+
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+CHUNK_ROWS = 1024
+POINTER_FILE = 'CURRENT'
+
+
+def bundle_path(model_path: str) -> str:
+    """Location of the exported bundle of a pickled model: next to it, with a '_forest' suffix."""
+    return os.path.splitext(model_path)[0] + '_forest'
+
+
+def current_version(path: str) -> Optional[str]:
+    """
+    Directory with the arrays of the current version of a bundle, None if there is no bundle at path.
+    A bundle exported before the version directories has its arrays at the top level.
+    """
+    try:
+        with open(os.path.join(path, POINTER_FILE)) as file:
+            return os.path.join(path, file.read().strip())
+    except FileNotFoundError:
+        return path if os.path.exists(os.path.join(path, 'meta.json')) else None
+
+
+def publish_version(path: str, version: str) -> None:
+    """
+    Make a version directory written by `FlatForest.save(path, publish=False)` the current one and remove the
+    other versions. Removing only unlinks the files, processes that have them mapped keep their pages.
+    """
+    pointer = os.path.join(path, POINTER_FILE)
+    with open(pointer + '.tmp', 'w') as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(pointer + '.tmp', pointer)
+    for entry in os.listdir(path):
+        entry_path = os.path.join(path, entry)
+        if entry != version and entry.startswith('v') and os.path.isdir(entry_path):
+            shutil.rmtree(entry_path, ignore_errors=True)
+        elif entry == 'meta.json' or entry in {f'{name}.npy' for name in ARRAYS}:
+            os.remove(entry_path)
+
+
+def model_stamp(model_path: str, digest: bool = True) -> Dict:
+    """Size, modification time and (optionally) SHA-256 of a pickled model, to tell whether a bundle belongs to it."""
+    stat = os.stat(model_path)
+    stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if digest:
+        sha256 = hashlib.sha256()
+        with open(model_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                sha256.update(block)
+        stamp['sha256'] = sha256.hexdigest()
+    return stamp
+
+
+def matches_model(source: Optional[Dict], model_path: str) -> bool:
+    """
+    Whether a bundle was exported from the pickle at model_path: same size and modification time, or, for a
+    copied file with another modification time, the same SHA-256.
+    """
+    if not source:
+        return False
+    stamp = model_stamp(model_path, digest=False)
+    if stamp['size'] != source['size']:
+        return False
+    return stamp['mtime_ns'] == source['mtime_ns'] or model_stamp(model_path)['sha256'] == source['sha256']
+
+
+def retract_bundle(path: str) -> None:
+    """Remove the pointer of a bundle, load_model then falls back to the pickle until a new version is published."""
+    for name in (POINTER_FILE, 'meta.json'):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+
+
+class FlatForest:
+    """
+    A fitted sklearn forest classifier as flat node arrays, all trees concatenated.
+
+    Every node has the split feature and threshold and the global positions of its children, stored as
+    pairs (right, left) so the comparison result indexes the pair; a leaf points to itself, so walking
+    max_depth levels from the roots ends at the leaf of every tree without branching. The class probabilities
+    are stored per class and node. Like sklearn, samples are compared as float32 against float64 thresholds
+    and the tree probabilities are added up in tree order in float64, so `predict_proba` returns the same
+    probabilities as the original model.
+
+    Parameters:
+    - arrays (dict): 'feature', 'threshold', 'children' (nodes x 2), 'value' (classes x nodes) and 'roots'.
+    - classes (list): Class labels in the order of the value columns.
+    - n_features (int): Number of input features.
+    - max_depth (int): Depth of the deepest tree.
+    - feature_names (list, optional): Names of the input features in the order of the columns.
+    - source (dict, optional): model_stamp of the pickle the forest was exported from.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], classes, n_features: int, max_depth: int,
+                 feature_names: Optional[List[str]] = None, source: Optional[Dict] = None):
+        self.arrays = arrays
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = n_features
+        self.max_depth = max_depth
+        self.feature_names = list(feature_names) if feature_names is not None and len(feature_names) else None
+        self.source = source
+
+    @classmethod
+    def from_sklearn(cls, model, feature_names: Optional[List[str]] = None) -> 'FlatForest':
+        """The flat forest of a fitted forest, with the feature names it was fitted with or the given ones."""
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'value')}
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            parts['feature'].append(np.where(leaf, 0, tree.feature))
+            parts['threshold'].append(np.where(leaf, 0.0, tree.threshold))
+            parts['left'].append(np.where(leaf, nodes, tree.children_left) + offset)
+            parts['right'].append(np.where(leaf, nodes, tree.children_right) + offset)
+            value = tree.value[:, 0, :]
+            parts['value'].append(value / value.sum(axis=1, keepdims=True))
+
+        feature_dtype = np.int16 if model.n_features_in_ < 2 ** 15 else np.int32
+        arrays = {
+            'feature': np.concatenate(parts['feature']).astype(feature_dtype),
+            'threshold': np.concatenate(parts['threshold']).astype(np.float64),
+            'children': np.column_stack([np.concatenate(parts['right']),
+                                         np.concatenate(parts['left'])]).astype(np.int32),
+            'value': np.ascontiguousarray(np.concatenate(parts['value']).T, dtype=np.float64),
+            'roots': offsets[:-1].astype(np.int32),
+        }
+        if feature_names is None:
+            feature_names = getattr(model, 'feature_names_in_', None)
+        return cls(arrays, model.classes_, model.n_features_in_, max(tree.max_depth for tree in trees), feature_names)
+
+    def save(self, path: str, publish: bool = True) -> str:
+        """
+        Write the arrays to a new version directory of the bundle at path.
+
+        Parameters:
+        - path (str): Directory of the bundle.
+        - publish (bool): Make the new version the current one, otherwise call publish_version later.
+
+        Returns:
+        - str: Name of the version directory.
+        """
+        version = f'v{time.time_ns():x}'
+        directory = os.path.join(path, version)
+        os.makedirs(directory)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), self.arrays[name])
+        with open(os.path.join(directory, 'meta.json'), 'w') as file:
+            json.dump({'classes': self.classes_.tolist(), 'n_features': self.n_features_in_,
+                       'max_depth': self.max_depth, 'feature_names': self.feature_names, 'source': self.source},
+                      file)
+        if publish:
+            publish_version(path, version)
+        return version
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'FlatForest':
+        directory = current_version(path)
+        if directory is None:
+            raise FileNotFoundError(f"No flat forest has been exported to {path}.")
+        with open(os.path.join(directory, 'meta.json')) as file:
+            meta = json.load(file)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                  for name in ARRAYS}
+        return cls(arrays, meta['classes'], meta['n_features'], meta['max_depth'], meta.get('feature_names'),
+                   meta.get('source'))
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf of every sample in every tree: shape (samples, trees)."""
+        feature, threshold = self.arrays['feature'], self.arrays['threshold']
+        children = self.arrays['children'].reshape(-1)
+        rows = np.arange(len(X), dtype=np.int32)[:, None] * X.shape[1]
+        values = X.ravel()
+        nodes = np.broadcast_to(self.arrays['roots'], (len(X), len(self.arrays['roots'])))
+        for _ in range(self.max_depth):
+            go_left = values.take(rows + feature.take(nodes)) <= threshold.take(nodes)
+            nodes = children.take(nodes * 2 + go_left)
+        return nodes
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Class probabilities, the mean of the leaf probabilities of all trees.
+
+        Parameters:
+        - X (array-like or scipy.sparse matrix): Samples of shape (samples, n_features), e.g. the transformed
+          model inputs.
+
+        Returns:
+        - np.ndarray: Probabilities of shape (samples, classes).
+        """
+        is_sparse = sparse.issparse(X)
+        X = sparse.csr_matrix(X, dtype=np.float32) if is_sparse else np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, the forest expects {self.n_features_in_} features.")
+        value = self.arrays['value']
+        probabilities = np.empty((X.shape[0], len(value)))
+        # In chunks, the node positions of all trees are held per sample; sparse rows are densified per chunk
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            leaves = self._leaves(chunk.toarray() if is_sparse else chunk)
+            for i, class_value in enumerate(value):
+                # A running sum adds the trees in the order of sklearn, a pairwise sum would differ in the last bit
+                total = np.cumsum(class_value.take(leaves), axis=1)[:, -1]
+                probabilities[start:start + CHUNK_ROWS, i] = total / leaves.shape[1]
+        return probabilities
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+
+def export_model(model_path: str = MODEL_PATH, path: str = None) -> str:
+    """
+    Export a pickled forest classifier to a flat bundle.
+
+    Returns:
+    - str: The directory of the bundle.
+    """
+    path = path or bundle_path(model_path)
+    with open(model_path, 'rb') as file:
+        forest = FlatForest.from_sklearn(pickle.load(file))
+    forest.source = model_stamp(model_path)
+    forest.save(path)
+    return path
+
+
+def load_model(path: str = MODEL_PATH):
+    """
+    Load the model at path, from its exported bundle if there is one that was exported from this pickle, and
+    from the pickle otherwise. A bundle without a pickle next to it is loaded as is.
+    """
+    if os.path.isdir(path):
+        return FlatForest.load(path)
+    if current_version(bundle_path(path)) is not None:
+        forest = FlatForest.load(bundle_path(path))
+        if not os.path.exists(path) or matches_model(forest.source, path):
+            return forest
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export the pickled random forest to flat node arrays.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Pickled forest classifier.")
+    parser.add_argument('--path', help="Output directory, defaults to the model path with a '_forest' suffix.")
+    args = parser.parse_args(argv)
+
+    path = export_model(args.model, args.path)
+    print(f"Flat forest saved at {path}.")
+
+
+if __name__ == '__main__':
+    main()
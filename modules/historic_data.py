@@ -0,0 +1,157 @@
+# Contains the offline build step and the loader for the columnar historic accident dataset used by the
+# Analyse Historic Data page.
+#
+# Build the artifact after Data Merging.ipynb has written historic_data.csv (from the project root):
+#   python -m modules.historic_data
+# The incremental refresh (modules/incremental_refresh.py) replaces only the months it merged again.
+import os
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from config import HISTORIC_DATA_PATH, HISTORIC_DATASET_PATH
+from modules.utils import convert_lv95_to_wgs84, translate_columns
+
+# Columns used by the Analyse Historic Data page
+PAGE_COLUMNS = [
+    'year', 'month', 'hour', 'WeekdayDesc', 'AccidentTypeDesc', 'AccidentSeverityDesc', 'RoadTypeDesc',
+    'AccidentInvolvingPedestrian', 'AccidentInvolvingBicycle', 'AccidentInvolvingMotorcycle', 'lat', 'lon',
+]
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast numeric columns and store text columns as categoricals.
+
+    Coordinates keep float64, all other float columns are stored as float32.
+    """
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            if column not in ('x', 'y', 'lat', 'lon'):
+                df[column] = series.astype('float32')
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            df[column] = series.astype('category')
+    return df
+
+
+def build_historic_dataset(csv_path: str = HISTORIC_DATA_PATH, output_path: str = HISTORIC_DATASET_PATH) -> str:
+    """
+    Build the historic dataset artifact: descriptive labels, WGS84 coordinates and compact dtypes.
+
+    The artifact is an uncompressed Feather (Arrow IPC) file, so it can be memory-mapped and single
+    columns can be read without touching the rest of the file.
+
+    Parameters:
+    - csv_path (str): The merged historic dataset written by Data Merging.ipynb.
+    - output_path (str): Location of the artifact.
+
+    Returns:
+    - str: The path of the artifact.
+    """
+    return write_historic_dataset(pd.read_csv(csv_path), output_path)
+
+
+def write_historic_dataset(df: pd.DataFrame, output_path: str = HISTORIC_DATASET_PATH) -> str:
+    """
+    Write the merged historic dataset as the artifact of the Analyse Historic Data page, see build_historic_dataset.
+    The input frame is left unchanged.
+
+    Returns:
+    - str: The path of the artifact.
+    """
+    return _write_artifact(prepare_rows(df), output_path)
+
+
+def prepare_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Merged rows in the format of the artifact: descriptive labels, WGS84 coordinates and compact dtypes."""
+    df = translate_columns(df.copy(deep=False))
+    df = convert_lv95_to_wgs84(df)
+    return optimize_dtypes(df)
+
+
+def _write_artifact(df: pd.DataFrame, output_path: str) -> str:
+    # The page memory-maps the artifact: write a new file and swap it in instead of overwriting the mapped one
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+    feather.write_feather(df, temp_path, compression='uncompressed')
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def _month_keys(df: pd.DataFrame) -> np.ndarray:
+    return df['year'].to_numpy(dtype=np.int64) * 12 + df['month'].to_numpy(dtype=np.int64) - 1
+
+
+def update_historic_dataset(df: pd.DataFrame, periods: Sequence[str],
+                            output_path: str = HISTORIC_DATASET_PATH) -> str:
+    """
+    Replace some months of the artifact, only their rows are translated and projected. The rows of the other
+    months are taken from the artifact as they are, the months stay in order.
+
+    Parameters:
+    - df (pd.DataFrame): The merged rows of the months.
+    - periods (list): The 'YYYY-MM' months to replace, months without rows in df are removed.
+    - output_path (str): Location of the artifact, written from df alone if it does not exist yet.
+
+    Returns:
+    - str: The path of the artifact.
+    """
+    if not os.path.exists(output_path):
+        return write_historic_dataset(df, output_path)
+    existing = feather.read_table(output_path, memory_map=True).to_pandas()
+    keys = [int(period[:4]) * 12 + int(period[5:7]) - 1 for period in periods]
+    existing = existing[~np.isin(_month_keys(existing), keys)]
+    months = prepare_rows(df).reindex(columns=existing.columns)
+    # Categoricals only stay categorical in the concatenation with the same categories on both sides
+    for column in existing.columns:
+        if isinstance(existing[column].dtype, pd.CategoricalDtype):
+            categories = existing[column].cat.categories.union(pd.Index(months[column].dropna().unique()),
+                                                               sort=False)
+            existing[column] = existing[column].cat.set_categories(categories)
+            months[column] = months[column].astype(pd.CategoricalDtype(categories))
+    combined = pd.concat([existing, months], ignore_index=True)
+    order = _month_keys(combined)
+    if (order[1:] < order[:-1]).any():
+        combined = combined.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    return _write_artifact(combined, output_path)
+
+
+def ensure_historic_dataset(csv_path: str = HISTORIC_DATA_PATH, output_path: str = HISTORIC_DATASET_PATH) -> float:
+    """
+    Build the historic dataset artifact if it is missing or older than the merged CSV (a new notebook run).
+
+    Returns:
+    - float: Modification time of the artifact, changes whenever the artifact is rebuilt.
+    """
+    if not os.path.exists(output_path) or (
+            os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(output_path)):
+        build_historic_dataset(csv_path, output_path)
+    return os.path.getmtime(output_path)
+
+
+def load_historic_dataset(columns: Optional[List[str]] = None, path: str = HISTORIC_DATASET_PATH) -> pd.DataFrame:
+    """
+    Load columns of the historic dataset artifact through a memory map.
+
+    Parameters:
+    - columns (list, optional): Columns to load. Defaults to the columns used by the Analyse Historic Data page.
+    - path (str): Location of the artifact.
+
+    Returns:
+    - pd.DataFrame: The requested columns.
+    """
+    table = feather.read_table(path, columns=columns or PAGE_COLUMNS, memory_map=True)
+    return table.to_pandas()
+
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    print(f"Historic dataset saved at {build_historic_dataset()} ({time.perf_counter() - start_time:.1f} s).")
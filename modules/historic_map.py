@@ -0,0 +1,255 @@
+# Contains the server-side aggregation of accidents for the map of the Analyse Historic Data page.
+# Instead of one folium marker per accident the points are binned into a grid whose cells cover a fixed
+# number of screen pixels at the current zoom, so the size of the map does not grow with the number of accidents.
+import json
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import HeatMap, MarkerCluster
+from jinja2 import Template
+
+# Width of a web map tile in pixels
+TILE_SIZE = 256
+# Leaflet.heat options of HeatMapPayload: those of the heatmap folium's HeatMap drew before, with its minOpacity default
+HEATMAP_OPTIONS = {
+    'minOpacity': 0.5,
+    'radius': 10,
+    'blur': 15,
+    'maxZoom': 1,
+    'gradient': {0.2: 'blue', 0.4: 'lime', 0.6: 'yellow', 0.8: 'orange', 1.0: 'red'},
+}
+
+
+def cell_size(zoom: float, latitude: float, cell_pixels: float) -> tuple:
+    """
+    Size of a grid cell in degrees that covers about cell_pixels x cell_pixels on screen.
+
+    Parameters:
+    - zoom (float): Zoom level of the map.
+    - latitude (float): Latitude the cells are made square at, Web Mercator stretches latitudes by 1/cos(lat).
+    - cell_pixels (float): Width of a cell on screen in pixels.
+
+    Returns:
+    - tuple: (lat_size, lon_size) in degrees.
+    """
+    lon_size = 360 / 2 ** zoom * cell_pixels / TILE_SIZE
+    return lon_size * np.cos(np.radians(latitude)), lon_size
+
+
+def aggregate_points(lat, lon, codes, n_codes: int, lat_size: float, lon_size: float) -> Dict[str, np.ndarray]:
+    """
+    Bin points into a regular grid.
+
+    Parameters:
+    - lat, lon (np.ndarray): WGS84 coordinates of the points.
+    - codes (np.ndarray): Integer category of every point in [0, n_codes).
+    - n_codes (int): Number of categories.
+    - lat_size, lon_size (float): Size of a cell in degrees.
+
+    Returns:
+    - dict: Per non-empty cell the centroid 'lat' and 'lon' of its points, the 'count' of points and the
+      'breakdown' of the count per category (cells x n_codes).
+    """
+    if len(lat) == 0:
+        return {'lat': np.empty(0), 'lon': np.empty(0), 'count': np.empty(0, dtype=np.int64),
+                'breakdown': np.empty((0, n_codes), dtype=np.int64)}
+
+    row = np.floor(lat / lat_size).astype(np.int64)
+    col = np.floor(lon / lon_size).astype(np.int64)
+    col_min = col.min()
+    keys = (row - row.min()) * (col.max() - col_min + 1) + (col - col_min)
+    cells, inverse = np.unique(keys, return_inverse=True)
+
+    count = np.bincount(inverse)
+    breakdown = np.bincount(inverse * n_codes + codes, minlength=len(cells) * n_codes).reshape(len(cells), n_codes)
+    return {
+        'lat': np.bincount(inverse, weights=lat) / count,
+        'lon': np.bincount(inverse, weights=lon) / count,
+        'count': count,
+        'breakdown': breakdown,
+    }
+
+
+def aggregate_accidents(data: pd.DataFrame, zoom: float, categories: Sequence[str], cell_pixels: float = 48,
+                        column: str = 'AccidentSeverityDesc') -> pd.DataFrame:
+    """
+    Aggregate accidents into grid cells with their count per category.
+
+    Parameters:
+    - data (pd.DataFrame): Accidents with 'lat', 'lon' and the category column.
+    - zoom (float): Zoom level of the map.
+    - categories (list): Categories to count, values not in the list are counted as 'Unknown'.
+    - cell_pixels (float): Width of a cell on screen in pixels.
+    - column (str): Column holding the category of every accident.
+
+    Returns:
+    - pd.DataFrame: One row per non-empty cell with 'lat', 'lon', 'count' and one count column per category.
+    """
+    data = data.dropna(subset=['lat', 'lon'])
+    codes = pd.Categorical(data[column], categories=categories).codes.astype(np.int64)
+    n_codes = len(categories) + 1
+    codes[codes < 0] = n_codes - 1
+
+    lat = data['lat'].to_numpy(dtype=np.float64)
+    lon = data['lon'].to_numpy(dtype=np.float64)
+    lat_size, lon_size = cell_size(zoom, float(lat.mean()) if len(lat) else 0.0, cell_pixels)
+    cells = aggregate_points(lat, lon, codes, n_codes, lat_size, lon_size)
+
+    df = pd.DataFrame({'lat': cells['lat'], 'lon': cells['lon'], 'count': cells['count']})
+    df[list(categories) + ['Unknown']] = cells['breakdown']
+    return df
+
+
+def heatmap_points(data: pd.DataFrame, zoom: float, cell_pixels: float = 4) -> List[List[float]]:
+    """
+    Weighted heatmap points, one per cell of a few pixels.
+
+    Leaflet.heat sums the intensities of the points that fall into the same cell of radius / 2 pixels,
+    so weighting the cells with their count draws the same heatmap as sending every accident.
+
+    Returns:
+    - list: [lat, lon, count] per non-empty cell.
+    """
+    cells = aggregate_accidents(data, zoom, [], cell_pixels=cell_pixels)
+    return cells[['lat', 'lon', 'count']].to_numpy().tolist()
+
+
+def _feature_collection(lat, lon, properties: Dict[str, list]) -> bytes:
+    keys = list(properties)
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, y]}, 'properties': dict(zip(keys, values))}
+        for x, y, *values in zip(np.asarray(lon, dtype=np.float64).tolist(), np.asarray(lat, dtype=np.float64).tolist(),
+                                 *properties.values())
+    ]
+    payload = json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+    # The payload is inserted into a <script> block, a closing tag in a popup must not end it
+    return payload.replace('</', '<\\/').encode()
+
+
+def marker_payload(data: pd.DataFrame, color_mapping: Dict[str, str]) -> bytes:
+    """
+    GeoJSON of one circle marker per accident, with the popup of the accident details.
+
+    Parameters:
+    - data (pd.DataFrame): Accidents with 'lat', 'lon' and the descriptive columns shown in the popup.
+    - color_mapping (dict): Color of every severity.
+
+    Returns:
+    - bytes: The serialized FeatureCollection.
+    """
+    data = data.dropna(subset=['lat', 'lon'])
+    severity = data['AccidentSeverityDesc'].astype(object)
+    popups = [
+        f"<b>Accident Type:</b> {accident_type}<br><b>Severity:</b> {severity_desc}<br>"
+        f"<b>Road Type:</b> {road_type}<br><b>Date:</b> {year}-{month} (Weekday: {weekday})<br>"
+        f"<b>Time:</b> {hour}:00<br>"
+        for accident_type, severity_desc, road_type, year, month, weekday, hour in zip(
+            data['AccidentTypeDesc'], severity, data['RoadTypeDesc'], data['year'], data['month'],
+            data['WeekdayDesc'], data['hour'])
+    ]
+    return _feature_collection(data['lat'], data['lon'], {
+        'color': [color_mapping.get(value, 'gray') for value in severity],
+        'radius': [5] * len(data),
+        'popup': popups,
+    })
+
+
+def cell_payload(cells: pd.DataFrame, color_mapping: Dict[str, str]) -> bytes:
+    """
+    GeoJSON of one marker per cell, sized by its number of accidents and colored by its most severe category.
+
+    Parameters:
+    - cells (pd.DataFrame): Output of aggregate_accidents, categories ordered from most to least severe.
+    - color_mapping (dict): Color of every category.
+
+    Returns:
+    - bytes: The serialized FeatureCollection.
+    """
+    categories: List[str] = [column for column in cells.columns if column not in ('lat', 'lon', 'count')]
+    breakdown = cells[categories].to_numpy()
+    top_category = np.argmax(breakdown > 0, axis=1)
+    counts = cells['count'].tolist()
+    return _feature_collection(cells['lat'], cells['lon'], {
+        'color': [color_mapping.get(categories[i], 'gray') for i in top_category],
+        'radius': (6 + 4 * np.log10(cells['count'].to_numpy())).tolist(),
+        'popup': [f"<b>Accidents:</b> {count}<br>" + ''.join(f"{category}: {n}<br>"
+                                                           for category, n in zip(categories, row) if n)
+                  for count, row in zip(counts, breakdown.tolist())],
+        'tooltip': [f"{count} accidents" for count in counts],
+    })
+
+
+def heatmap_payload(data: pd.DataFrame, zoom: float) -> bytes:
+    """The weighted heatmap points of heatmap_points, serialized."""
+    return json.dumps(heatmap_points(data, zoom), separators=(',', ':')).encode()
+
+
+class GeoJsonPayload(JSCSSMixin, Layer):
+    """
+    Circle markers from a serialized FeatureCollection (marker_payload, cell_payload), inserted into the map
+    as is. Every feature carries its 'color', 'radius', 'popup' and optional 'tooltip'.
+
+    Parameters:
+    - payload (bytes): The serialized FeatureCollection.
+    - name (str): Name of the layer.
+    - cluster (bool): Group the markers with Leaflet.markercluster, like folium's MarkerCluster.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_features = L.geoJson({{ this.payload }}, {
+                pointToLayer: function (feature, latlng) {
+                    var properties = feature.properties;
+                    var marker = L.circleMarker(latlng, {
+                        radius: properties.radius, color: properties.color, fill: true,
+                        fillColor: properties.color, fillOpacity: 0.7
+                    }).bindPopup(properties.popup, {maxWidth: 300});
+                    if (properties.tooltip) {
+                        marker.bindTooltip(properties.tooltip);
+                    }
+                    return marker;
+                }
+            });
+            {% if this.cluster %}
+            var {{ this.get_name() }} = L.markerClusterGroup().addLayer({{ this.get_name() }}_features);
+            {% else %}
+            var {{ this.get_name() }} = {{ this.get_name() }}_features;
+            {% endif %}
+        {% endmacro %}
+    """)
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, payload: bytes, name: str, cluster: bool = False):
+        super().__init__(name=name, overlay=True)
+        self._name = 'GeoJsonPayload'
+        self.payload = payload.decode()
+        self.cluster = cluster
+
+
+class HeatMapPayload(JSCSSMixin, Layer):
+    """
+    Leaflet.heat layer from serialized [lat, lon, weight] points (heatmap_payload), inserted into the map as is.
+
+    Parameters:
+    - payload (bytes): The serialized points.
+    - name (str): Name of the layer.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.heatLayer({{ this.payload }}, {{ this.options }});
+        {% endmacro %}
+    """)
+
+    default_js = HeatMap.default_js
+
+    def __init__(self, payload: bytes, name: str = 'Heatmap'):
+        super().__init__(name=name, overlay=True)
+        self._name = 'HeatMapPayload'
+        self.payload = payload.decode()
+        self.options = json.dumps(HEATMAP_OPTIONS)
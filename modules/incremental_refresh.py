@@ -0,0 +1,463 @@
+# Contains the incremental refresh of the merged accident dataset (historic_data.csv, merged.csv, locations.csv).
+#
+# Usage (from the project root):
+#   python -m modules.incremental_refresh [--bootstrap] [--ingest-traffic 2024] [--fetch-weather]
+#
+# The merged accidents are kept in a Parquet dataset with one partition per month (data/clean/merged_data). A
+# refresh only cleans and merges the months whose accident rows changed, plus the months that were merged before
+# every source covered them once one of the sources moves on. The high-water marks of the sources (last hour of
+# traffic, pedestrian and weather data) and a hash of the accident rows per month are kept in
+# data/clean/refresh_state.json. The exported CSV files get the rows of new months appended and the artifact of the
+# Analyse Historic Data page gets the processed months replaced, the store is only read in full to rewrite the CSV
+# files after older months changed.
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import (DATA_PATH, HISTORIC_DATA_PATH, HISTORIC_DATASET_PATH, LOCATIONS_PATH, MERGED_DATASET_PATH,
+                    REFRESH_STATE_PATH)
+from modules.cleaning import PEDESTRIAN_COUNTS, clean_accidents, clean_pedestrian_data, clean_traffic_data
+from modules.historic_data import update_historic_dataset, write_historic_dataset
+from modules.station_volume import assign_closest_volume
+from modules.traffic_ingestion import TRAFFIC_DATASET_PATH, ingest_traffic_data, load_traffic_data
+from modules.utils import WEATHER_FEATURES, assign_weather, convert_lv95_to_wgs84
+from modules.weather_backfill import WEATHER_PARTS_PATH, backfill_weather, deduplicate_hours, last_hours
+
+RAW_ACCIDENTS_PATH = os.path.join(DATA_PATH, "raw", "RoadTrafficAccidentLocations.csv")
+RAW_PEDESTRIAN_PATH = os.path.join(DATA_PATH, "raw", "{year}_verkehrszaehlungen_werte_fussgaenger_velo.csv")
+MERGED_CSV_PATH = os.path.join(DATA_PATH, "clean", "merged.csv")
+FIRST_PERIOD = '2012-01'
+SOURCES = ('traffic', 'pedestrian', 'weather')
+
+# Features of the merge, as in Data Merging.ipynb
+NUMBER_OF_STATIONS = 3
+VOLUME_PERIODS = 2
+WEATHER_PERIODS = 4
+
+PARTITIONING = ds.partitioning(pa.schema([('period', pa.string())]), flavor='hive')
+VOLUME_COLUMNS = ['ID', 'x', 'y', 'dateTime', 'volume']
+
+
+def period_bounds(period: str):
+    """First and last hour of a 'YYYY-MM' month."""
+    start = pd.Timestamp(f'{period}-01')
+    return start, start + pd.offsets.MonthBegin(1) - pd.Timedelta(hours=1)
+
+
+def month_runs(periods: Sequence[str]) -> List[List[str]]:
+    """Split sorted 'YYYY-MM' months into runs of consecutive months."""
+    runs = []
+    for period in periods:
+        if runs and pd.Period(runs[-1][-1], 'M') + 1 == pd.Period(period, 'M'):
+            runs[-1].append(period)
+        else:
+            runs.append([period])
+    return runs
+
+
+def load_state(path: str = REFRESH_STATE_PATH) -> Dict:
+    """The state of the last refresh, empty if there was none."""
+    if not os.path.exists(path):
+        return {'complete': None, 'sources': {}, 'hashes': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(state: Dict, path: str = REFRESH_STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Write to a temporary file first so an interrupted refresh never leaves a partial state behind
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+# --- High-water marks of the sources ---
+
+def pedestrian_years(path_pattern: str = RAW_PEDESTRIAN_PATH) -> List[int]:
+    return [year for year in range(int(FIRST_PERIOD[:4]), pd.Timestamp.now().year + 1)
+            if os.path.exists(path_pattern.format(year=year))]
+
+
+def traffic_mark(path: str = TRAFFIC_DATASET_PATH) -> Optional[pd.Timestamp]:
+    """Last hour of the traffic dataset, read from the partition of its last year only."""
+    years = [int(name.split('=')[1]) for name in os.listdir(path) if name.startswith('year=')] \
+        if os.path.isdir(path) else []
+    if not years:
+        return None
+    times = load_traffic_data(start=f'{max(years)}-01-01', columns=['MessungDatZeit'], path=path)['MessungDatZeit']
+    return times.max() if len(times) else None
+
+
+def pedestrian_mark(path_pattern: str = RAW_PEDESTRIAN_PATH) -> Optional[pd.Timestamp]:
+    """Last count of the newest yearly pedestrian file."""
+    years = pedestrian_years(path_pattern)
+    if not years:
+        return None
+    table = csv.read_csv(path_pattern.format(year=years[-1]),
+                         convert_options=csv.ConvertOptions(include_columns=['DATUM'],
+                                                            column_types={'DATUM': pa.string()}))
+    return pd.Timestamp(pc.max(table['DATUM']).as_py()) if len(table) else None
+
+
+def weather_parts(path: str = WEATHER_PARTS_PATH) -> List[tuple]:
+    """(start_date, end_date, file) of the Parquet parts written by the weather backfill, sorted by start."""
+    if not os.path.isdir(path):
+        return []
+    parts = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.parquet'):
+            start_date, end_date = name[:-len('.parquet')].split('_')
+            parts.append((start_date, end_date, os.path.join(path, name)))
+    return parts
+
+
+def weather_mark(path: str = WEATHER_PARTS_PATH) -> Optional[pd.Timestamp]:
+    """
+    Last hour with weather values in the parts. The archive lags a few days behind, the hours of a window fetched
+    before they were in the archive are empty and do not count. The last hour of every part is kept in the index
+    of the backfill, only parts written since the last call are read.
+    """
+    hours = [last for last in last_hours(path).values() if last is not None]
+    return max(hours) if hours else None
+
+
+def source_marks(traffic_path: str = TRAFFIC_DATASET_PATH, pedestrian_pattern: str = RAW_PEDESTRIAN_PATH,
+                 weather_path: str = WEATHER_PARTS_PATH) -> Dict[str, Optional[str]]:
+    """The high-water mark of every source as ISO string, None for a source without data."""
+    marks = {'traffic': traffic_mark(traffic_path), 'pedestrian': pedestrian_mark(pedestrian_pattern),
+             'weather': weather_mark(weather_path)}
+    return {name: mark.isoformat() if mark is not None else None for name, mark in marks.items()}
+
+
+# --- Sources of a run of months ---
+
+def read_traffic(start: pd.Timestamp, end: pd.Timestamp, path: str = TRAFFIC_DATASET_PATH,
+                 excluded_stations: Sequence[str] = ()) -> pd.DataFrame:
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=VOLUME_COLUMNS)
+    traffic = load_traffic_data(start=start, end=end, path=path,
+                                columns=['MSID', 'EKoord', 'NKoord', 'MessungDatZeit', 'AnzFahrzeuge'])
+    return clean_traffic_data(traffic, excluded_stations)
+
+
+def read_pedestrian(start: pd.Timestamp, end: pd.Timestamp, path_pattern: str = RAW_PEDESTRIAN_PATH) -> pd.DataFrame:
+    tables = []
+    # DATUM is compared as ISO string, it is only parsed for the rows of the window
+    first, after = start.strftime('%Y-%m-%dT%H:%M'), (end + pd.Timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M')
+    for year in range(start.year, end.year + 1):
+        file_path = path_pattern.format(year=year)
+        if not os.path.exists(file_path):
+            continue
+        table = csv.read_csv(file_path, convert_options=csv.ConvertOptions(
+            include_columns=['FK_STANDORT', 'OST', 'NORD', 'DATUM'] + PEDESTRIAN_COUNTS,
+            column_types={'DATUM': pa.string()}))
+        in_window = pc.and_(pc.greater_equal(table['DATUM'], first), pc.less(table['DATUM'], after))
+        tables.append(table.filter(in_window))
+    if not tables:
+        return pd.DataFrame(columns=VOLUME_COLUMNS)
+    return clean_pedestrian_data(pa.concat_tables(tables).to_pandas())
+
+
+def read_weather(start: pd.Timestamp, end: pd.Timestamp, path: str = WEATHER_PARTS_PATH) -> pd.DataFrame:
+    first_day, last_day = start.date().isoformat(), end.date().isoformat()
+    files = [file for start_date, end_date, file in weather_parts(path) if start_date <= last_day and end_date >= first_day]
+    if not files:
+        return pd.DataFrame(columns=['dateTime'] + WEATHER_FEATURES)
+    weather = deduplicate_hours(pa.concat_tables([pq.read_table(file) for file in files]).to_pandas())
+    weather = weather[(weather['time'] >= start) & (weather['time'] <= end)]
+    return weather.rename(columns={'time': 'dateTime'})
+
+
+def merge_accidents(accidents: pd.DataFrame, traffic: pd.DataFrame, pedestrian: pd.DataFrame,
+                    weather: pd.DataFrame) -> pd.DataFrame:
+    """
+    The merge of Data Merging.ipynb: volumes of the closest stations and weather of the previous hours, 0 where
+    there is no data.
+    """
+    merged = accidents
+    for name, volume in (('traffic', traffic), ('pedestrian', pedestrian)):
+        merged = assign_closest_volume(merged, volume, name, NUMBER_OF_STATIONS, VOLUME_PERIODS)
+        columns = [f'{name}_volume_{s}_period_{p}' for p in range(VOLUME_PERIODS) for s in range(NUMBER_OF_STATIONS)]
+        merged[columns] = merged[columns].fillna(0)
+    merged = assign_weather(merged, weather, WEATHER_PERIODS, WEATHER_FEATURES)
+    columns = [f'{feature}_period_{p}' for p in range(WEATHER_PERIODS) for feature in WEATHER_FEATURES]
+    merged[columns] = merged[columns].fillna(0)
+    return merged
+
+
+def process_months(raw: pd.DataFrame, periods: Sequence[str], seed: Optional[int] = 42,
+                   traffic_path: str = TRAFFIC_DATASET_PATH, pedestrian_pattern: str = RAW_PEDESTRIAN_PATH,
+                   weather_path: str = WEATHER_PARTS_PATH, excluded_stations: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    Clean and merge the raw accidents of some months.
+
+    The months are processed in runs of consecutive months, every run reads its sources only for its own hours
+    (and the earlier hours of the period features).
+
+    Parameters:
+    - raw (pd.DataFrame): Rows of RoadTrafficAccidentLocations.csv in file order with a 'period' column.
+    - periods (list): The 'YYYY-MM' months to process.
+
+    Returns:
+    - pd.DataFrame: The merged accidents of the months, with the 'period' column.
+    """
+    merged = []
+    for run in month_runs(sorted(periods)):
+        start, end = period_bounds(run[0])[0], period_bounds(run[-1])[1]
+        accidents = clean_accidents(raw[raw['period'].isin(run)], seed=seed)
+        volume_start = start - pd.Timedelta(hours=VOLUME_PERIODS - 1)
+        traffic = read_traffic(volume_start, end, traffic_path, excluded_stations)
+        pedestrian = read_pedestrian(volume_start, end, pedestrian_pattern)
+        weather = read_weather(start - pd.Timedelta(hours=WEATHER_PERIODS - 1), end, weather_path)
+        merged.append(merge_accidents(accidents, traffic, pedestrian, weather))
+    return pd.concat(merged, ignore_index=True)
+
+
+# --- Partitioned store ---
+
+def write_months(df: pd.DataFrame, path: str = MERGED_DATASET_PATH) -> None:
+    """Write merged accidents to the store, replacing the partitions of their months."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if os.path.isdir(path) and os.listdir(path):
+        # Months merged later keep the column types of the existing months
+        schema = ds.dataset(path, format='parquet', partitioning=PARTITIONING).schema
+        table = table.select(schema.names).cast(schema)
+    ds.write_dataset(table, path, format='parquet', partitioning=PARTITIONING,
+                     existing_data_behavior='delete_matching', basename_template='part-{i}.parquet')
+
+
+def load_merged_data(path: str = MERGED_DATASET_PATH, periods: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Months of the store in month order, within a month in the order of the raw data.
+
+    Parameters:
+    - path (str): Directory of the store.
+    - periods (list, optional): The 'YYYY-MM' months to load, all months by default.
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    table = dataset.to_table(filter=pc.field('period').isin(list(periods)) if periods is not None else None)
+    table = table.take(pc.sort_indices(table['period']))
+    return table.drop_columns(['period']).to_pandas()
+
+
+def export_merged_data(months: pd.DataFrame, periods: Sequence[str], store_path: str = MERGED_DATASET_PATH,
+                       append: bool = False, csv_paths: Sequence[str] = (MERGED_CSV_PATH, HISTORIC_DATA_PATH),
+                       dataset_path: Optional[str] = HISTORIC_DATASET_PATH,
+                       locations_path: str = LOCATIONS_PATH) -> None:
+    """
+    Write the consumers of the merged dataset: the CSV files of Data Merging.ipynb, the artifact of the
+    Analyse Historic Data page and the locations of the road type lookup (as Data Processing.ipynb does).
+
+    Parameters:
+    - months (pd.DataFrame): The merged rows of the processed months, as written to the store.
+    - periods (list): The processed 'YYYY-MM' months, they are replaced in the artifact.
+    - store_path (str): Directory of the store, with the processed months written already.
+    - append (bool): The months come after the months already in the files. Their rows are appended to the CSV
+      files and locations.csv, otherwise the files are rewritten from the whole store. Writing the CSV files
+      takes most of the time of an export.
+    """
+    df = None
+    if append:
+        # Rows of months written later keep the column order of the store
+        columns = [name for name in ds.dataset(store_path, format='parquet', partitioning=PARTITIONING).schema.names
+                   if name != 'period']
+        new = months[columns]
+        for csv_path in csv_paths:
+            new.to_csv(csv_path, mode='a', header=False, index=False)
+        convert_lv95_to_wgs84(new[['x', 'y', 'RoadType']]).to_csv(locations_path, mode='a', header=False, index=False)
+    else:
+        df = load_merged_data(store_path)
+        df.to_csv(csv_paths[0], index=False)
+        for csv_path in csv_paths[1:]:
+            shutil.copyfile(csv_paths[0], csv_path)
+        convert_lv95_to_wgs84(df[['x', 'y', 'RoadType']]).to_csv(locations_path, index=False)
+    if dataset_path is None:
+        return
+    if os.path.exists(dataset_path):
+        update_historic_dataset(months, periods, dataset_path)
+    else:
+        write_historic_dataset(df if df is not None else load_merged_data(store_path), dataset_path)
+
+
+def truncate_exports(offsets: Dict[str, int]) -> None:
+    """Cut the exported files back to their size before an append that was interrupted."""
+    for path, size in offsets.items():
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, 'r+b') as file:
+                file.truncate(size)
+
+
+# --- Refresh ---
+
+def read_raw_accidents(path: str = RAW_ACCIDENTS_PATH) -> pd.DataFrame:
+    raw = pd.read_csv(path)
+    raw['period'] = (raw['AccidentYear'].astype(str) + '-' + raw['AccidentMonth'].astype(int).map('{:02d}'.format))
+    return raw[raw['period'] >= FIRST_PERIOD]
+
+
+def month_hashes(raw: pd.DataFrame) -> Dict[str, str]:
+    """A hash of the raw accident rows of every month, in file order, so corrected values change it too."""
+    rows = pd.util.hash_pandas_object(raw.drop(columns='period'), index=False).to_numpy()
+    return {period: hashlib.sha1(rows[positions].tobytes()).hexdigest()
+            for period, positions in raw.groupby('period').indices.items()}
+
+
+def complete_mark(periods: Sequence[str], marks: Dict[str, Optional[str]]) -> Optional[str]:
+    """The last month that every source covers up to its last hour."""
+    if any(marks.get(name) is None for name in SOURCES):
+        return None
+    covered_until = min(pd.Timestamp(marks[name]) for name in SOURCES)
+    covered = [period for period in periods if period_bounds(period)[1] <= covered_until]
+    return max(covered) if covered else None
+
+
+def _save_refresh_state(path: str, hashes: Dict[str, str], marks: Dict[str, Optional[str]],
+                        exported: Optional[str]) -> None:
+    save_state({'complete': complete_mark(list(hashes), marks), 'exported': exported, 'sources': marks,
+                'hashes': dict(sorted(hashes.items())),
+                'refreshed_at': pd.Timestamp.now().isoformat(timespec='seconds')}, path)
+
+
+def refresh(
+    raw_path: str = RAW_ACCIDENTS_PATH,
+    store_path: str = MERGED_DATASET_PATH,
+    state_path: str = REFRESH_STATE_PATH,
+    traffic_path: str = TRAFFIC_DATASET_PATH,
+    pedestrian_pattern: str = RAW_PEDESTRIAN_PATH,
+    weather_path: str = WEATHER_PARTS_PATH,
+    excluded_stations: Sequence[str] = (),
+    export: bool = True,
+    csv_paths: Sequence[str] = (MERGED_CSV_PATH, HISTORIC_DATA_PATH),
+    dataset_path: Optional[str] = HISTORIC_DATASET_PATH,
+    locations_path: str = LOCATIONS_PATH,
+) -> List[str]:
+    """
+    Bring the merged dataset up to date with the raw accidents and the sources.
+
+    A month is processed if the hash of its raw accident rows differs from the last refresh (new months, late
+    reports and corrections), and, once a source has moved on since the last refresh, if it was merged before
+    all sources covered it. Without a state and a store every month is processed, i.e. a full rebuild.
+
+    Before rows are appended to the exported files their sizes are recorded in the state. A refresh that stops
+    before its state is saved processes the same months again, and the next refresh first cuts the files back
+    to the recorded sizes, so no rows are appended twice.
+
+    Deviations from the notebooks: the random days of rows that go back in time are drawn per refresh, and
+    missing traffic counts are left out instead of imputed from the averages of all years.
+
+    Parameters:
+    - raw_path (str): RoadTrafficAccidentLocations.csv.
+    - store_path (str): Directory of the partitioned store.
+    - state_path (str): File of the high-water marks.
+    - traffic_path, pedestrian_pattern, weather_path (str): The sources.
+    - excluded_stations (list): Traffic stations (MSID) with anomalous counts.
+    - export (bool): Update the CSV files, the page artifact and locations.csv if any month changed.
+    - csv_paths, dataset_path, locations_path (str): The exported files, see export_merged_data.
+
+    Returns:
+    - list: The processed 'YYYY-MM' months, empty if the dataset was up to date.
+    """
+    state = load_state(state_path)
+    if state.get('offsets'):
+        truncate_exports(state['offsets'])
+    marks = source_marks(traffic_path, pedestrian_pattern, weather_path)
+    raw = read_raw_accidents(raw_path)
+    hashes = month_hashes(raw)
+
+    # States of earlier versions kept row counts instead of hashes, their months are all processed once
+    pending = {period for period, value in hashes.items() if state.get('hashes', {}).get(period) != value}
+    if marks != state['sources']:
+        pending |= {period for period in hashes if state['complete'] is None or period > state['complete']}
+    pending = sorted(pending)
+    exported = state.get('exported')
+    if pending:
+        df = process_months(raw, pending, traffic_path=traffic_path, pedestrian_pattern=pedestrian_pattern,
+                            weather_path=weather_path, excluded_stations=excluded_stations)
+        write_months(df, store_path)
+        if export:
+            # Months after the exported ones are appended to the exported files, anything else rewrites them
+            files = [*csv_paths, locations_path]
+            append = exported is not None and pending[0] > exported and all(os.path.exists(path) for path in files)
+            if append:
+                save_state({**state, 'offsets': {path: os.path.getsize(path) for path in files}}, state_path)
+            export_merged_data(df.drop(columns='period'), pending, store_path, append, csv_paths, dataset_path,
+                               locations_path)
+        exported = max(hashes) if export else None
+
+    _save_refresh_state(state_path, hashes, marks, exported)
+    return pending
+
+
+def bootstrap(csv_path: str = HISTORIC_DATA_PATH, store_path: str = MERGED_DATASET_PATH,
+              state_path: str = REFRESH_STATE_PATH, raw_path: str = RAW_ACCIDENTS_PATH,
+              traffic_path: str = TRAFFIC_DATASET_PATH, pedestrian_pattern: str = RAW_PEDESTRIAN_PATH,
+              weather_path: str = WEATHER_PARTS_PATH) -> int:
+    """
+    Seed the store and the state from the merged dataset of a full notebook run, so the next refresh only
+    processes the months after it.
+
+    Returns:
+    - int: Number of months in the store.
+    """
+    df = pd.read_csv(csv_path, parse_dates=['dateTime'])
+    df['period'] = df['dateTime'].dt.strftime('%Y-%m')
+    shutil.rmtree(store_path, ignore_errors=True)
+    write_months(df, store_path)
+    # The months of the notebook run are taken as merged from the raw rows as they are now
+    periods = set(df['period'])
+    hashes = {period: value for period, value in month_hashes(read_raw_accidents(raw_path)).items()
+              if period in periods}
+    _save_refresh_state(state_path, hashes, source_marks(traffic_path, pedestrian_pattern, weather_path),
+                        max(periods))
+    return len(periods)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Refresh the merged accident dataset with the new months.")
+    parser.add_argument('--bootstrap', action='store_true',
+                        help="Seed the store from data/inference/historic_data.csv of a full notebook run.")
+    parser.add_argument('--ingest-traffic', type=int, nargs='+', metavar='YEAR',
+                        help="Ingest these years of raw traffic counts into the traffic dataset first.")
+    parser.add_argument('--fetch-weather', action='store_true',
+                        help="Backfill the weather up to the last month of the accidents first.")
+    parser.add_argument('--exclude-station', action='append', default=[], metavar='MSID',
+                        help="Leave out a traffic station with anomalous counts, can be repeated.")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    if args.bootstrap:
+        print(f"{bootstrap()} months saved at {MERGED_DATASET_PATH}.")
+        return
+    if args.ingest_traffic:
+        ingest_traffic_data(args.ingest_traffic)
+    if args.fetch_weather:
+        mark = weather_mark()
+        # The window of the mark is fetched again if its last hours were still empty, it keeps its part
+        first_day = mark.strftime('%Y-%m-01') if mark is not None else f'{FIRST_PERIOD}-01'
+        last_day = period_bounds(read_raw_accidents()['period'].max())[1].date().isoformat()
+        if first_day <= last_day:
+            failed = backfill_weather(first_day, last_day)
+            if failed:
+                print(f"{len(failed)} weather window(s) failed, run again to fetch them: {failed}")
+
+    periods = refresh(excluded_stations=args.exclude_station)
+    if periods:
+        print(f"{len(periods)} month(s) refreshed ({periods[0]} to {periods[-1]}) "
+              f"in {time.perf_counter() - start_time:.1f} s.")
+    else:
+        print("The merged dataset is up to date.")
+
+
+if __name__ == '__main__':
+    main()
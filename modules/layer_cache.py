@@ -0,0 +1,82 @@
+# Contains the cache of serialized map layers of the Analyse Historic Data page
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+# Default memory budget of the cached payloads in bytes
+MEMORY_BUDGET = 64 * 2**20
+
+
+class LayerCache:
+    """
+    LRU cache of serialized map layers (GeoJSON and heatmap payloads) under a memory budget.
+
+    Layers are keyed by the filter signature, the layer kind and the zoom they were aggregated at, and are
+    stored as the bytes inserted into the map, so a return to a previous filter combination skips the
+    aggregation and serialization. The least recently used layers are evicted once the payloads exceed
+    `memory_budget` bytes; a single payload larger than the budget is returned but not kept.
+
+    Parameters:
+    - memory_budget (int): Maximum total size of the cached payloads in bytes.
+    """
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.size = 0
+        self._cache: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], bytes]) -> bytes:
+        """
+        The cached payload of a layer, rendered and cached if there is none.
+
+        Parameters:
+        - key (hashable): Filter signature, layer kind and zoom of the layer.
+        - render (callable): Builds the payload of the layer.
+
+        Returns:
+        - bytes: The serialized layer.
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            payload = self._cache.get(key)
+            if payload is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                self.last_seconds = time.perf_counter() - start_time
+                return payload
+
+        payload = render()
+        elapsed = time.perf_counter() - start_time
+        with self._lock:
+            self.misses += 1
+            self.render_seconds += elapsed
+            self.last_seconds = elapsed
+            if len(payload) <= self.memory_budget:
+                previous = self._cache.pop(key, None)
+                if previous is not None:
+                    self.size -= len(previous)
+                self._cache[key] = payload
+                self.size += len(payload)
+                while self.size > self.memory_budget:
+                    _, evicted = self._cache.popitem(last=False)
+                    self.size -= len(evicted)
+        return payload
+
+    def stats(self) -> Dict[str, float]:
+        """Hit rate, cached layers and bytes, and the render latency of the misses."""
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'layers': len(self._cache),
+            'bytes': self.size,
+            'mean_render_seconds': self.render_seconds / self.misses if self.misses else 0.0,
+            'last_seconds': self.last_seconds,
+        }
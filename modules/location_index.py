@@ -0,0 +1,91 @@
+# Contains a KD-tree spatial index over the known accident locations used for the road type lookup during inference
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from modules.projection import wgs84_to_lv95
+
+
+class LocationIndex:
+    """
+    KD-tree over the projected LV95 coordinates (x, y in metres) of the accident locations.
+
+    The tree is built once from the locations dataframe and answers k-nearest queries in logarithmic time.
+    Neighbours are returned in the same order as `Series.nsmallest(k)` would return them on the distance
+    column: by ascending distance, ties broken by row order.
+
+    Parameters:
+    - locations (pd.DataFrame): Locations with at least the columns 'x', 'y' (LV95) and 'RoadType'.
+    """
+
+    def __init__(self, locations: pd.DataFrame):
+        self.locations = locations
+        self.size = len(locations)
+        self._labels = locations.index.to_numpy()
+        self._tree = cKDTree(locations[['x', 'y']].to_numpy(dtype='float64'))
+
+    def project(self, lon, lat):
+        """
+        Project WGS84 longitude/latitude (scalars or arrays) to LV95 x/y.
+        """
+        return wgs84_to_lv95(lon, lat)
+
+    def query_xy(self, x, y, k: int) -> np.ndarray:
+        """
+        Find the k nearest locations for one or many LV95 points.
+
+        Parameters:
+        - x, y (float or array-like): LV95 coordinates of the query point(s).
+        - k (int): Number of neighbours per point (capped at the number of locations).
+
+        Returns:
+        - np.ndarray: Row positions of shape (number_of_points, k), closest first.
+        """
+        points = np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]).astype('float64')
+        k = min(int(k), self.size)
+        if k <= 0 or len(points) == 0:
+            return np.empty((len(points), 0), dtype=np.intp)
+
+        # One extra neighbour tells us whether the k-th distance is tied with locations outside the result
+        k_query = min(k + 1, self.size)
+        distances, positions = self._tree.query(points, k=k_query)
+        distances = distances.reshape(len(points), k_query)
+        positions = positions.reshape(len(points), k_query)
+
+        # Order by distance, ties by row position, exactly like nsmallest(keep='first')
+        order = np.lexsort((positions, distances))
+        result = np.take_along_axis(positions, order, axis=1)[:, :k]
+
+        if k_query > k:
+            sorted_distances = np.take_along_axis(distances, order, axis=1)
+            # A tie at the boundary means locations outside the result are just as close: resolve those rows
+            for row in np.flatnonzero(sorted_distances[:, k] == sorted_distances[:, k - 1]):
+                candidates = np.asarray(
+                    self._tree.query_ball_point(points[row], r=sorted_distances[row, k - 1] * (1 + 1e-9)),
+                    dtype=np.intp,
+                )
+                candidate_distances = ((self._tree.data[candidates] - points[row]) ** 2).sum(axis=1)
+                result[row] = candidates[np.lexsort((candidates, candidate_distances))[:k]]
+        return result
+
+    def query(self, lon, lat, k: int) -> np.ndarray:
+        """
+        Find the k nearest locations for one or many WGS84 points.
+
+        Parameters:
+        - lon, lat (float or array-like): WGS84 coordinates of the query point(s).
+        - k (int): Number of neighbours per point.
+
+        Returns:
+        - np.ndarray: Row positions of shape (number_of_points, k), closest first.
+        """
+        x, y = self.project(lon, lat)
+        return self.query_xy(x, y, k)
+
+    def nearest(self, lon: float, lat: float, k: int) -> List:
+        """
+        Index labels of the k nearest locations to a single WGS84 point, closest first.
+        """
+        return self._labels[self.query(lon, lat, k)[0]].tolist()
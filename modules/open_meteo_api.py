@@ -1,143 +1,15 @@
-from datetime import date, datetime
-import os
+import asyncio
 import json
-import requests
-import csv
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List
 
-from statsmodels.tsa.vector_ar.var_model import forecast
-from tqdm import tqdm
-from config import TRACKER_PATH
-import pandas as pd
+import httpx
+from modules.async_client import gather_limited, get_async_http, run
+from modules.rate_limiter import get_rate_limiter
 
+DEFAULT_HOURLY = ["temperature_2m", "precipitation", "snowfall", "snow_depth", "surface_pressure", "cloud_cover"]
 
-def load_tracker_data() -> Dict[str, Any]:
-    """Load the tracker data from the JSON file.
 
-    Returns:
-        Dict[str, Any]: The tracker data.
-    """
-    if not os.path.exists(TRACKER_PATH):
-        # Return default tracker data
-        return {
-            "daily": {"date": date.today().isoformat(), "requests": 0},
-            "hourly": {"datetime": datetime.now().strftime("%Y-%m-%d %H"), "requests": 0},
-            "minutely": {"datetime": datetime.now().strftime("%Y-%m-%d %H:%M"), "requests": 0}
-        }
-    try:
-        with open(TRACKER_PATH, "r") as file:
-            tracker_data = json.load(file)
-        return tracker_data
-    except (IOError, json.JSONDecodeError) as e:
-        print(f"Error reading tracker file: {e}")
-        # Return default tracker data
-        return {
-            "daily": {"date": date.today().isoformat(), "requests": 0},
-            "hourly": {"datetime": datetime.now().strftime("%Y-%m-%d %H"), "requests": 0},
-            "minutely": {"datetime": datetime.now().strftime("%Y-%m-%d %H:%M"), "requests": 0}
-        }
-
-
-def save_tracker_data(tracker_data: Dict[str, Any]) -> None:
-    """Save the tracker data to the JSON file.
-
-    Args:
-        tracker_data (Dict[str, Any]): The tracker data to save.
-    """
-    try:
-        with open(TRACKER_PATH, "w") as file:
-            json.dump(tracker_data, file)
-    except IOError as e:
-        print(f"Error writing to tracker file: {e}")
-
-
-def get_tracker_data() -> Dict[str, Any]:
-    """Load the tracker data and reset counts if time periods have changed.
-
-    Returns:
-        Dict[str, Any]: The current tracker data.
-    """
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(TRACKER_PATH), exist_ok=True)
-
-    tracker_data = load_tracker_data()
-
-    # Get current date and times
-    current_date = date.today().isoformat()
-    current_hour = datetime.now().strftime("%Y-%m-%d %H")
-    current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-    # Flag to check if data has changed
-    data_changed = False
-
-    # Reset daily requests if date has changed
-    if tracker_data["daily"]["date"] != current_date:
-        tracker_data["daily"] = {"date": current_date, "requests": 0}
-        print(f"Daily tracker reset for a new day: {current_date}")
-        data_changed = True
-
-    # Reset hourly requests if hour has changed
-    if tracker_data["hourly"]["datetime"] != current_hour:
-        tracker_data["hourly"] = {"datetime": current_hour, "requests": 0}
-        print(f"Hourly tracker reset for a new hour: {current_hour}")
-        data_changed = True
-
-    # Reset minutely requests if minute has changed
-    if tracker_data["minutely"]["datetime"] != current_minute:
-        tracker_data["minutely"] = {"datetime": current_minute, "requests": 0}
-        print(f"Minutely tracker reset for a new minute: {current_minute}")
-        data_changed = True
-
-    # Save tracker data if any changes were made
-    if data_changed:
-        save_tracker_data(tracker_data)
-
-    return tracker_data
-
-
-def update_tracker(amount: int) -> None:
-    """Update the tracker by incrementing the request counts.
-
-    Args:
-        amount (int): The number of requests to add.
-    """
-    tracker_data = get_tracker_data()
-
-    # Update the counts
-    tracker_data["daily"]["requests"] += amount
-    tracker_data["hourly"]["requests"] += amount
-    tracker_data["minutely"]["requests"] += amount
-
-    save_tracker_data(tracker_data)
-
-
-def check_tracker(number_of_requests: int) -> Tuple[bool, Optional[str]]:
-    """Check if the number of requests can be made without exceeding the limits.
-
-    Args:
-        number_of_requests (int): The number of requests to check.
-
-    Returns:
-        Tuple[bool, Optional[str]]: (True, None) if requests can be made,
-            (False, limit_name) if limit exceeded.
-    """
-    tracker_data = get_tracker_data()
-
-    daily_remaining = 10000 - tracker_data["daily"]["requests"]
-    hourly_remaining = 5000 - tracker_data["hourly"]["requests"]
-    minutely_remaining = 600 - tracker_data["minutely"]["requests"]
-
-    if number_of_requests > daily_remaining:
-        return False, "daily"
-    elif number_of_requests > hourly_remaining:
-        return False, "hourly"
-    elif number_of_requests > minutely_remaining:
-        return False, "minutely"
-    else:
-        return True, None
-
-
-def open_meteo_request(
+async def open_meteo_request_async(
     start_date: str,
     end_date: str,
     latitude: float = 47.36667,
@@ -148,8 +20,13 @@ def open_meteo_request(
     windspeed_unit: str = 'kmh',
     precipitation_unit: str = 'mm',
     base_url: str = "https://archive-api.open-meteo.com/v1/archive",
+    blocking: bool = False,
+    timeout: Optional[float] = None,
 ) -> Optional[Dict[str, Any]]:
-    """Send a request to the Open Meteo API and return the data.
+    """Send a request to the Open Meteo API and return the data, asynchronously.
+
+    The request goes through the pooled client of `modules.async_client`, `open_meteo_request` is the
+    blocking version of this coroutine.
 
     Args:
         start_date (str): The start date for the data retrieval in YYYY-MM-DD format.
@@ -162,20 +39,21 @@ def open_meteo_request(
         windspeed_unit (str, optional): The unit for wind speed. Defaults to 'kmh'.
         precipitation_unit (str, optional): The unit for precipitation. Defaults to 'mm'.
         base_url (str, optional): The base URL for the Open Meteo API. Defaults to 'https://archive-api.open-meteo.com/v1/archive'.
+        blocking (bool, optional): Wait for the rate limiter instead of giving up when a limit is reached. Defaults to False.
+        timeout (float, optional): Maximum number of seconds to wait for the rate limiter when blocking. Defaults to None.
 
     Returns:
         Optional[Dict[str, Any]]: The data retrieved from the API, or None if an error occurred.
     """
 
-    allowed, limit_name = check_tracker(number_of_requests=1)
+    # Waiting for the rate limiter blocks, keep it off the event loop
+    allowed, limit_name = await asyncio.to_thread(get_rate_limiter().acquire, 1, blocking, timeout)
     if not allowed:
         print(f"Open Meteo API {limit_name} limit reached!")
         return None
 
-    update_tracker(amount=1)
-
     if hourly is None:
-        hourly = ["temperature_2m", "precipitation", "snowfall", "snow_depth", "surface_pressure", "cloud_cover"]
+        hourly = DEFAULT_HOURLY
 
     params = {
         'latitude': latitude,
@@ -190,21 +68,35 @@ def open_meteo_request(
     }
 
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        try:
-            result = response.json()
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON response: {e}")
-            return None
-
-        if 'hourly' not in result:
-            print("No 'hourly' data found in the response.")
-            return None
-
-        data = result['hourly']
-        return data
-
-    except requests.RequestException as e:
+        result = await get_async_http().get_json(base_url, params=params)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON response: {e}")
+        return None
+    except httpx.HTTPError as e:
         print(f"HTTP Error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+    if 'hourly' not in result:
+        print("No 'hourly' data found in the response.")
+        return None
+
+    data = result['hourly']
+    return data
+
+
+def open_meteo_request(start_date: str, end_date: str, **kwargs: Any) -> Optional[Dict[str, Any]]:
+    """Send a request to the Open Meteo API and return the data, see `open_meteo_request_async` for the arguments."""
+    return run(open_meteo_request_async(start_date, end_date, **kwargs))
+
+
+def open_meteo_request_many(queries: List[Dict[str, Any]], concurrency: int = 10) -> List[Optional[Dict[str, Any]]]:
+    """Send several requests to the Open Meteo API concurrently.
+
+    Args:
+        queries (List[dict]): Keyword arguments of `open_meteo_request_async` per request, e.g. one per location or date range.
+        concurrency (int, optional): Maximum number of requests in flight. Defaults to 10.
+
+    Returns:
+        List[Optional[Dict[str, Any]]]: The data of every request in the order of the queries, None for failed requests.
+    """
+    return run(gather_limited((open_meteo_request_async(**query) for query in queries), concurrency))
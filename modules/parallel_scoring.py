@@ -0,0 +1,79 @@
+# Contains the multi-process scorer that spreads preprocessing and model inference over several cores
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import MODEL_PATH
+from modules.preprocessing import get_preprocessing_service
+from modules.scoring import OPTIMAL_THRESHOLD, load_model, predict_severity
+
+# Model of the current worker process, loaded once by the pool initializer
+_worker_model = None
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_model
+    _worker_model = load_model(model_path)
+    get_preprocessing_service()
+
+
+def _predict_partition(features: pd.DataFrame, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    return predict_severity(features, _worker_model, threshold)
+
+
+class ParallelScorer:
+    """
+    Scores feature partitions in a pool of worker processes.
+
+    Every worker loads the model and the preprocessor once. While the workers transform and predict, the
+    caller can assemble the features of the next partitions (weather, volumes, road types), so feature
+    assembly and inference overlap. Results are returned in submission order, so the row order of the
+    output does not depend on the number of workers or on which worker finishes first.
+
+    Parameters:
+    - workers (int): Number of worker processes.
+    - model_path (str): Location of the pickled model.
+    - threshold (float): Probability from which an accident is predicted as severe.
+    - max_pending (int, optional): Maximum number of partitions in flight, bounds the memory use.
+      Defaults to twice the number of workers.
+    """
+
+    def __init__(self, workers: int, model_path: str = MODEL_PATH, threshold: float = OPTIMAL_THRESHOLD,
+                 max_pending: Optional[int] = None):
+        self.workers = workers
+        self.threshold = threshold
+        self.max_pending = max_pending or 2 * workers
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,))
+
+    def score(self, partitions: Iterable) -> Iterator:
+        """
+        Score partitions of model inputs.
+
+        Parameters:
+        - partitions (iterable): Items of (features, payload), where features are the model inputs of one
+          partition and payload is passed through untouched (e.g. the input rows to write next to the results).
+
+        Yields:
+        - tuple: (payload, probabilities, predictions) per partition, in the order of the partitions.
+        """
+        pending = deque()
+        for features, payload in partitions:
+            pending.append((payload, self._executor.submit(_predict_partition, features, self.threshold)))
+            if len(pending) >= self.max_pending:
+                payload, future = pending.popleft()
+                yield (payload, *future.result())
+        while pending:
+            payload, future = pending.popleft()
+            yield (payload, *future.result())
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,224 @@
+# Contains the cache of full predictions of the prediction page, keyed by a normalized signature of the inputs
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import AVERAGE_VOLUME_PATH, MODEL_PATH, PREDICTION_CACHE_PATH, PREPROCESSOR_PATH, STATION_VOLUME_PATH
+from modules.forest_model import POINTER_FILE, bundle_path
+
+
+def _normalize(value):
+    # NumPy scalars and Python values must give the same signature
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def model_files(model_path: str = MODEL_PATH, preprocessor_path: str = PREPROCESSOR_PATH,
+                station_volume_path: str = STATION_VOLUME_PATH,
+                average_volume_path: str = AVERAGE_VOLUME_PATH) -> Tuple[str, ...]:
+    """
+    Files a prediction depends on: the pickled model, its exported flat forest, the preprocessor and the
+    volume data (the station store replaces the city-wide averages once it is built).
+    """
+    # The pointer to the current version is replaced last when the flat forest is exported
+    return (model_path, os.path.join(bundle_path(model_path), POINTER_FILE), preprocessor_path,
+            station_volume_path, average_volume_path)
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of full predictions (road types, volumes, weather, preprocessing and model output).
+
+    Requests are identified by their signature: the location snapped to a grid cell, the hour of the accident
+    and the remaining inputs, so all requests for the same cell, hour and inputs share one entry. Entries
+    expire after `ttl` seconds, the weather of future dates is a forecast that changes over the day. All
+    entries are dropped when the modification time or size of one of the `files` changes, so a retrained
+    model or preprocessor never serves old predictions. The caller loads its model for the current
+    `fingerprint()`, an entry is stored under the fingerprint seen before it was computed.
+
+    With a `path` the entries are also stored in a SQLite database and survive restarts of the app; the
+    memory holds the recently used entries only. Expired rows and rows of other fingerprints are deleted when
+    the database is opened and every `prune_every` puts, then the oldest rows beyond `max_rows`.
+
+    Parameters:
+    - files (iterable): Files the predictions depend on, missing files are allowed.
+    - path (str, optional): Location of the SQLite database, None keeps the cache in memory only.
+    - grid_size (float): Size of a grid cell in degrees.
+    - ttl (float): Lifetime of an entry in seconds.
+    - memory_size (int): Maximum number of entries kept in memory.
+    - max_rows (int): Maximum number of rows kept in the database.
+    - prune_every (int): Number of puts between two prunes of the database.
+    """
+
+    def __init__(
+        self,
+        files: Iterable[str] = model_files(),
+        path: Optional[str] = None,
+        grid_size: float = 0.0005,
+        ttl: float = 3 * 3600,
+        memory_size: int = 1024,
+        max_rows: int = 100_000,
+        prune_every: int = 256,
+    ):
+        self.files = tuple(files)
+        self.path = path
+        self.grid_size = grid_size
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._puts = 0
+        self._memory: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._fingerprint = self.fingerprint()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self) -> str:
+        """Modification time and size of every file the predictions depend on."""
+        parts = []
+        for file in self.files:
+            try:
+                stat = os.stat(file)
+                parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+            except OSError:
+                parts.append("-")
+        return "|".join(parts)
+
+    def signature(self, lat: float, lon: float, when: datetime, **inputs: Any) -> Tuple:
+        """
+        Normalized, hashable form of a request: the grid cell of the location, the hour of `when` and the
+        remaining inputs in name order.
+        """
+        cell = (round(lat / self.grid_size), round(lon / self.grid_size))
+        hour = pd.Timestamp(when).floor('h').isoformat()
+        return (cell, hour) + tuple(sorted((name, _normalize(value)) for name, value in inputs.items()))
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be shared with a forked child process
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, fingerprint TEXT, stored_at REAL, value BLOB)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS predictions_stored_at ON predictions (stored_at)")
+            self._connection = connection
+            self._pid = os.getpid()
+            self._prune(self._fingerprint)
+        return self._connection
+
+    def _prune(self, fingerprint: str) -> None:
+        connection = self._connection
+        connection.execute("DELETE FROM predictions WHERE fingerprint != ? OR stored_at <= ?",
+                           (fingerprint, time.time() - self.ttl))
+        connection.execute(
+            "DELETE FROM predictions WHERE key IN "
+            "(SELECT key FROM predictions ORDER BY stored_at DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+
+    def _check_files(self) -> str:
+        fingerprint = self.fingerprint()
+        if fingerprint != self._fingerprint:
+            self._memory.clear()
+            self._fingerprint = fingerprint
+            if self.path is not None:
+                self._connect()
+                self._prune(fingerprint)
+        return fingerprint
+
+    def _remember(self, signature: Tuple, stored_at: float, value: Any) -> None:
+        self._memory[signature] = (stored_at, value)
+        self._memory.move_to_end(signature)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, signature: Tuple) -> Optional[Any]:
+        """The cached prediction of a signature, None if there is none or it has expired."""
+        return self._get(signature)[0]
+
+    def _get(self, signature: Tuple) -> Tuple[Optional[Any], str]:
+        now = time.time()
+        with self._lock:
+            fingerprint = self._check_files()
+            entry = self._memory.get(signature)
+            if entry is not None and now - entry[0] >= self.ttl:
+                del self._memory[signature]
+                entry = None
+            if entry is None and self.path is not None:
+                row = self._connect().execute(
+                    "SELECT stored_at, value FROM predictions WHERE key = ? AND fingerprint = ?",
+                    (repr(signature), fingerprint),
+                ).fetchone()
+                if row is not None and now - row[0] < self.ttl:
+                    entry = (row[0], pickle.loads(row[1]))
+            if entry is None:
+                self.misses += 1
+                return None, fingerprint
+            self._remember(signature, *entry)
+            self.hits += 1
+            return entry[1], fingerprint
+
+    def put(self, signature: Tuple, value: Any, fingerprint: Optional[str] = None) -> None:
+        """
+        Cache the prediction of a signature.
+
+        Parameters:
+        - signature (tuple): Signature of the request.
+        - value: The prediction.
+        - fingerprint (str, optional): Fingerprint of the files the prediction was computed from, the
+          fingerprint at the time of the call if None. A prediction of other files is not cached.
+        """
+        now = time.time()
+        with self._lock:
+            current = self._check_files()
+            if fingerprint is not None and fingerprint != current:
+                return
+            self._remember(signature, now, value)
+            if self.path is not None:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO predictions (key, fingerprint, stored_at, value) VALUES (?, ?, ?, ?)",
+                    (repr(signature), current, now, pickle.dumps(value)),
+                )
+                self._puts += 1
+                if self._puts % self.prune_every == 0:
+                    self._prune(current)
+
+    def get_or_compute(self, signature: Tuple, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        The cached prediction of a signature, computed and cached if there is none.
+
+        Returns:
+        - tuple: (prediction, True if it was served from the cache).
+        """
+        value, fingerprint = self._get(signature)
+        if value is not None:
+            return value, True
+        value = compute()
+        # Not cached if the files changed while computing, compute may have used the earlier model
+        self.put(signature, value, fingerprint)
+        return value, False
+
+    def stats(self) -> Dict[str, float]:
+        """Hit and miss counters since the start of the process."""
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / requests if requests else 0.0,
+                'entries': len(self._memory)}
+
+
+@lru_cache(maxsize=None)
+def get_prediction_cache() -> PredictionCache:
+    """Process-wide prediction cache shared by all sessions, persisted next to the other caches."""
+    return PredictionCache(model_files(), path=PREDICTION_CACHE_PATH)
@@ -0,0 +1,133 @@
+# Contains the preprocessing service that loads the fitted ColumnTransformer once and transforms model inputs
+import time
+import warnings
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from joblib import load
+from scipy import sparse
+
+from config import PREPROCESSOR_PATH
+
+
+class PreprocessingService:
+    """
+    Wraps the fitted ColumnTransformer from `Data Processing.ipynb`.
+
+    The transformer is unpickled once and the feature lists and output column names are read from it
+    instead of being rebuilt on every call.
+
+    Parameters:
+    - path (str): Location of the pickled ColumnTransformer.
+    """
+
+    def __init__(self, path: str = PREPROCESSOR_PATH):
+        start_time = time.perf_counter()
+        self.preprocessor = load(path)
+        self.load_time = time.perf_counter() - start_time
+
+        # The feature lists as used during preprocessing
+        columns = {name: list(features) for name, _, features in self.preprocessor.transformers_}
+        self.numerical_features: List[str] = columns['num']
+        self.categorical_features: List[str] = columns['cat']
+        self.input_features: List[str] = list(self.preprocessor.feature_names_in_)
+
+        # Output column names: scaled numerical features followed by the one-hot encoded categories
+        cat_onehot_features = self.preprocessor.named_transformers_['cat'] \
+            .named_steps['onehot'].get_feature_names_out(self.categorical_features)
+        self.feature_names: List[str] = self.numerical_features + list(cat_onehot_features)
+        self.feature_index: Dict[str, int] = {name: i for i, name in enumerate(self.feature_names)}
+
+    def transform_many(self, df: pd.DataFrame):
+        """
+        Transform model inputs into the feature matrix.
+
+        Parameters:
+        - df (pd.DataFrame): Model inputs, columns that the preprocessor does not use (e.g. 'dateTime') are ignored.
+
+        Returns:
+        - np.ndarray or scipy.sparse matrix: One row per input row, columns as in `feature_names`.
+        """
+        return self.preprocessor.transform(df[self.input_features])
+
+    def transform_matrix(self, df: pd.DataFrame):
+        """
+        Transform model inputs into the matrix both forest predictors take without a DataFrame.
+
+        The preprocessor of `Data Processing.ipynb` returns CSR, the output of an older preprocessor that centers
+        the numerical features is dense (less than half of it is zeros) and stays a dense array.
+
+        Parameters:
+        - df (pd.DataFrame): Model inputs.
+
+        Returns:
+        - scipy.sparse.csr_matrix or np.ndarray: One row per input row, columns as in `feature_names`.
+        """
+        transformed = self.transform_many(df)
+        return transformed.tocsr() if sparse.issparse(transformed) else transformed
+
+    def transform_for(self, df: pd.DataFrame, model):
+        """
+        Transform model inputs for a fitted model, after checking that it was fitted on the columns of
+        `feature_names` in this order.
+
+        The names are those of a sklearn model fitted on a DataFrame (the pickle of `Data Processing.ipynb`) or
+        the `feature_names` the flat forest keeps. Every model gets the matrix of `transform_matrix`, a sklearn
+        model fitted with names warns about it, see `predict_proba`.
+
+        Parameters:
+        - df (pd.DataFrame): Model inputs.
+        - model: The fitted classifier.
+
+        Returns:
+        - scipy.sparse.csr_matrix or np.ndarray: The transformed features.
+        """
+        transformed = self.transform_matrix(df)
+        fitted_names = getattr(model, 'feature_names_in_', None)
+        if fitted_names is None:
+            fitted_names = getattr(model, 'feature_names', None)
+        if fitted_names is not None and list(fitted_names) != self.feature_names:
+            fitted_names = list(fitted_names)
+            pairs = enumerate(zip(fitted_names, self.feature_names))
+            first = next((i for i, (fitted, name) in pairs if fitted != name),
+                         min(len(fitted_names), len(self.feature_names)))
+            raise ValueError(f"The model was fitted on other features than the preprocessor returns, from column "
+                             f"{first} on ({len(fitted_names)} model and {len(self.feature_names)} preprocessor "
+                             f"features).")
+        return transformed
+
+    def predict_proba(self, df: pd.DataFrame, model) -> np.ndarray:
+        """
+        Class probabilities of a fitted model for model inputs, see `transform_for`. The feature names are checked
+        before, the warning of sklearn about a matrix without names is not shown.
+        """
+        transformed = self.transform_for(df, model)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+            return model.predict_proba(transformed)
+
+    def transform(self, df: pd.DataFrame, as_frame: bool = False):
+        """
+        Transform model inputs, optionally wrapped in a DataFrame with the processed feature names.
+
+        Parameters:
+        - df (pd.DataFrame): Model inputs.
+        - as_frame (bool): Return a DataFrame with the feature names and the index of df.
+
+        Returns:
+        - np.ndarray, scipy.sparse matrix or pd.DataFrame: The transformed features.
+        """
+        transformed = self.transform_many(df)
+        if not as_frame:
+            return transformed
+        if hasattr(transformed, 'toarray'):
+            transformed = transformed.toarray()
+        return pd.DataFrame(transformed, columns=self.feature_names, index=df.index)
+
+
+@lru_cache(maxsize=None)
+def get_preprocessing_service(path: str = PREPROCESSOR_PATH) -> PreprocessingService:
+    """Process-wide preprocessing service, the preprocessor is loaded on first use."""
+    return PreprocessingService(path)
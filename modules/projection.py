@@ -0,0 +1,81 @@
+# Contains the projection between the Swiss LV95 coordinates of the accident data and WGS84 longitude/latitude
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+LV95 = "EPSG:2056"
+WGS84 = "EPSG:4326"
+# Points per transform call, bounds the temporary buffers of pyproj
+CHUNK_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=None)
+def get_transformer(source: str, target: str) -> Transformer:
+    """
+    Process-wide transformer between two CRS, always in (x, y) = (longitude, latitude) axis order.
+
+    Building a transformer reads the PROJ database and takes milliseconds, transforming a point takes
+    about a microsecond, so every pair of CRS is built once. Transformers are thread-safe since pyproj 3.1.
+    """
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def _transform(source: str, target: str, a, b, chunk_size: int) -> Tuple:
+    scalar = np.ndim(a) == 0 and np.ndim(b) == 0
+    # The results are written into one float64 copy of the inputs, chunk by chunk
+    a = np.array(a, dtype='float64', copy=True, ndmin=1).ravel()
+    b = np.array(b, dtype='float64', copy=True, ndmin=1).ravel()
+    if len(a) != len(b):
+        raise ValueError(f"Got {len(a)} x and {len(b)} y coordinates.")
+    transformer = get_transformer(source, target)
+    for start in range(0, len(a), chunk_size):
+        transformer.transform(a[start:start + chunk_size], b[start:start + chunk_size], inplace=True)
+    if scalar:
+        return a.item(), b.item()
+    return a, b
+
+
+def lv95_to_wgs84(x, y, chunk_size: int = CHUNK_SIZE) -> Tuple:
+    """
+    Project LV95 coordinates (metres) to WGS84 longitude/latitude.
+
+    Parameters:
+    - x, y (float or array-like): LV95 easting and northing.
+    - chunk_size (int): Points per transform call.
+
+    Returns:
+    - tuple: (lon, lat) as floats for scalar input, as float64 arrays otherwise.
+    """
+    return _transform(LV95, WGS84, x, y, chunk_size)
+
+
+def wgs84_to_lv95(lon, lat, chunk_size: int = CHUNK_SIZE) -> Tuple:
+    """
+    Project WGS84 longitude/latitude to LV95 coordinates (metres), e.g. to match clicked points by distance.
+
+    Parameters:
+    - lon, lat (float or array-like): WGS84 longitude and latitude.
+    - chunk_size (int): Points per transform call.
+
+    Returns:
+    - tuple: (x, y) as floats for scalar input, as float64 arrays otherwise.
+    """
+    return _transform(WGS84, LV95, lon, lat, chunk_size)
+
+
+def add_wgs84_columns(df: pd.DataFrame, x: str = 'x', y: str = 'y') -> pd.DataFrame:
+    """
+    Add the 'lon' and 'lat' columns projected from the LV95 columns.
+
+    The input frame is left unchanged, the result shares all its existing columns with it.
+    """
+    lon, lat = lv95_to_wgs84(df[x].to_numpy(), df[y].to_numpy())
+    df = df.copy(deep=False)
+    # Setting a column copies the array, dropping each array right after keeps one copy alive at a time
+    df['lon'] = lon
+    del lon
+    df['lat'] = lat
+    return df
@@ -0,0 +1,143 @@
+# Contains the token bucket rate limiter that keeps us within the Open-Meteo API limits
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from config import RATE_LIMIT_PATH
+
+# Open-Meteo limits for non-commercial use: (capacity, refill period in seconds)
+OPEN_METEO_LIMITS = {
+    "daily": (10000, 86400),
+    "hourly": (5000, 3600),
+    "minutely": (600, 60),
+}
+
+
+class RateLimiter:
+    """
+    Token buckets for several limits that all have to allow a request.
+
+    Each bucket holds up to `capacity` tokens and refills continuously at `capacity / period` tokens per
+    second. A request for n tokens succeeds only if every bucket holds n tokens, in which case they are
+    taken from all buckets at once.
+
+    With a `path` the bucket state lives in a SQLite database in WAL mode and every acquisition is a
+    single immediate transaction, so threads and processes (Streamlit sessions, worker pools) share one
+    budget. Without a path the state is kept in memory and only shared between threads.
+
+    Parameters:
+    - limits (dict): Mapping of limit name to (capacity, period in seconds).
+    - path (str, optional): Location of the SQLite database holding the shared state.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]] = OPEN_METEO_LIMITS, path: Optional[str] = None):
+        self.limits = dict(limits)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        # In-memory state: name -> (tokens, last refill time)
+        now = time.time()
+        self._state = {name: (float(capacity), now) for name, (capacity, _) in self.limits.items()}
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not be shared with a forked child process
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _refill(self, state: Dict[str, Tuple[float, float]], now: float) -> Dict[str, float]:
+        tokens = {}
+        for name, (capacity, period) in self.limits.items():
+            current, updated = state.get(name, (float(capacity), now))
+            tokens[name] = min(float(capacity), current + max(now - updated, 0.0) * capacity / period)
+        return tokens
+
+    def _take(self, tokens: Dict[str, float], amount: int) -> Tuple[float, Optional[str]]:
+        """Take `amount` tokens if possible. Returns (seconds to wait, limiting bucket), (0, None) on success."""
+        wait, limit_name = 0.0, None
+        for name, (capacity, period) in self.limits.items():
+            if tokens[name] < amount:
+                bucket_wait = (amount - tokens[name]) * period / capacity
+                if bucket_wait > wait:
+                    wait, limit_name = bucket_wait, name
+        if limit_name is None:
+            for name in tokens:
+                tokens[name] -= amount
+        return wait, limit_name
+
+    def _try_acquire(self, amount: int) -> Tuple[float, Optional[str]]:
+        now = time.time()
+        with self._lock:
+            if self.path is None:
+                tokens = self._refill(self._state, now)
+                wait, limit_name = self._take(tokens, amount)
+                if limit_name is None:
+                    self._state = {name: (value, now) for name, value in tokens.items()}
+                return wait, limit_name
+
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute("SELECT name, tokens, updated FROM buckets").fetchall()
+                tokens = self._refill({name: (value, updated) for name, value, updated in rows}, now)
+                wait, limit_name = self._take(tokens, amount)
+                if limit_name is None:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                        [(name, value, now) for name, value in tokens.items()],
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return wait, limit_name
+
+    def acquire(self, amount: int = 1, blocking: bool = False,
+                timeout: Optional[float] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Take `amount` tokens from every bucket.
+
+        Args:
+            amount (int): The number of requests to make.
+            blocking (bool): Wait until the tokens are available instead of failing right away.
+            timeout (float, optional): Maximum number of seconds to wait when blocking. Defaults to no limit.
+
+        Returns:
+            Tuple[bool, Optional[str]]: (True, None) if the requests can be made,
+                (False, limit_name) if a limit would be exceeded.
+        """
+        for name, (capacity, _) in self.limits.items():
+            if amount > capacity:
+                raise ValueError(f"Cannot acquire {amount} tokens, the {name} limit is {capacity}.")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait, limit_name = self._try_acquire(amount)
+            if limit_name is None:
+                return True, None
+            if not blocking:
+                return False, limit_name
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False, limit_name
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter() -> RateLimiter:
+    """Rate limiter for the Open-Meteo API shared by all threads and processes of the app."""
+    return RateLimiter(OPEN_METEO_LIMITS, path=RATE_LIMIT_PATH)
@@ -0,0 +1,142 @@
+# Contains the scoring pipeline used outside of the Streamlit pages: feature assembly and severity prediction
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config import AVERAGE_VOLUME_PATH, LOCATIONS_PATH, MODEL_PATH, STATION_VOLUME_PATH, THRESHOLD_PATH
+from modules.forest_model import load_model as load_forest_model
+from modules.location_index import LocationIndex
+from modules.preprocessing import get_preprocessing_service
+from modules.station_volume import StationVolumeStore, load_station_volume_store
+from modules.utils import (WEATHER_FEATURES, assign_average_volume, assign_weather, build_volume_table,
+                           get_weather_window)
+
+# Threshold on the predicted probability of a severe accident (J-statistic, see Modeling.ipynb)
+OPTIMAL_THRESHOLD = 0.2
+INVOLVEMENT_COLUMNS = ['AccidentInvolvingPedestrian', 'AccidentInvolvingBicycle', 'AccidentInvolvingMotorcycle']
+
+
+@lru_cache(maxsize=None)
+def load_model(path: str = MODEL_PATH):
+    # The memory-mapped flat forest if it has been exported next to the pickle
+    return load_forest_model(path)
+
+
+@lru_cache(maxsize=None)
+def load_threshold(path: str = THRESHOLD_PATH) -> float:
+    """The threshold written with the model by modules.training, OPTIMAL_THRESHOLD for a model trained in the notebook."""
+    if not os.path.exists(path):
+        return OPTIMAL_THRESHOLD
+    with open(path) as file:
+        return float(json.load(file)['threshold'])
+
+
+@lru_cache(maxsize=None)
+def load_location_index(path: str = LOCATIONS_PATH) -> LocationIndex:
+    return LocationIndex(pd.read_csv(path))
+
+
+@lru_cache(maxsize=None)
+def load_volume_table(path: str = AVERAGE_VOLUME_PATH) -> np.ndarray:
+    return build_volume_table(pd.read_csv(path))
+
+
+@lru_cache(maxsize=None)
+def load_station_volume(path: str = STATION_VOLUME_PATH):
+    """The per-station average volume store, None if it has not been built."""
+    return load_station_volume_store(path)
+
+
+def assign_road_types(lon, lat, location_index, rng, candidates=5):
+    """
+    Pick the road type of a random one of the closest known accident locations for every point,
+    like get_road_type does for a single prediction.
+
+    Parameters:
+    - lon, lat (array-like): WGS84 coordinates of the points.
+    - location_index (LocationIndex): Spatial index over the known accident locations.
+    - rng (np.random.Generator): Random generator used to pick among the candidates.
+    - candidates (int): Number of closest locations to pick from.
+
+    Returns:
+    - np.ndarray: The road type of every point.
+    """
+    positions = location_index.query(lon, lat, candidates)
+    choice = rng.integers(0, positions.shape[1], size=len(positions))
+    selected = positions[np.arange(len(positions)), choice]
+    return location_index.locations['RoadType'].to_numpy()[selected]
+
+
+def get_weather_for_dates(date_times, blocking=True):
+    """
+    Fetch the weather window of every distinct date once and combine them.
+
+    Parameters:
+    - date_times (pd.Series): Datetimes of the accidents.
+    - blocking (bool): Wait for the API rate limiter instead of failing when a limit is reached.
+
+    Returns:
+    - pd.DataFrame: Weather dataframe with 'dateTime' and the weather features covering all dates.
+    """
+    # The latest time of each date decides between the archive and the forecast endpoint
+    latest_per_date = date_times.groupby(date_times.dt.normalize()).max()
+    # The windows are fetched concurrently, the requests share the pooled connections of the async client
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        windows = list(executor.map(lambda timestamp: get_weather_window(timestamp.to_pydatetime(), blocking=blocking),
+                                    latest_per_date))
+    # Consecutive dates share a day, keep the first occurrence of every hour
+    return pd.concat(windows, ignore_index=True).drop_duplicates(subset='dateTime')
+
+
+def assemble_features(inputs, location_index, volume_table, rng, blocking=True):
+    """
+    Build the model inputs for a batch of accident scenarios.
+
+    Parameters:
+    - inputs (pd.DataFrame): Scenarios with the columns 'lat', 'lon', 'dateTime', 'AccidentType' (code, e.g. 'at2')
+      and optionally the involvement flags (0/1), which default to 0.
+    - location_index (LocationIndex): Spatial index over the known accident locations.
+    - volume_table (np.ndarray or StationVolumeStore): Average volume lookup table from build_volume_table,
+      or the per-station store, then every row gets the averages of the stations closest to it.
+    - rng (np.random.Generator): Random generator for the road type lookup.
+    - blocking (bool): Wait for the weather API rate limiter instead of failing.
+
+    Returns:
+    - pd.DataFrame: The model inputs, indexed like inputs.
+    """
+    date_times = pd.to_datetime(inputs['dateTime'])
+    df = pd.DataFrame({'dateTime': date_times, 'AccidentType': inputs['AccidentType']}, index=inputs.index)
+    for column in INVOLVEMENT_COLUMNS:
+        df[column] = inputs[column].fillna(0).astype(int) if column in inputs else 0
+    df['RoadType'] = assign_road_types(inputs['lon'].to_numpy(), inputs['lat'].to_numpy(), location_index, rng)
+    df['month'] = date_times.dt.month
+    df['weekday'] = date_times.dt.dayofweek + 1  # Monday=1, Sunday=7
+    df['hour'] = date_times.dt.hour
+
+    if isinstance(volume_table, StationVolumeStore):
+        x, y = location_index.project(inputs['lon'].to_numpy(), inputs['lat'].to_numpy())
+        df = volume_table.assign(df, x, y, 3, 2)
+    else:
+        df = assign_average_volume(df, volume_table, 3, 2)
+    df = assign_weather(df, get_weather_for_dates(date_times, blocking=blocking), 4, WEATHER_FEATURES)
+    return df
+
+
+def predict_severity(features, model, threshold=OPTIMAL_THRESHOLD):
+    """
+    Predict the probability of a severe accident and the resulting class.
+
+    Parameters:
+    - features (pd.DataFrame): Model inputs from assemble_features.
+    - model: The fitted classifier.
+    - threshold (float): Probability from which an accident is predicted as severe.
+
+    Returns:
+    - tuple: (probabilities, predictions) as numpy arrays.
+    """
+    probabilities = get_preprocessing_service().predict_proba(features, model)[:, 1]
+    return probabilities, (probabilities >= threshold).astype(int)
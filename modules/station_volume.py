@@ -0,0 +1,317 @@
+# Contains the assignment of the measured volume of the closest counting stations to accidents, and the
+# per-station average volume store used for the same features during inference.
+#
+# Build the inference store (from the project root, after running Data Cleaning.ipynb):
+#   python -m modules.station_volume
+import argparse
+import os
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from config import DATA_PATH, STATION_VOLUME_PATH
+
+VOLUME_NAMES = ('traffic', 'pedestrian')
+# Rows of the profile matrix: (month * 8 + weekday) * 24 + hour, month 1-12, ISO weekday 1-7
+PROFILE_SLOTS = 13 * 8 * 24
+
+
+class _StationMatrix:
+    """
+    KD-tree over station coordinates and a (row x station) volume matrix; subclasses decide what a row is.
+
+    The matrix has one extra all-NaN row and station column, the targets of lookups outside the data.
+    """
+
+    def __init__(self, coordinates: np.ndarray, values: np.ndarray):
+        self.coordinates = coordinates
+        self.values = values
+        self.size = len(coordinates)
+        self._tree = cKDTree(coordinates)
+
+    def _closest(self, x, y, rows: np.ndarray, number_of_stations: int) -> np.ndarray:
+        """
+        Volumes of the closest stations that have a value in the given matrix rows.
+
+        The stations are searched by distance for every point; per row the first number_of_stations of them
+        with a value are taken, so a station without data is skipped in favour of the next-nearest one. The
+        candidates are gathered from the matrix at once, only points with too few stations with a value among
+        them are searched again with more candidates.
+
+        Parameters:
+        - x, y (array-like): LV95 coordinates of the points.
+        - rows (np.ndarray): Matrix row per point and period, shape (points, periods).
+        - number_of_stations (int): Number of stations per point and period.
+
+        Returns:
+        - np.ndarray: Volumes of shape (points, periods, stations), closest first, NaN where fewer stations
+          than number_of_stations have a value.
+        """
+        points = np.column_stack([np.atleast_1d(np.asarray(x, dtype='float64')),
+                                  np.atleast_1d(np.asarray(y, dtype='float64'))])
+        result = np.full((len(points), rows.shape[1], number_of_stations), np.nan, dtype='float32')
+        pending = np.arange(len(points))
+        candidates = min(self.size, 4 * number_of_stations)
+
+        while len(pending) and candidates > 0:
+            _, positions = self._tree.query(points[pending], k=candidates)
+            positions = positions.reshape(len(pending), candidates)
+            # Volumes of all candidate stations in every period: shape (points, periods, candidates)
+            gathered = self.values[rows[pending][:, :, None], positions[:, None, :]]
+            measured = ~np.isnan(gathered)
+            # Measured candidates first, each group keeps the distance order
+            order = np.argsort(~measured, axis=-1, kind='stable')[:, :, :number_of_stations]
+            selected = np.take_along_axis(gathered, order, axis=-1)
+            result[pending, :, :selected.shape[-1]] = selected
+
+            # Points that could find more measured stations further away
+            short = (measured.sum(axis=-1) < number_of_stations).any(axis=1)
+            if candidates == self.size:
+                break
+            pending = pending[short]
+            candidates = min(self.size, candidates * 4)
+        return result
+
+
+def _station_codes(volume: pd.DataFrame):
+    """Number the stations, distinct (ID, x, y), in order of first appearance."""
+    codes = volume.groupby(['ID', 'x', 'y'], sort=False, observed=True).ngroup().to_numpy()
+    stations = volume[['ID', 'x', 'y']].drop_duplicates()
+    return codes, stations[['x', 'y']].to_numpy(dtype='float64'), stations['ID'].to_numpy()
+
+
+def _hourly_sums(volume: pd.DataFrame):
+    """
+    Measured volume of every station and hour: rows that are not on the full hour are left out and several rows
+    of the same station and hour are summed. Training (StationVolumes) and inference (StationProfiles) both
+    aggregate through here, so the model sees volumes on the same scale in both.
+
+    Returns:
+    - tuple: (coordinates and ids of the stations, first hour, and per measured station and hour: the hour
+      offset, the station and the summed volume).
+    """
+    times = pd.to_datetime(volume['dateTime']).to_numpy(dtype='datetime64[ns]')
+    codes, coordinates, ids = _station_codes(volume)
+    start = times.min().astype('datetime64[h]') if len(times) else np.datetime64(0, 'h')
+    hours, remainders = np.divmod(times - start, np.timedelta64(1, 'h'))
+    values = volume['volume'].to_numpy(dtype='float64')
+
+    measured = (remainders == np.timedelta64(0, 'ns')) & ~np.isnan(values)
+    flat = hours[measured] * len(coordinates) + codes[measured]
+    unique, inverse = np.unique(flat, return_inverse=True)
+    sums = np.bincount(inverse, weights=values[measured])
+    return coordinates, ids, start, unique // max(len(coordinates), 1), unique % max(len(coordinates), 1), sums
+
+
+class StationVolumes(_StationMatrix):
+    """
+    Hourly volumes of the counting stations as a dense (hour x station) matrix with a KD-tree over the stations.
+
+    A station is a distinct (ID, x, y) of the volume data. Hours without a measurement of a station are NaN,
+    rows that are not on the full hour are left out and several rows of the same station and hour are summed.
+    The matrix is float32 to keep all years of all stations in memory, counts are exact, imputed averages
+    keep about seven significant digits.
+
+    Parameters:
+    - volume (pd.DataFrame): Volume data with the columns 'ID', 'x', 'y' (LV95), 'dateTime' and 'volume'.
+    """
+
+    def __init__(self, volume: pd.DataFrame):
+        coordinates, self.ids, self.start, hours, stations, sums = _hourly_sums(volume)
+        hours_count = int(hours.max()) + 1 if len(hours) else 0
+        matrix = np.full((hours_count + 1, len(coordinates) + 1), np.nan, dtype='float32')
+        matrix[hours, stations] = sums
+        super().__init__(coordinates, matrix)
+
+    def hour_positions(self, times, number_of_periods: int) -> np.ndarray:
+        """
+        Row of every time and period (p hours before the time) in the volume matrix: shape (rows, periods).
+        Times outside the data or not on the full hour point at the all-NaN row.
+        """
+        times = pd.to_datetime(times).to_numpy(dtype='datetime64[ns]')
+        offsets, remainders = np.divmod(times - self.start, np.timedelta64(1, 'h'))
+        offsets = offsets[:, None] - np.arange(number_of_periods)
+        hours_count = len(self.values) - 1
+        valid = (remainders == np.timedelta64(0, 'ns'))[:, None] & (offsets >= 0) & (offsets < hours_count)
+        return np.where(valid, offsets, hours_count)
+
+    def closest(self, x, y, times, number_of_stations: int, number_of_periods: int) -> np.ndarray:
+        """
+        Volumes of the closest stations that have a measurement, for every point and period.
+
+        Parameters:
+        - x, y (array-like): LV95 coordinates of the points.
+        - times (array-like): Time of every point.
+        - number_of_stations (int): Number of stations per point and period.
+        - number_of_periods (int): Number of hourly periods, period p is p hours before the time.
+
+        Returns:
+        - np.ndarray: Volumes of shape (points, periods, stations), closest first, NaN where fewer stations
+          than number_of_stations have a measurement.
+        """
+        return self._closest(x, y, self.hour_positions(times, number_of_periods), number_of_stations)
+
+
+class StationProfiles(_StationMatrix):
+    """
+    Average volume of every counting station per (month, weekday, hour) as a (slot x station) matrix.
+
+    The inference counterpart of StationVolumes: a prediction has no measured volume, so the closest stations
+    contribute their average for the month, weekday and hour instead. NaN where a station never measured
+    in a slot.
+
+    Parameters:
+    - coordinates (np.ndarray): LV95 x, y of the stations, shape (stations, 2).
+    - values (np.ndarray): Averages of shape (PROFILE_SLOTS + 1, stations + 1), see `from_volume`.
+    """
+
+    @classmethod
+    def from_volume(cls, volume: pd.DataFrame) -> 'StationProfiles':
+        """
+        Average the hourly volumes of every station per month, weekday and hour. The hourly volumes are
+        aggregated like in StationVolumes: on the full hour only, several rows of a station and hour summed.
+
+        Parameters:
+        - volume (pd.DataFrame): Volume data with the columns 'ID', 'x', 'y' (LV95), 'dateTime' and 'volume'.
+        """
+        coordinates, _, start, hours, stations, sums = _hourly_sums(volume)
+        slots = cls.slot_positions(start + hours, 1)[:, 0]
+        flat = slots * (len(coordinates) + 1) + stations
+        size = (PROFILE_SLOTS + 1) * (len(coordinates) + 1)
+        counts = np.bincount(flat, minlength=size)
+        totals = np.bincount(flat, weights=sums, minlength=size)
+        with np.errstate(invalid='ignore'):
+            matrix = (totals / counts).astype('float32').reshape(PROFILE_SLOTS + 1, len(coordinates) + 1)
+        return cls(coordinates, matrix)
+
+    @staticmethod
+    def slot_positions(times, number_of_periods: int) -> np.ndarray:
+        """Slot of every time and period (p hours before the time): shape (rows, periods)."""
+        # Plain datetime64 arithmetic, a prediction request looks up a handful of rows
+        hours = np.asarray(times, dtype='datetime64[h]')[:, None] - np.arange(number_of_periods)
+        days = hours.astype('datetime64[D]')
+        month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        # 1970-01-01 was a Thursday
+        weekday = (days.astype(np.int64) + 3) % 7 + 1
+        hour = (hours - days).astype(np.int64)
+        return (month * 8 + weekday) * 24 + hour
+
+    def closest(self, x, y, times, number_of_stations: int, number_of_periods: int) -> np.ndarray:
+        """
+        Average volumes of the closest stations that measured in the slot, for every point and period.
+
+        Returns:
+        - np.ndarray: Volumes of shape (points, periods, stations), closest first.
+        """
+        return self._closest(x, y, self.slot_positions(times, number_of_periods), number_of_stations)
+
+
+class StationVolumeStore:
+    """
+    The traffic and pedestrian StationProfiles, precomputed from the clean volume data and saved as one
+    compressed .npz file, loaded once per process during inference.
+
+    Parameters:
+    - profiles (dict): StationProfiles per name in VOLUME_NAMES.
+    """
+
+    def __init__(self, profiles: Dict[str, StationProfiles]):
+        self.profiles = profiles
+
+    @classmethod
+    def build(cls, traffic: pd.DataFrame, pedestrian: pd.DataFrame) -> 'StationVolumeStore':
+        return cls({'traffic': StationProfiles.from_volume(traffic),
+                    'pedestrian': StationProfiles.from_volume(pedestrian)})
+
+    def save(self, path: str = STATION_VOLUME_PATH) -> None:
+        arrays = {}
+        for name, profiles in self.profiles.items():
+            arrays[f'{name}_coordinates'] = profiles.coordinates
+            arrays[f'{name}_values'] = profiles.values
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str = STATION_VOLUME_PATH) -> 'StationVolumeStore':
+        with np.load(path) as arrays:
+            return cls({name: StationProfiles(arrays[f'{name}_coordinates'], arrays[f'{name}_values'])
+                        for name in VOLUME_NAMES})
+
+    def assign(self, df: pd.DataFrame, x, y, number_of_stations: int, number_of_periods: int) -> pd.DataFrame:
+        """
+        Assign the average volumes of the closest stations, in the column layout of `assign_average_volume`.
+
+        Parameters:
+        - df (pd.DataFrame): Main dataframe containing at least 'dateTime'.
+        - x, y (array-like): LV95 coordinates of every row.
+        - number_of_stations (int): Number of closest stations.
+        - number_of_periods (int): Number of hourly periods, period p is p hours before 'dateTime'.
+
+        Returns:
+        - pd.DataFrame: df with the columns '{name}_volume_{station}_period_{period}' for traffic and pedestrian,
+          0 where too few stations measured in the slot, like the training data.
+        """
+        volumes = np.stack([self.profiles[name].closest(x, y, df['dateTime'], number_of_stations, number_of_periods)
+                            for name in VOLUME_NAMES], axis=-1)
+        volumes = np.nan_to_num(volumes, nan=0.0)
+        columns = [f"{name}_volume_{s}_period_{p}"
+                   for p in range(number_of_periods)
+                   for s in range(number_of_stations)
+                   for name in VOLUME_NAMES]
+        volume_df = pd.DataFrame(volumes.reshape(len(df), len(columns)).astype('float64'), columns=columns,
+                                 index=df.index, copy=False)
+        return pd.concat([df, volume_df], axis=1)
+
+
+def load_station_volume_store(path: str = STATION_VOLUME_PATH):
+    """The saved StationVolumeStore, None if it has not been built."""
+    return StationVolumeStore.load(path) if os.path.exists(path) else None
+
+
+def assign_closest_volume(df: pd.DataFrame, volume: Union[pd.DataFrame, StationVolumes], name: str,
+                          number_of_stations: int, number_of_periods: int) -> pd.DataFrame:
+    """
+    Assign every row the volume of its closest counting stations for the hour of the row and earlier hours.
+
+    Unlike the former loop of Data Merging.ipynb, which took every volume row as a neighbour of its own,
+    several rows of a station (ID, x, y) in the same hour count as one station with the sum of the rows.
+    With one row per station and hour the result is the same as the loop's.
+
+    Parameters:
+    - df (pd.DataFrame): Main dataframe containing at least 'x', 'y' (LV95) and 'dateTime'.
+    - volume (pd.DataFrame or StationVolumes): Volume data with 'ID', 'x', 'y', 'dateTime' and 'volume',
+      or the StationVolumes built from it.
+    - name (str): Prefix of the new columns, e.g. 'traffic'.
+    - number_of_stations (int): Number of closest stations with a measurement.
+    - number_of_periods (int): Number of hourly periods, period p is p hours before 'dateTime'.
+
+    Returns:
+    - pd.DataFrame: df with the columns '{name}_volume_{station}_period_{period}', NaN where no station has
+      a measurement.
+    """
+    if not isinstance(volume, StationVolumes):
+        volume = StationVolumes(volume)
+    volumes = volume.closest(df['x'].to_numpy(), df['y'].to_numpy(), df['dateTime'], number_of_stations,
+                             number_of_periods)
+
+    columns = [f'{name}_volume_{s}_period_{p}' for p in range(number_of_periods) for s in range(number_of_stations)]
+    volume_df = pd.DataFrame(volumes.reshape(len(df), len(columns)).astype('float64'), columns=columns,
+                             index=df.index, copy=False)
+    return pd.concat([df, volume_df], axis=1)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build the per-station average volume store used at inference.")
+    parser.add_argument('--traffic', default=os.path.join(DATA_PATH, "clean", "traffic_clean.csv"))
+    parser.add_argument('--pedestrian', default=os.path.join(DATA_PATH, "clean", "pedestrian_clean.csv"))
+    parser.add_argument('--path', default=STATION_VOLUME_PATH, help="Output .npz file.")
+    args = parser.parse_args(argv)
+
+    store = StationVolumeStore.build(pd.read_csv(args.traffic), pd.read_csv(args.pedestrian))
+    store.save(args.path)
+    print(f"Station volume store saved at {args.path}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# Contains the ingestion of the yearly OD2031 motorised traffic counts into a Parquet dataset partitioned by year.
+#
+# Usage (from the project root):
+#   python -m modules.traffic_ingestion [--years 2012 2023] [--workers 4] [--path data/clean/traffic_data]
+#
+# The rows of every year are sorted by station and time and written in small row groups, so reading one station
+# and hour range only opens the partitions of its years and skips the row groups of the other stations.
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.dataset as ds
+
+from config import DATA_PATH
+
+RAW_TRAFFIC_PATH = os.path.join(DATA_PATH, "raw", "sid_dav_verkehrszaehlung_miv_OD2031_{year}.csv")
+TRAFFIC_DATASET_PATH = os.path.join(DATA_PATH, "clean", "traffic_data")
+TRAFFIC_YEARS = range(2012, 2024)
+ROW_GROUP_SIZE = 16384
+
+COLUMN_TYPES = {
+    'MSID': pa.dictionary(pa.int32(), pa.string()),
+    'EKoord': pa.float32(),
+    'NKoord': pa.float32(),
+    'MessungDatZeit': pa.timestamp('s'),
+    'AnzFahrzeuge': pa.float32(),
+}
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+
+
+def read_traffic_year(year: int, path_pattern: str = RAW_TRAFFIC_PATH) -> pa.Table:
+    """
+    Read the columns used by the model from the traffic counts of one year.
+
+    Returns:
+    - pa.Table: MSID (dictionary encoded), EKoord, NKoord, MessungDatZeit, AnzFahrzeuge and year.
+    """
+    table = csv.read_csv(
+        path_pattern.format(year=year),
+        convert_options=csv.ConvertOptions(column_types=COLUMN_TYPES, include_columns=list(COLUMN_TYPES)),
+    )
+    return table.append_column('year', pa.array(np.full(len(table), year, dtype=np.int16)))
+
+
+def read_traffic_data(years: Iterable[int] = TRAFFIC_YEARS, path_pattern: str = RAW_TRAFFIC_PATH,
+                      workers: int = 4) -> pd.DataFrame:
+    """
+    Read the traffic counts of several years in parallel.
+
+    A year that cannot be read is reported and left out, like in the original notebook loop.
+
+    Returns:
+    - pd.DataFrame: The rows of all years, with MSID as categorical.
+    """
+    years = list(years)
+
+    def read(year: int) -> Optional[pa.Table]:
+        try:
+            return read_traffic_year(year, path_pattern)
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"Error processing year {year}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        tables = [table for table in executor.map(read, years) if table is not None]
+    if not tables:
+        raise FileNotFoundError(f"No traffic data found for the years {years}.")
+    # Every file has its own MSID dictionary, unify them so the categorical has one set of categories. The
+    # categories stay in order of first appearance, so the codes match the ids pd.factorize gives the concatenated files
+    return pa.concat_tables(tables).unify_dictionaries().to_pandas()
+
+
+def trim_missing_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Remove the missing counts at the start and end of every station.
+
+    A row is kept if its station has a count at or before it and at or after it in time, so gaps within the
+    measured period stay for the imputation. Stations without any count are removed completely.
+
+    Parameters:
+    - df (pd.DataFrame): Traffic data with columns 'MSID', 'MessungDatZeit' and 'AnzFahrzeuge'.
+
+    Returns:
+    - pd.DataFrame: The trimmed rows sorted by MSID and MessungDatZeit.
+    """
+    df = df.sort_values(['MSID', 'MessungDatZeit'], kind='stable', ignore_index=True)
+    valid = df['AnzFahrzeuge'].notna().astype(np.int32)
+    groups = valid.groupby(df['MSID'], sort=False, observed=True)
+    # Counts at or before every row, and the number of counts of its station
+    seen = groups.cumsum()
+    total = groups.transform('sum')
+    keep = (seen > 0) & (total - seen + valid > 0)
+    return df[keep.to_numpy()].reset_index(drop=True)
+
+
+def write_traffic_dataset(df: pd.DataFrame, path: str = TRAFFIC_DATASET_PATH) -> None:
+    """
+    Write traffic data to a Parquet dataset partitioned by year, replacing the partitions of its years.
+
+    The rows are sorted by MSID and MessungDatZeit, so the statistics of the small row groups let a filtered
+    read skip the row groups of the other stations.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Parquet encodes the strings with a dictionary anyway, but the row group statistics are only used to skip
+    # row groups if the column is written as plain strings
+    table = table.set_column(table.schema.get_field_index('MSID'), 'MSID', table['MSID'].cast(pa.string()))
+    if 'year' not in table.column_names:
+        year = pc.year(table['MessungDatZeit']).cast(pa.int16())
+        table = table.append_column('year', year)
+    table = table.sort_by([('year', 'ascending'), ('MSID', 'ascending'), ('MessungDatZeit', 'ascending')])
+    ds.write_dataset(
+        table, path, format='parquet', partitioning=PARTITIONING, existing_data_behavior='delete_matching',
+        max_rows_per_group=ROW_GROUP_SIZE, min_rows_per_group=ROW_GROUP_SIZE,
+    )
+
+
+def ingest_traffic_data(years: Iterable[int] = TRAFFIC_YEARS, path: str = TRAFFIC_DATASET_PATH,
+                        path_pattern: str = RAW_TRAFFIC_PATH, workers: int = 4) -> pd.DataFrame:
+    """
+    Read the raw traffic counts of several years, trim the missing counts at the start and end of every
+    station and write the result to the partitioned Parquet dataset.
+
+    Returns:
+    - pd.DataFrame: The trimmed traffic data.
+    """
+    df = trim_missing_data(read_traffic_data(years, path_pattern, workers))
+    write_traffic_dataset(df, path)
+    return df
+
+
+def load_traffic_data(
+    msids: Optional[List[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    path: str = TRAFFIC_DATASET_PATH,
+) -> pd.DataFrame:
+    """
+    Read traffic data from the partitioned dataset, optionally only some stations and an hour range.
+
+    The filters are pushed down to the Parquet reader: only the partitions of the requested years are opened
+    and only the row groups whose station and time statistics overlap the filter are read.
+
+    Parameters:
+    - msids (list, optional): Stations to read. Defaults to all stations.
+    - start, end (str, optional): First and last hour to read, both inclusive, e.g. '2020-03-01 06:00'.
+    - columns (list, optional): Columns to read. Defaults to all columns.
+    - path (str): Directory of the dataset.
+
+    Returns:
+    - pd.DataFrame: The matching rows, with MSID as categorical.
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    conditions = []
+    if msids is not None:
+        conditions.append(ds.field('MSID').isin(list(msids)))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions += [ds.field('year') >= start.year, ds.field('MessungDatZeit') >= start.to_pydatetime()]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions += [ds.field('year') <= end.year, ds.field('MessungDatZeit') <= end.to_pydatetime()]
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    if 'MSID' in df:
+        df['MSID'] = df['MSID'].astype('category')
+    return df
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Ingest the yearly traffic counts into a Parquet dataset.")
+    parser.add_argument('--years', type=int, nargs=2, default=[TRAFFIC_YEARS[0], TRAFFIC_YEARS[-1]],
+                        metavar=('FIRST', 'LAST'), help="First and last year to ingest, both inclusive.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of files read at once.")
+    parser.add_argument('--path', default=TRAFFIC_DATASET_PATH, help="Directory of the Parquet dataset.")
+    args = parser.parse_args(argv)
+
+    df = ingest_traffic_data(range(args.years[0], args.years[1] + 1), path=args.path, workers=args.workers)
+    print(f"{len(df):,} rows of {df['MSID'].nunique()} stations saved at {args.path}.")
+
+
+if __name__ == '__main__':
+    main()
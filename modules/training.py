@@ -0,0 +1,381 @@
+# Contains the training of the severity model: the sparse training matrices in one binary file, a successive
+# halving search over the random forest hyperparameters of Modeling.ipynb and the final fit with its threshold.
+#
+# Usage (from the project root):
+#   python -m modules.training [--candidates 70] [--factor 3] [--cv 5] [--n-jobs -1] [--threshold 0.2]
+#   python -m modules.training --convert-csv data/training   (from the CSV files of an earlier Data Processing.ipynb)
+#
+# Every evaluated fold is appended to data/models/search_trials.jsonl as soon as it is done, so an interrupted
+# search continues where it stopped. The model, its flat forest and threshold.json are written to data/models/.
+import argparse
+import json
+import math
+import os
+import pickle
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy import sparse
+from scipy.stats import randint
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score, roc_curve
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+
+from config import MODEL_PATH, SEARCH_TRIALS_PATH, THRESHOLD_PATH, TRAINING_DATA_PATH
+from modules.forest_model import FlatForest, bundle_path, model_stamp, publish_version, retract_bundle
+
+# Search space of the RandomizedSearchCV in Modeling.ipynb
+PARAM_DISTRIBUTIONS = {
+    'n_estimators': randint(400, 1000),
+    'max_depth': [None] + list(range(5, 30, 5)),
+    'min_samples_split': randint(2, 10),
+    'min_samples_leaf': randint(1, 10),
+    'max_features': ['sqrt', 'log2', 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+    'bootstrap': [True, False],
+    'class_weight': [None, 'balanced'],
+}
+SEARCH_SEED = 74
+MODEL_SEED = 42
+
+
+def as_csr(X) -> sparse.csr_matrix:
+    """A feature matrix (dense, DataFrame or sparse) as CSR matrix of float32, the precision the trees split on."""
+    return sparse.csr_matrix(X if sparse.issparse(X) else np.asarray(X, dtype='float32'), dtype=np.float32)
+
+
+def save_training_data(X_train, X_test, y_train, y_test, feature_names=None, path: str = TRAINING_DATA_PATH) -> str:
+    """
+    Save the training and test matrices of Data Processing.ipynb to one compressed .npz file: the features as
+    CSR matrices of float32 (data, indices, indptr and shape per matrix), the labels as int8.
+
+    Returns:
+    - str: The path of the file.
+    """
+    if feature_names is None:
+        feature_names = list(X_train.columns) if isinstance(X_train, pd.DataFrame) else []
+    arrays = {}
+    for name, X in (('X_train', X_train), ('X_test', X_test)):
+        X = as_csr(X)
+        arrays.update({f'{name}_data': X.data, f'{name}_indices': X.indices, f'{name}_indptr': X.indptr,
+                       f'{name}_shape': np.asarray(X.shape)})
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # The column indices and the repeated volume values compress well, unpacking them takes milliseconds
+    np.savez_compressed(
+        path, **arrays,
+        y_train=np.asarray(y_train, dtype='int8').ravel(), y_test=np.asarray(y_test, dtype='int8').ravel(),
+        feature_names=np.asarray(feature_names, dtype=str),
+    )
+    return path
+
+
+def load_training_data(path: str = TRAINING_DATA_PATH) -> Dict[str, Union[sparse.csr_matrix, np.ndarray]]:
+    """
+    Load the matrices saved by save_training_data.
+
+    Returns:
+    - dict: 'X_train' and 'X_test' (CSR matrices), 'y_train', 'y_test' and 'feature_names'.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        training_data = {name: data[name] for name in ('y_train', 'y_test', 'feature_names')}
+        for name in ('X_train', 'X_test'):
+            if name in data.files:
+                # A file of the former dense format
+                training_data[name] = as_csr(data[name])
+            else:
+                training_data[name] = sparse.csr_matrix(
+                    (data[f'{name}_data'], data[f'{name}_indices'], data[f'{name}_indptr']),
+                    shape=tuple(data[f'{name}_shape']))
+    return training_data
+
+
+def convert_training_csv(directory: str, path: str = TRAINING_DATA_PATH) -> str:
+    """Convert X_train.csv, X_test.csv, y_train.csv and y_test.csv of a directory to the .npz file."""
+    frames = {name: pd.read_csv(os.path.join(directory, f'{name}.csv'))
+              for name in ('X_train', 'X_test', 'y_train', 'y_test')}
+    return save_training_data(frames['X_train'], frames['X_test'], frames['y_train'], frames['y_test'], path=path)
+
+
+def sample_candidates(n_candidates: int, distributions: Dict = PARAM_DISTRIBUTIONS,
+                      seed: int = SEARCH_SEED) -> List[Dict]:
+    """Random hyperparameter candidates as plain Python values, so they can be written to the trial log."""
+    return [{name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+            for params in ParameterSampler(distributions, n_candidates, random_state=seed)]
+
+
+def data_fingerprint(X, y: np.ndarray) -> str:
+    """Shape and checksums of the training data; trials of other data are not reused."""
+    parts = (X.data, X.indices, X.indptr) if sparse.issparse(X) else (X,)
+    checksum = 0
+    for part in parts:
+        checksum = zlib.crc32(np.ascontiguousarray(part), checksum)
+    return f"{X.shape[0]}x{X.shape[1]}:{checksum:08x}:{zlib.crc32(np.ascontiguousarray(y)):08x}"
+
+
+def dense_rows(X, rows=None) -> np.ndarray:
+    """
+    Rows of a feature matrix as dense float32 array for the fit of a forest. sklearn builds the same trees from
+    CSR input, but its sparse splitter is several times slower at the density of the training matrices, so only
+    the rows of one fit are densified at a time.
+    """
+    X = X if rows is None else X[rows]
+    return X.toarray() if sparse.issparse(X) else np.asarray(X, dtype=np.float32)
+
+
+class TrialLog:
+    """
+    Append-only log of evaluated folds, one JSON line per fold with its key and ROC AUC.
+
+    Parameters:
+    - path (str, optional): Location of the log, None keeps the trials in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = SEARCH_TRIALS_PATH):
+        self.path = path
+        self.scores: Dict[str, float] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    # The last line may be cut off by an interrupted run
+                    try:
+                        trial = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.scores[trial['key']] = trial['score']
+
+    @staticmethod
+    def key(fingerprint: str, params: Dict, resource: int, n_splits: int, fold: int, seed: int) -> str:
+        return json.dumps([fingerprint, params, resource, n_splits, fold, seed], sort_keys=True)
+
+    def record(self, key: str, score: float, seconds: float) -> None:
+        self.scores[key] = score
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as file:
+                file.write(json.dumps({'key': key, 'score': score, 'seconds': round(seconds, 3)}) + '\n')
+
+
+def _evaluate_fold(key: str, X, y, params: Dict, train: np.ndarray, test: np.ndarray,
+                   seed: int) -> Tuple[str, float, float]:
+    start_time = time.perf_counter()
+    model = RandomForestClassifier(random_state=seed, n_jobs=1, **params).fit(dense_rows(X, train), y[train])
+    score = roc_auc_score(y[test], model.predict_proba(X[test])[:, 1])
+    return key, float(score), time.perf_counter() - start_time
+
+
+def resource_schedule(n_samples: int, n_candidates: int, factor: int = 3, min_resources: int = 0) -> List[int]:
+    """
+    Training rows per round: every round keeps the best 1/factor of the candidates and gives them factor times
+    the rows, the last round uses all rows.
+    """
+    rounds = 1
+    while factor ** rounds < n_candidates:
+        rounds += 1
+    return [max(min(min_resources, n_samples), n_samples // factor ** (rounds - 1 - i)) for i in range(rounds)]
+
+
+def successive_halving(
+    X,
+    y: np.ndarray,
+    candidates: List[Dict],
+    factor: int = 3,
+    n_splits: int = 5,
+    min_resources: Optional[int] = None,
+    n_jobs: int = -1,
+    seed: int = SEARCH_SEED,
+    trials: Optional[TrialLog] = None,
+    verbose: bool = False,
+) -> Tuple[Dict, pd.DataFrame]:
+    """
+    Search the best candidate by cross-validated ROC AUC with successive halving.
+
+    All candidates are first evaluated on a small random subset of the rows, only the best 1/factor of every
+    round go on to factor times the rows, until the last candidates are evaluated on all rows. Most of the
+    evaluations are on a small part of the data, so the search costs a few full evaluations instead of one per
+    candidate. The subsets are nested and stratified folds are drawn per subset; the folds of a round are
+    fitted in parallel, one tree ensemble per core.
+
+    Parameters:
+    - X (scipy.sparse matrix or np.ndarray): Training features, CSR rows are densified per fit only.
+    - y (np.ndarray): Training labels.
+    - candidates (list): Hyperparameters of the random forest to compare.
+    - factor (int): Reduction of the candidates and growth of the rows per round.
+    - n_splits (int): Cross-validation folds.
+    - min_resources (int, optional): Minimum rows of the first round, defaults to 20 rows per fold.
+    - n_jobs (int): Parallel fits, -1 for all cores.
+    - seed (int): Seed of the subsets, the folds and the forests.
+    - trials (TrialLog, optional): Log of evaluated folds, folds in the log are not fitted again.
+    - verbose (bool): Print a line per round.
+
+    Returns:
+    - tuple: (best candidate, results with one row per candidate and round).
+    """
+    trials = trials or TrialLog(None)
+    fingerprint = data_fingerprint(X, y)
+    order = np.random.default_rng(seed).permutation(len(y))
+    schedule = resource_schedule(len(y), len(candidates), factor, min_resources or 20 * n_splits)
+    survivors = list(range(len(candidates)))
+    results = []
+
+    for round_index, resource in enumerate(schedule):
+        start_time = time.perf_counter()
+        rows = np.sort(order[:resource])
+        folds = list(StratifiedKFold(n_splits, shuffle=True, random_state=seed).split(rows, y[rows]))
+        jobs = {TrialLog.key(fingerprint, candidates[c], int(resource), n_splits, f, seed): (c, f)
+                for c in survivors for f in range(n_splits)}
+        pending = [key for key in jobs if key not in trials.scores]
+        # Large arrays are memory-mapped for the workers by joblib, every fold is logged as soon as it is done
+        for key, score, seconds in Parallel(n_jobs=n_jobs, return_as='generator_unordered')(
+                delayed(_evaluate_fold)(key, X, y, candidates[jobs[key][0]], rows[folds[jobs[key][1]][0]],
+                                        rows[folds[jobs[key][1]][1]], seed) for key in pending):
+            trials.record(key, score, seconds)
+
+        scores = {c: float(np.mean([trials.scores[key] for key, (candidate, _) in jobs.items() if candidate == c]))
+                  for c in survivors}
+        results += [{'candidate': c, 'round': round_index, 'rows': int(resource), 'mean_roc_auc': scores[c],
+                     'params': candidates[c]} for c in survivors]
+        ranked = sorted(survivors, key=lambda c: scores[c], reverse=True)
+        if verbose:
+            print(f"Round {round_index + 1}/{len(schedule)}: {len(survivors)} candidates on {resource:,} rows, "
+                  f"{len(jobs) - len(pending)} folds from the log, best ROC AUC {scores[ranked[0]]:.4f} "
+                  f"({time.perf_counter() - start_time:.1f} s)")
+        survivors = ranked[:math.ceil(len(ranked) / factor)]
+
+    return candidates[ranked[0]], pd.DataFrame(results)
+
+
+def _fold_probabilities(X, y, params: Dict, train: np.ndarray, test: np.ndarray,
+                        seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    model = RandomForestClassifier(random_state=seed, n_jobs=1, **params).fit(dense_rows(X, train), y[train])
+    return test, model.predict_proba(X[test])[:, 1]
+
+
+def out_of_fold_probabilities(X, y: np.ndarray, params: Dict, n_splits: int = 5, n_jobs: int = -1,
+                              seed: int = SEARCH_SEED) -> np.ndarray:
+    """
+    Probability of the positive class for every training row from a forest fitted on the other folds, so the
+    threshold can be chosen on the training rows without the optimism of predictions on rows the forest saw.
+    """
+    probabilities = np.empty(len(y))
+    folds = StratifiedKFold(n_splits, shuffle=True, random_state=seed).split(np.zeros(len(y)), y)
+    for test, fold_probabilities in Parallel(n_jobs=n_jobs)(
+            delayed(_fold_probabilities)(X, y, params, train, test, seed) for train, test in folds):
+        probabilities[test] = fold_probabilities
+    return probabilities
+
+
+def j_statistic_threshold(y_true: np.ndarray, probabilities: np.ndarray) -> float:
+    """The probability threshold with the best separation of the classes (maximum TPR - FPR), as in Modeling.ipynb."""
+    fpr, tpr, thresholds = roc_curve(y_true, probabilities)
+    return float(thresholds[(tpr - fpr).argmax()])
+
+
+def train(
+    data_path: str = TRAINING_DATA_PATH,
+    model_path: str = MODEL_PATH,
+    threshold_path: str = THRESHOLD_PATH,
+    trials_path: Optional[str] = SEARCH_TRIALS_PATH,
+    n_candidates: int = 70,
+    factor: int = 3,
+    n_splits: int = 5,
+    n_jobs: int = -1,
+    threshold: Union[float, str] = 'j-statistic',
+    distributions: Dict = PARAM_DISTRIBUTIONS,
+    verbose: bool = False,
+) -> Dict:
+    """
+    Search the hyperparameters, fit the final model on all training rows and write the model, its flat forest
+    and the threshold.
+
+    Parameters:
+    - data_path (str): The .npz file of save_training_data.
+    - model_path (str): Location of the pickled model; the flat forest is exported next to it.
+    - threshold_path (str): Location of the threshold file.
+    - trials_path (str, optional): Log of evaluated folds, None to search without checkpoints.
+    - n_candidates, factor, n_splits, n_jobs: See successive_halving.
+    - threshold (float or str): A fixed threshold, or 'j-statistic' to choose it on out-of-fold predictions of
+      the training rows. The test set is only used for the reported test ROC AUC.
+    - distributions (dict): Search space.
+    - verbose (bool): Print the progress.
+
+    Returns:
+    - dict: The content of the threshold file: threshold, best parameters and ROC AUC.
+    """
+    data = load_training_data(data_path)
+    X_train, y_train = data['X_train'], data['y_train']
+    candidates = sample_candidates(n_candidates, distributions)
+    start_time = time.perf_counter()
+    best_params, results = successive_halving(X_train, y_train, candidates, factor, n_splits, n_jobs=n_jobs,
+                                              trials=TrialLog(trials_path), verbose=verbose)
+    search_seconds = time.perf_counter() - start_time
+
+    model = RandomForestClassifier(random_state=MODEL_SEED, n_jobs=n_jobs, **best_params)
+    model.fit(dense_rows(X_train), y_train)
+    # The app and the batch scoring decide about the parallelism themselves
+    model.n_jobs = None
+    if threshold == 'j-statistic':
+        threshold = j_statistic_threshold(
+            y_train, out_of_fold_probabilities(X_train, y_train, best_params, n_splits, n_jobs, MODEL_SEED))
+    probabilities = model.predict_proba(data['X_test'])[:, 1]
+
+    last_round = results[results['round'] == results['round'].max()]
+    summary = {
+        'threshold': float(threshold),
+        'params': best_params,
+        'cv_roc_auc': float(last_round['mean_roc_auc'].max()),
+        'test_roc_auc': float(roc_auc_score(data['y_test'], probabilities)),
+        'candidates': n_candidates,
+        'search_seconds': round(search_seconds, 1),
+        'trained_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+    }
+
+    # Everything is written next to its target first, then swapped in: the old bundle is retracted before the
+    # pickle is replaced, so load_model never serves the old forest with the new pickle or threshold
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    forest_path = bundle_path(model_path)
+    with open(model_path + '.tmp', 'wb') as file:
+        pickle.dump(model, file)
+    # The pickle keeps its modification time when it is moved into place
+    forest = FlatForest.from_sklearn(model, list(data['feature_names']))
+    forest.source = model_stamp(model_path + '.tmp')
+    version = forest.save(forest_path, publish=False)
+    with open(threshold_path + '.tmp', 'w') as file:
+        json.dump(summary, file, indent=1)
+    retract_bundle(forest_path)
+    os.replace(model_path + '.tmp', model_path)
+    os.replace(threshold_path + '.tmp', threshold_path)
+    publish_version(forest_path, version)
+    return summary
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Search and fit the random forest of the severity model.")
+    parser.add_argument('--data', default=TRAINING_DATA_PATH, help="Training matrices (.npz).")
+    parser.add_argument('--convert-csv', metavar='DIRECTORY',
+                        help="Convert X_train.csv, X_test.csv, y_train.csv and y_test.csv of DIRECTORY to --data first.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Location of the pickled model.")
+    parser.add_argument('--candidates', type=int, default=70, help="Number of random hyperparameter candidates.")
+    parser.add_argument('--factor', type=int, default=3, help="Reduction of the candidates per round.")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds.")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Parallel fits, -1 for all cores.")
+    parser.add_argument('--threshold', default='j-statistic',
+                        help="Fixed threshold, or 'j-statistic' to choose it on out-of-fold training predictions.")
+    parser.add_argument('--no-checkpoint', action='store_true', help="Do not read or write the trial log.")
+    args = parser.parse_args(argv)
+
+    if args.convert_csv:
+        print(f"Training data saved at {convert_training_csv(args.convert_csv, args.data)}.")
+    threshold = args.threshold if args.threshold == 'j-statistic' else float(args.threshold)
+    summary = train(args.data, args.model, trials_path=None if args.no_checkpoint else SEARCH_TRIALS_PATH,
+                    n_candidates=args.candidates, factor=args.factor, n_splits=args.cv, n_jobs=args.n_jobs,
+                    threshold=threshold, verbose=True)
+    print(f"Best parameters: {summary['params']}")
+    print(f"ROC AUC {summary['cv_roc_auc']:.4f} (cross-validated), {summary['test_roc_auc']:.4f} (test), "
+          f"threshold {summary['threshold']:.3f}. Model saved at {args.model}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 # Contains functions for getting average volume data and pre-trained Columntransformer during inference
 import random
-from joblib import load
 import time
+import numpy as np
 import pandas as pd
 from datetime import timedelta, datetime
-from modules.open_meteo_api import open_meteo_request
-from pyproj import Transformer
+from modules.weather_cache import cached_open_meteo_request
+from modules.location_index import LocationIndex
+from modules.preprocessing import get_preprocessing_service
+from modules.projection import add_wgs84_columns
 
 def timed_function(func):
     def wrapper(*args, **kwargs):
@@ -18,14 +20,15 @@ def timed_function(func):
     return wrapper
 
 def convert_lv95_to_wgs84(df):
-    transformer = Transformer.from_crs("EPSG:2056", "EPSG:4326", always_xy=True)
-    df['lon'], df['lat'] = transformer.transform(df['x'].values, df['y'].values)
-    return df
+    # Returns a new frame with the 'lon' and 'lat' columns, the input frame is no longer modified
+    return add_wgs84_columns(df)
 
 
-def get_road_type(lon, lat, locations, n=1):
-    distances = (locations['lon'] - lon) ** 2 + (locations['lat'] - lat) ** 2
-    closest_indices = distances.nsmallest(n*5).index.tolist()  # Get closest 100 indices
+def get_road_type(lon, lat, locations, n=1, index=None):
+    # Use the prebuilt spatial index if given, building one here is as expensive as a full scan
+    if index is None:
+        index = LocationIndex(locations)
+    closest_indices = index.nearest(lon, lat, n*5)  # Get closest n*5 indices
     n = min(n, len(closest_indices))  # Ensure n doesn't exceed available locations
     selected_indices = random.sample(closest_indices, n)  # Randomly select n indices
 
@@ -35,47 +38,95 @@ def get_road_type(lon, lat, locations, n=1):
 
     return roadtypes, closest_x, closest_y
 
-@timed_function
+def build_volume_table(volume):
+    """
+    Build a dense lookup table of the average volumes indexed by [month, weekday, hour].
+
+    Parameters:
+    - volume (pd.DataFrame): Average volume data with the columns month, weekday, hour, traffic, pedestrian.
+
+    Returns:
+    - np.ndarray: Array of shape (13, 8, 24, 2) holding traffic and pedestrian volume, NaN where no average exists.
+    """
+    table = np.full((13, 8, 24, 2), np.nan)
+    # Rows with a key outside of the table cannot be looked up, as in the merge they are left out
+    valid, keys = _volume_keys(table, volume['month'].to_numpy(), volume['weekday'].to_numpy(),
+                               volume['hour'].to_numpy())
+    table.reshape(-1, 2)[keys[valid]] = volume[['traffic', 'pedestrian']].to_numpy(dtype='float64')[valid]
+    return table
+
+
+def _volume_keys(table, month, weekday, hour):
+    """Flat position of [month, weekday, hour] in the table and whether the key lies inside of it."""
+    months, weekdays, hours = table.shape[:3]
+    valid = (month >= 0) & (month < months) & (weekday >= 0) & (weekday < weekdays) & (hour >= 0) & (hour < hours)
+    month, weekday, hour = (np.where(valid, values, 0).astype(np.int64) for values in (month, weekday, hour))
+    return valid, (month * weekdays + weekday) * hours + hour
+
+
 def assign_average_volume(df, volume, number_of_stations, number_of_periods):
-    # Make a copy of df to avoid modifying the original
-    result_df = df.copy()
-
-    # For each period, we shift the hour and merge with the volume df
-    for p in range(number_of_periods):
-        # Compute the shifted hour
-        # If you need to wrap around 24 hours:
-        shifted_hour = (result_df['hour'] + p) % 24
-
-        # Create a temporary dataframe to merge on month, weekday, shifted hour
-        temp_merge_df = result_df[['month', 'weekday']].copy()
-        temp_merge_df['hour_shifted'] = shifted_hour
-
-        # Merge with the volume dataframe on month, weekday, and hour
-        # Note: the volume df is assumed to have exactly these columns: month, weekday, hour, traffic, pedestrian
-        merged = temp_merge_df.merge(volume, how='left',
-                                     left_on=['month', 'weekday', 'hour_shifted'],
-                                     right_on=['month', 'weekday', 'hour'])
-
-        # After merge, we have the columns 'traffic' and 'pedestrian' from the volume dataframe
-        # For each station s, we create duplicate columns
-        for s in range(number_of_stations):
-            traffic_col = f"traffic_volume_{s}_period_{p}"
-            pedestrian_col = f"pedestrian_volume_{s}_period_{p}"
-
-            # Assign the merged values
-            result_df[traffic_col] = merged['traffic']
-            result_df[pedestrian_col] = merged['pedestrian']
-
-    return result_df
-
-@timed_function
+    # The volume data can be passed as dataframe or as prebuilt lookup table
+    table = volume if isinstance(volume, np.ndarray) else build_volume_table(volume)
+
+    # Flat table key of every row and (wrapped around) shifted hour: shape (periods, rows). A month or weekday
+    # outside of the table (or a missing hour) points to a NaN row after the table, the merge found no average
+    hours = table.shape[2]
+    valid, keys = _volume_keys(table, df['month'].to_numpy(), df['weekday'].to_numpy(),
+                               df['hour'].to_numpy() % hours)
+    keys = keys - keys % hours + (keys % hours + np.arange(number_of_periods)[:, None]) % hours
+    flat = np.vstack([table.reshape(-1, 2), np.full((1, 2), np.nan)])
+    keys[:, ~valid] = len(flat) - 1
+    # Look up all rows and periods at once: shape ([traffic, pedestrian], periods, rows)
+    volumes = flat.T[:, keys]
+
+    # Every station gets the same average volume, so the lookup is broadcast into one column-major block
+    block = np.empty((number_of_periods, number_of_stations, 2, len(df)))
+    block[:] = volumes.transpose(1, 0, 2)[:, None]
+    columns = [f"{name}_volume_{s}_period_{p}"
+               for p in range(number_of_periods)
+               for s in range(number_of_stations)
+               for name in ('traffic', 'pedestrian')]
+
+    volume_df = pd.DataFrame(block.reshape(-1, len(df)).T, columns=columns, index=df.index, copy=False)
+    return pd.concat([df, volume_df], axis=1)
+
+def build_weather_array(weather, features):
+    """
+    Build an hourly time-indexed array of the weather features.
+
+    Parameters:
+    - weather (pd.DataFrame): Weather dataframe containing 'dateTime' (datetime) and the weather features.
+    - features (list): List of weather feature column names.
+
+    Returns:
+    - tuple: (start, values) where start is the first hour as np.datetime64 and values is an array of shape
+      (hours, features) with row i holding the weather at start + i hours, NaN for hours without weather data.
+    """
+    times = weather['dateTime'].to_numpy(dtype='datetime64[ns]')
+    if len(times) == 0:
+        return np.datetime64(0, 'ns'), np.full((1, len(features)), np.nan)
+
+    hour = np.timedelta64(1, 'h')
+    start = times.min()
+    offsets, remainders = np.divmod(times - start, hour)
+    # Only timestamps on the hourly grid can match, the first row wins for duplicated timestamps
+    on_grid = np.flatnonzero(remainders == np.timedelta64(0, 'ns'))[::-1]
+
+    values = np.full((int(offsets.max()) + 1, len(features)), np.nan)
+    values[offsets[on_grid]] = weather[features].to_numpy(dtype='float64')[on_grid]
+    return start, values
+
+
 def assign_weather(df, weather, number_of_periods, features):
     """
     Assign weather features to the main dataframe based on shifted time periods.
 
+    Period p holds the weather p hours before each row's 'dateTime', NaN if there is no weather for that hour.
+
     Parameters:
     - df (pd.DataFrame): Main dataframe containing at least 'dateTime'.
-    - weather (pd.DataFrame): Weather dataframe containing 'dateTime' and weather features.
+    - weather (pd.DataFrame or tuple): Weather dataframe containing 'dateTime' and weather features,
+      or the (start, values) array built by build_weather_array for these features.
     - number_of_periods (int): Number of hourly periods to shift and merge.
     - features (list): List of weather feature column names to merge.
 
@@ -86,34 +137,46 @@ def assign_weather(df, weather, number_of_periods, features):
 
     # Ensure 'dateTime' is datetime
     df['dateTime'] = pd.to_datetime(df['dateTime'], errors='coerce')
-    weather['dateTime'] = pd.to_datetime(weather['dateTime'], errors='coerce')
 
     # Validate 'dateTime' conversion
     if df['dateTime'].isnull().any():
         raise ValueError("Some 'dateTime' values in df could not be converted to datetime.")
-    if weather['dateTime'].isnull().any():
-        raise ValueError("Some 'dateTime' values in weather could not be converted to datetime.")
 
-    for p in range(number_of_periods):
-        temp = weather.copy()
+    if isinstance(weather, tuple):
+        start, values = weather
+    else:
+        weather['dateTime'] = pd.to_datetime(weather['dateTime'], errors='coerce')
+        if weather['dateTime'].isnull().any():
+            raise ValueError("Some 'dateTime' values in weather could not be converted to datetime.")
+        start, values = build_weather_array(weather, features)
 
-        # Shift the dateTime by p hours
-        temp['dateTime'] = temp['dateTime'] + pd.Timedelta(hours=p)
+    # Hour offset of every row and period into the weather array: shape (rows, periods)
+    offsets, remainders = np.divmod(df['dateTime'].to_numpy(dtype='datetime64[ns]') - start, np.timedelta64(1, 'h'))
+    offsets = offsets[:, None] - np.arange(number_of_periods)
+    valid = (remainders == np.timedelta64(0, 'ns'))[:, None] & (offsets >= 0) & (offsets < len(values))
 
-        # Rename features to include the period
-        rename_dict = {feature: f'{feature}_period_{p}' for feature in features}
-        temp.rename(columns=rename_dict, inplace=True)
+    # Hours outside the weather series point at an extra all-NaN row, then all periods and features
+    # are gathered at once: shape (rows, periods * features)
+    padded = np.vstack([values, np.full((1, values.shape[1]), np.nan)])
+    block = padded.take(np.where(valid, offsets, len(values)), axis=0).reshape(len(df), -1)
 
-        # Merge with the main dataframe
-        df = df.merge(
-            temp,
-            on=['dateTime'],
-            how='left'
-        )
+    columns = [f'{feature}_period_{p}' for p in range(number_of_periods) for feature in features]
+    weather_df = pd.DataFrame(block, columns=columns, index=df.index, copy=False)
+    return pd.concat([df, weather_df], axis=1)
 
-    return df
+WEATHER_FEATURES = ['temperature_2m', 'precipitation', 'snowfall', 'snow_depth', 'surface_pressure', 'cloud_cover']
 
-def get_weather(df, selected_datetime):
+def get_weather_window(selected_datetime, blocking=False):
+    """
+    Get the hourly weather of the day of selected_datetime and the day before.
+
+    Parameters:
+    - selected_datetime (datetime): The time of the accident.
+    - blocking (bool): Wait for the API rate limiter instead of failing when a limit is reached.
+
+    Returns:
+    - pd.DataFrame: Weather dataframe with 'dateTime' and the weather features.
+    """
     now = datetime.now()
     buffer_time = now - timedelta(days=6)
 
@@ -125,61 +188,30 @@ def get_weather(df, selected_datetime):
     else:
         base_url = "https://api.open-meteo.com/v1/forecast"
 
-    weather = open_meteo_request(
+    weather = cached_open_meteo_request(
         start_date=start_date.strftime('%Y-%m-%d'),
         end_date=end_date.strftime('%Y-%m-%d'),
         base_url=base_url,
+        blocking=blocking,
     )
+    if weather is None:
+        raise ValueError(f"No weather data available for {selected_datetime:%Y-%m-%d}.")
     weather = pd.DataFrame(weather)
-    weather_features = ['temperature_2m', 'precipitation', 'snowfall', 'snow_depth', 'surface_pressure', 'cloud_cover']
     weather['dateTime'] = pd.to_datetime(weather['time'])
     weather.drop(columns=['time'], inplace=True)
-    df = assign_weather(df, weather, 4, weather_features)
+    return weather
+
+def get_weather(df, selected_datetime):
+    weather = get_weather_window(selected_datetime)
+    df = assign_weather(df, weather, 4, WEATHER_FEATURES)
     return df
 
-def transform(df):
-    # Drop the unwanted columns
-    drop_features = ['dateTime']
-    df = df.drop(columns=drop_features, inplace=False)
-
-    # Load the preprocessor
-    preprocessor = load('data/inference/preprocessor.pkl')
-
-    # Define the feature lists as used during preprocessing
-    numerical_features = [
-        'traffic_volume_0_period_0', 'traffic_volume_1_period_0', 'traffic_volume_2_period_0',
-        'traffic_volume_0_period_1', 'traffic_volume_1_period_1', 'traffic_volume_2_period_1',
-        'pedestrian_volume_0_period_0', 'pedestrian_volume_1_period_0', 'pedestrian_volume_2_period_0',
-        'pedestrian_volume_0_period_1', 'pedestrian_volume_1_period_1', 'pedestrian_volume_2_period_1',
-        'temperature_2m_period_0', 'precipitation_period_0', 'snowfall_period_0', 'snow_depth_period_0',
-        'surface_pressure_period_0', 'cloud_cover_period_0', 'temperature_2m_period_1',
-        'precipitation_period_1', 'snowfall_period_1', 'snow_depth_period_1',
-        'surface_pressure_period_1', 'cloud_cover_period_1', 'temperature_2m_period_2',
-        'precipitation_period_2', 'snowfall_period_2', 'snow_depth_period_2',
-        'surface_pressure_period_2', 'cloud_cover_period_2', 'temperature_2m_period_3',
-        'precipitation_period_3', 'snowfall_period_3', 'snow_depth_period_3',
-        'surface_pressure_period_3', 'cloud_cover_period_3'
-    ]
-
-    categorical_features = [
-        'AccidentType', 'AccidentInvolvingPedestrian', 'AccidentInvolvingBicycle',
-        'AccidentInvolvingMotorcycle', 'RoadType', 'month', 'weekday', 'hour'
-    ]
-
-    # Transform the dataframe
-    transformed = preprocessor.transform(df)
-
-    # Get the one-hot encoded feature names for categorical variables
-    cat_onehot_features = preprocessor.named_transformers_['cat'] \
-        .named_steps['onehot'].get_feature_names_out(categorical_features)
-
-    # Combine numerical and categorical feature names
-    processed_features = numerical_features + list(cat_onehot_features)
-
-    # Convert the transformed ndarray to a DataFrame with the appropriate column names
-    df_transformed = pd.DataFrame(transformed, columns=processed_features, index=df.index)
-
-    return df_transformed
+def transform(df, model=None):
+    # The preprocessor is loaded once per process, see modules/preprocessing.py. The features are the CSR matrix
+    # or dense array of the preprocessor, for a model after its feature names are checked
+    if model is None:
+        return get_preprocessing_service().transform_matrix(df)
+    return get_preprocessing_service().transform_for(df, model)
 
 def translate_columns(df):
     # --- Define Mapping Dictionaries ---
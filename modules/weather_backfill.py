@@ -0,0 +1,239 @@
+# Contains the backfill of historic Open-Meteo weather data in month or year windows.
+#
+# Usage (from the project root):
+#   python -m modules.weather_backfill 2012-01-01 2023-12-31 [--window month] [--workers 4] [--csv data/raw/weather_data.csv]
+#
+# Every window is written to its own Parquet part as soon as it arrives, so only the windows in flight are held
+# in memory. Parts that exist already are not fetched again: an interrupted run continues where it stopped. The
+# archive lags a few days behind, a part whose last hours were still empty is fetched again by a later run. The
+# last hour with values of every part is kept in index.json next to the parts.
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import DATA_PATH
+from modules.open_meteo_api import DEFAULT_HOURLY, open_meteo_request
+
+WEATHER_PARTS_PATH = os.path.join(DATA_PATH, "raw", "weather_data")
+WINDOW_FREQUENCIES = {'month': 'MS', 'year': 'YS'}
+INDEX_FILE = 'index.json'
+
+
+def split_windows(start_date: str, end_date: str, window: str = 'month') -> List[Tuple[str, str]]:
+    """
+    Split a date range into calendar month or year windows.
+
+    Returns:
+    - list: (start_date, end_date) per window in YYYY-MM-DD format, both inclusive.
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    starts = [start] + [timestamp for timestamp in pd.date_range(start, end, freq=WINDOW_FREQUENCIES[window])
+                        if timestamp > start]
+    ends = [next_start - pd.Timedelta(days=1) for next_start in starts[1:]] + [end]
+    return [(a.date().isoformat(), b.date().isoformat()) for a, b in zip(starts, ends)]
+
+
+def part_path(path: str, window: Tuple[str, str]) -> str:
+    return os.path.join(path, f"{window[0]}_{window[1]}.parquet")
+
+
+def window_end(window: Tuple[str, str]) -> pd.Timestamp:
+    """Last hour of a window."""
+    return pd.Timestamp(window[1]) + pd.Timedelta(hours=23)
+
+
+def last_hours(path: str = WEATHER_PARTS_PATH) -> Dict[str, Optional[pd.Timestamp]]:
+    """
+    The last hour with weather values of every part, None for a part without values.
+
+    The hours are kept in index.json with the modification time of their part, only parts that are new or were
+    written again since are read.
+
+    Returns:
+    - dict: Last hour per part file name.
+    """
+    if not os.path.isdir(path):
+        return {}
+    index_path = os.path.join(path, INDEX_FILE)
+    try:
+        with open(index_path) as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        index = {}
+    entries = {}
+    for name in sorted(f for f in os.listdir(path) if f.endswith('.parquet')):
+        modified = os.stat(os.path.join(path, name)).st_mtime_ns
+        if name in index and index[name][0] == modified:
+            entries[name] = index[name]
+            continue
+        weather = pq.read_table(os.path.join(path, name)).to_pandas()
+        times = weather.loc[weather.drop(columns='time').notna().any(axis=1), 'time']
+        entries[name] = [modified, times.max().isoformat() if len(times) else None]
+    if entries != index:
+        with open(index_path + '.tmp', 'w') as file:
+            json.dump(entries, file, indent=1)
+        os.replace(index_path + '.tmp', index_path)
+    return {name: pd.Timestamp(last) if last is not None else None for name, (_, last) in entries.items()}
+
+
+def to_table(data: Dict[str, list], hourly: List[str]) -> pa.Table:
+    columns = {'time': pa.array(np.array(data['time'], dtype='datetime64[s]'))}
+    for variable in hourly:
+        columns[variable] = pa.array(np.array(data[variable], dtype='float64'))
+    return pa.table(columns)
+
+
+def deduplicate_hours(weather: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per hour of weather parts that overlap (parts of runs with another window or start date). Of the rows
+    of an hour the one with the most values is kept, of those the one of the later part.
+
+    Parameters:
+    - weather (pd.DataFrame): Rows of the parts in part order, with 'time' and the variables.
+
+    Returns:
+    - pd.DataFrame: The rows sorted by 'time'.
+    """
+    values = weather.drop(columns='time').notna().sum(axis=1).to_numpy()
+    weather = weather.iloc[np.lexsort((np.arange(len(weather)), values, weather['time'].to_numpy()))]
+    return weather[~weather['time'].duplicated(keep='last')].reset_index(drop=True)
+
+
+def backfill_weather(
+    start_date: str,
+    end_date: str,
+    path: str = WEATHER_PARTS_PATH,
+    window: str = 'month',
+    workers: int = 4,
+    retries: int = 3,
+    hourly: Optional[List[str]] = None,
+    fetch: Callable[..., Optional[Dict[str, list]]] = open_meteo_request,
+    **request_params,
+) -> List[Tuple[str, str]]:
+    """
+    Fetch hourly weather data for a date range window by window into Parquet parts.
+
+    The windows are fetched by several threads. Every request takes its token from the shared rate limiter
+    (blocking), so the backfill stays within the API limits however many workers run. A failed window is
+    retried on its own with backoff, the other windows are not affected. Windows with a part are skipped,
+    unless the last hours of the part are empty because the archive did not have them yet.
+
+    Parameters:
+    - start_date, end_date (str): Range to fetch in YYYY-MM-DD format, both inclusive.
+    - path (str): Directory of the Parquet parts, one file per window.
+    - window (str): 'month' or 'year'.
+    - workers (int): Number of windows fetched at once.
+    - retries (int): Attempts per window after a failure.
+    - hourly (list, optional): Hourly variables. Defaults to the variables used by the model.
+    - fetch (callable): Request function with the signature of `open_meteo_request`.
+    - **request_params: Further parameters passed on to fetch (coordinates, timezone, units, base_url).
+
+    Returns:
+    - list: The windows that could not be fetched, empty if the backfill is complete.
+    """
+    hourly = hourly or DEFAULT_HOURLY
+    os.makedirs(path, exist_ok=True)
+    # New windows, and windows whose part ends with hours that were not in the archive yet
+    fetched = {name: last for name, last in last_hours(path).items() if last is not None}
+    windows = [w for w in split_windows(start_date, end_date, window)
+               if fetched.get(os.path.basename(part_path(path, w)), pd.Timestamp.min) < window_end(w)]
+
+    def fetch_window(w: Tuple[str, str]) -> bool:
+        for attempt in range(retries + 1):
+            data = fetch(start_date=w[0], end_date=w[1], hourly=hourly, blocking=True, **request_params)
+            if data is not None:
+                # Write to a temporary file first so an interrupted run never leaves a partial part behind
+                temp_path = part_path(path, w) + '.tmp'
+                pq.write_table(to_table(data, hourly), temp_path)
+                os.replace(temp_path, part_path(path, w))
+                return True
+            if attempt < retries:
+                time.sleep(2 ** attempt)
+        return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        done = list(executor.map(fetch_window, windows))
+    # Index the new parts
+    last_hours(path)
+    return [w for w, ok in zip(windows, done) if not ok]
+
+
+def export_csv(path: str, csv_path: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+    """
+    Write the Parquet parts of a date range to one CSV file in the format of the raw weather data ('time' and the
+    variables), one row per hour.
+
+    Parts of runs with another window or start date overlap, their hours are written once (see
+    deduplicate_hours). The parts are read one at a time in the order of their start: the hours before the
+    start of a part can not be in any later part and are written, only the hours after it are held back and
+    combined with the part, so memory use depends on the size of the parts only.
+
+    Parameters:
+    - path (str): Directory of the Parquet parts.
+    - csv_path (str): The CSV file.
+    - start_date, end_date (str, optional): Range to export in YYYY-MM-DD format, both inclusive. Defaults to
+      all parts.
+
+    Returns:
+    - int: Number of written rows.
+    """
+    first = pd.Timestamp(start_date) if start_date is not None else pd.Timestamp.min
+    after = pd.Timestamp(end_date) + pd.Timedelta(days=1) if end_date is not None else pd.Timestamp.max
+    rows, started = 0, False
+
+    def write(df: pd.DataFrame) -> None:
+        nonlocal rows, started
+        df = df[(df['time'] >= first) & (df['time'] < after)]
+        df.assign(time=df['time'].dt.strftime('%Y-%m-%dT%H:%M')).to_csv(
+            csv_path, mode='a' if started else 'w', header=not started, index=False)
+        rows, started = rows + len(df), True
+
+    held = None
+    for file_name in sorted(f for f in os.listdir(path) if f.endswith('.parquet')):
+        part_start, part_end = file_name[:-len('.parquet')].split('_')
+        if pd.Timestamp(part_start) >= after or window_end((part_start, part_end)) < first:
+            continue
+        part = pq.read_table(os.path.join(path, file_name)).to_pandas()
+        if held is not None:
+            written = held['time'] < pd.Timestamp(part_start)
+            if written.any():
+                write(held[written])
+            part = deduplicate_hours(pd.concat([held[~written], part], ignore_index=True))
+        held = part
+    if held is not None:
+        write(held)
+    if not started:
+        pd.DataFrame(columns=['time']).to_csv(csv_path, index=False)
+    return rows
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Backfill historic Open-Meteo weather data.")
+    parser.add_argument('start_date', help="First day, YYYY-MM-DD.")
+    parser.add_argument('end_date', help="Last day, YYYY-MM-DD.")
+    parser.add_argument('--path', default=WEATHER_PARTS_PATH, help="Directory of the Parquet parts.")
+    parser.add_argument('--window', choices=list(WINDOW_FREQUENCIES), default='month')
+    parser.add_argument('--workers', type=int, default=4, help="Number of windows fetched at once.")
+    parser.add_argument('--csv', help="Also write the hours of the range to this CSV file.")
+    args = parser.parse_args(argv)
+
+    failed = backfill_weather(args.start_date, args.end_date, path=args.path, window=args.window,
+                              workers=args.workers)
+    if failed:
+        print(f"{len(failed)} window(s) failed, run again to fetch them: {failed}")
+    else:
+        print(f"Weather data saved at {args.path}.")
+    if args.csv and not failed:
+        print(f"{export_csv(args.path, args.csv, args.start_date, args.end_date):,} rows saved at {args.csv}.")
+
+
+if __name__ == '__main__':
+    main()
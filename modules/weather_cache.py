@@ -0,0 +1,195 @@
+# Contains a persistent on-disk cache for Open-Meteo hourly weather data, stored in one bucket per day
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import WEATHER_CACHE_PATH
+from modules.open_meteo_api import DEFAULT_HOURLY, open_meteo_request_many
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+ENDPOINT_NAMES = {ARCHIVE_URL: "archive", FORECAST_URL: "forecast"}
+
+
+class WeatherCache:
+    """
+    Day-bucketed cache in front of `open_meteo_request`.
+
+    Every bucket holds the hourly values of one day for one (grid cell, variable set, endpoint) and is
+    stored as a small `.npy` file: column 0 is the local time in minutes since the epoch, the remaining
+    columns are the requested variables in request order. Recently used buckets are also kept in memory.
+    Archive buckets never expire, buckets of any other endpoint (the forecast) expire after `forecast_ttl`.
+
+    Parameters:
+    - path (str): Root directory of the cache.
+    - grid_size (float): Size of a grid cell in degrees, all points in one cell share their buckets.
+    - forecast_ttl (float): Lifetime of forecast buckets in seconds.
+    - memory_size (int): Maximum number of buckets kept in memory.
+    """
+
+    def __init__(
+        self,
+        path: str = WEATHER_CACHE_PATH,
+        grid_size: float = 0.01,
+        forecast_ttl: float = 3 * 3600,
+        memory_size: int = 2048,
+    ):
+        self.path = path
+        self.grid_size = grid_size
+        self.forecast_ttl = forecast_ttl
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket_dir(self, latitude: float, longitude: float, hourly: List[str], base_url: str,
+                    request_params: Dict[str, Any]) -> str:
+        cell = f"{round(latitude / self.grid_size)}_{round(longitude / self.grid_size)}"
+        # Units and timezone change the values, so they are part of the variable set
+        variable_set = ",".join(hourly) + "|" + "|".join(f"{k}={v}" for k, v in sorted(request_params.items()))
+        variable_key = hashlib.sha1(variable_set.encode()).hexdigest()[:12]
+        endpoint = ENDPOINT_NAMES.get(base_url) or hashlib.sha1(base_url.encode()).hexdigest()[:12]
+        return os.path.join(self.path, endpoint, cell, variable_key)
+
+    def _expires(self, base_url: str) -> bool:
+        return base_url != ARCHIVE_URL
+
+    def _load(self, file_path: str, expires: bool) -> Optional[np.ndarray]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(file_path)
+            if entry is not None:
+                if not expires or now - entry[0] < self.forecast_ttl:
+                    self._memory.move_to_end(file_path)
+                    return entry[1]
+                del self._memory[file_path]
+
+        try:
+            stored_at = os.path.getmtime(file_path)
+            if expires and now - stored_at >= self.forecast_ttl:
+                return None
+            bucket = np.load(file_path)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(file_path, stored_at, bucket)
+        return bucket
+
+    def _remember(self, file_path: str, stored_at: float, bucket: np.ndarray) -> None:
+        with self._lock:
+            self._memory[file_path] = (stored_at, bucket)
+            self._memory.move_to_end(file_path)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _store(self, file_path: str, bucket: np.ndarray) -> None:
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see a partial bucket
+            temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as file:
+                np.save(file, bucket)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            print(f"Error writing weather cache file: {e}")
+        self._remember(file_path, time.time(), bucket)
+
+    @staticmethod
+    def _split_days(data: Dict[str, list], days: List[date], hourly: List[str]) -> Dict[date, np.ndarray]:
+        times = np.array(data["time"], dtype="datetime64[m]")
+        columns = [times.astype("int64").astype("float64")]
+        columns += [np.array(data[variable], dtype="float64") for variable in hourly]
+        rows = np.column_stack(columns)
+
+        day_of_row = times.astype("datetime64[D]")
+        return {day: rows[day_of_row == np.datetime64(day)] for day in days}
+
+    def request(
+        self,
+        start_date: str,
+        end_date: str,
+        latitude: float = 47.36667,
+        longitude: float = 8.55,
+        hourly: Optional[List[str]] = None,
+        base_url: str = ARCHIVE_URL,
+        blocking: bool = False,
+        **request_params: Any,
+    ) -> Optional[Dict[str, list]]:
+        """
+        Return hourly weather data like `open_meteo_request`, fetching only the days that are not cached yet.
+
+        Parameters:
+        - start_date (str): The start date in YYYY-MM-DD format.
+        - end_date (str): The end date in YYYY-MM-DD format.
+        - latitude (float): The latitude coordinate.
+        - longitude (float): The longitude coordinate.
+        - hourly (list, optional): List of hourly variables. Defaults to the variables used by the model.
+        - base_url (str): The Open-Meteo endpoint.
+        - blocking (bool): Wait for the rate limiter when fetching missing days instead of giving up.
+        - **request_params: Further parameters passed on to `open_meteo_request` (timezone, units).
+
+        Returns:
+        - dict: {'time': [...], variable: [...]} as returned by the API, or None if a fetch failed.
+        """
+        if hourly is None:
+            hourly = DEFAULT_HOURLY
+
+        first_day = date.fromisoformat(start_date)
+        last_day = date.fromisoformat(end_date)
+        days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+        bucket_dir = self._bucket_dir(latitude, longitude, hourly, base_url, request_params)
+        expires = self._expires(base_url)
+        buckets = {day: self._load(os.path.join(bucket_dir, f"{day.isoformat()}.npy"), expires) for day in days}
+
+        missing = [day for day in days if buckets[day] is None]
+        if missing:
+            # Fetch each run of consecutive missing days with a single request
+            runs = [[missing[0]]]
+            for day in missing[1:]:
+                if (day - runs[-1][-1]).days == 1:
+                    runs[-1].append(day)
+                else:
+                    runs.append([day])
+
+            # The runs are fetched concurrently
+            queries = [dict(start_date=run[0].isoformat(), end_date=run[-1].isoformat(), latitude=latitude,
+                            longitude=longitude, hourly=hourly, base_url=base_url, blocking=blocking,
+                            **request_params) for run in runs]
+            failed = False
+            for run, data in zip(runs, open_meteo_request_many(queries)):
+                if data is None:
+                    failed = True
+                    continue
+                for day, bucket in self._split_days(data, run, hourly).items():
+                    buckets[day] = bucket
+                    # Days where a variable has no data at all are not cached, the archive lags a few days behind
+                    if len(bucket) and not np.isnan(bucket[:, 1:]).all(axis=0).any():
+                        self._store(os.path.join(bucket_dir, f"{day.isoformat()}.npy"), bucket)
+            # The runs that did arrive are cached, the request still fails as a whole
+            if failed:
+                return None
+
+        rows = np.concatenate([buckets[day] for day in days])
+        times = rows[:, 0].astype("int64").astype("datetime64[m]")
+        result = {"time": np.datetime_as_string(times, unit="m").tolist()}
+        for i, variable in enumerate(hourly, start=1):
+            result[variable] = rows[:, i].tolist()
+        return result
+
+
+@lru_cache(maxsize=None)
+def get_weather_cache() -> WeatherCache:
+    """Process-wide weather cache shared by all sessions."""
+    return WeatherCache()
+
+
+def cached_open_meteo_request(start_date: str, end_date: str, **kwargs: Any) -> Optional[Dict[str, list]]:
+    """Drop-in replacement for `open_meteo_request` that serves already fetched days from the weather cache."""
+    return get_weather_cache().request(start_date, end_date, **kwargs)
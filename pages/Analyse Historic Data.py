@@ -1,10 +1,12 @@
 # Page1.py
 
 import streamlit as st
-import pandas as pd
-from modules.utils import convert_lv95_to_wgs84, translate_columns
+from modules.filter_index import FilterIndex
+from modules.historic_data import ensure_historic_dataset, load_historic_dataset
+from modules.historic_map import (GeoJsonPayload, HeatMapPayload, aggregate_accidents, cell_payload, heatmap_payload,
+                                  marker_payload)
+from modules.layer_cache import LayerCache
 import folium
-from folium.plugins import MarkerCluster, HeatMap
 from streamlit_folium import st_folium
 
 # Set page configuration
@@ -27,73 +29,101 @@ MAP_BOUNDS = {
     'min_lon': 8.4655,
     'max_lon': 8.6155
 }
+DEFAULT_ZOOM = 12
+# Up to this number of accidents every accident gets its own marker, above they are aggregated into grid cells
+MARKER_THRESHOLD = 2000
+MAP_TYPES = ["Markers", "Heatmap", "Both"]
+DEFAULT_WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+DEFAULT_ACCIDENT_TYPES = [
+    'Accident with rear-end collision',
+    'Accident involving pedestrian(s)',
+    'Accident when overtaking or changing lanes'
+]
+DEFAULT_SEVERITY_CATS = ['Accident with fatalities', 'Accident with severe injuries']
+DEFAULT_ROAD_TYPES = ['Principal road', 'Minor road']
+FILTER_COLUMNS = [
+    'year', 'month', 'WeekdayDesc', 'hour', 'AccidentTypeDesc', 'AccidentSeverityDesc', 'RoadTypeDesc',
+    'AccidentInvolvingPedestrian', 'AccidentInvolvingBicycle', 'AccidentInvolvingMotorcycle',
+]
 
 # --- Load Data ---
-@st.cache_data
-def load_data():
-    df = pd.read_csv("data/inference/historic_data.csv")
-    return df
-
-@st.cache_data
-def translate_data(df):
-    return translate_columns(df)
+# The columnar dataset already holds the descriptive labels and WGS84 coordinates (see modules/historic_data.py).
+# It is shared read-only between sessions, so it is cached as a resource instead of being copied on every rerun.
+# The resources are keyed on the version of the artifact, which is rebuilt once historic_data.csv is newer.
+@st.cache_resource(max_entries=1)
+def load_data(version):
+    return load_historic_dataset()
 
-@st.cache_data
-def convert_coordinates(df):
-    return convert_lv95_to_wgs84(df)
+# Bitmaps of every filter value, built once so that reruns only combine them
+@st.cache_resource(max_entries=1)
+def load_filter_index(version):
+    return FilterIndex(load_data(version), FILTER_COLUMNS)
 
-df = load_data()
-df = translate_data(df)
-df = convert_coordinates(df)
+data_version = ensure_historic_dataset()
+df = load_data(data_version)
+filter_index = load_filter_index(data_version)
 
 # --- Define Functions ---
-def create_folium_map(data, map_type):
-    if data.empty:
-        return folium.Map(location=[0, 0], zoom_start=2, tiles='CartoDB Positron')
+def build_filters(years, months, weekdays, accident_types, severities, road_types, hours, involvements):
+    return {
+        'year': years or None,
+        'month': months or None,
+        'WeekdayDesc': weekdays or None,
+        'AccidentTypeDesc': accident_types or None,
+        'AccidentSeverityDesc': severities or None,
+        'RoadTypeDesc': road_types or None,
+        'hour': range(hours[0], hours[1] + 1),
+        # Involvement filters
+        **{column: [True] for column in involvements},
+    }
+
+def default_filters():
+    """The filters of the sidebar widgets before any selection."""
+    years = filter_index.values('year')
+    accident_types = filter_index.values('AccidentTypeDesc')
+    return build_filters(
+        [years[-1]] if years else [], filter_index.values('month'), DEFAULT_WEEKDAYS,
+        [atype for atype in DEFAULT_ACCIDENT_TYPES if atype in accident_types], DEFAULT_SEVERITY_CATS,
+        DEFAULT_ROAD_TYPES, (0, 23), [],
+    )
 
-    center_lat = (MAP_BOUNDS['min_lat'] + MAP_BOUNDS['max_lat']) / 2
-    center_lon = (MAP_BOUNDS['min_lon'] + MAP_BOUNDS['max_lon']) / 2
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB Positron')
-
-    if map_type in ["Markers", "Both"]:
-        marker_cluster = MarkerCluster(name='Accident Markers').add_to(m)
-        for _, row in data.iterrows():
-            severity = row['AccidentSeverityDesc']
-            color = SEVERITY_COLOR_MAPPING.get(severity, 'gray')
-            popup_text = f"""
-                <b>Accident Type:</b> {row['AccidentTypeDesc']}<br>
-                <b>Severity:</b> {severity}<br>
-                <b>Road Type:</b> {row['RoadTypeDesc']}<br>
-                <b>Date:</b> {row['year']}-{row['month']} (Weekday: {row['WeekdayDesc']})<br>
-                <b>Time:</b> {row['hour']}:00<br>
-            """
-            folium.CircleMarker(
-                location=[row['lat'], row['lon']],
-                radius=5,
-                popup=folium.Popup(popup_text, max_width=300),
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=0.7
-            ).add_to(marker_cluster)
+def add_layers(m, layer_cache, signature, data, map_type, zoom, marker_threshold=MARKER_THRESHOLD):
+    # The serialized layers are cached per filter signature, layer and zoom, "Both" reuses the layers of the other types
+    if map_type in ["Markers", "Both"] and len(data) <= marker_threshold:
+        payload = layer_cache.get_or_render(
+            (signature, 'markers'), lambda: marker_payload(data, SEVERITY_COLOR_MAPPING))
+        GeoJsonPayload(payload, 'Accident Markers', cluster=True).add_to(m)
+    elif map_type in ["Markers", "Both"]:
+        # Too many accidents for individual markers, bin them server-side at the current zoom
+        payload = layer_cache.get_or_render(
+            (signature, 'cells', zoom),
+            lambda: cell_payload(aggregate_accidents(data, zoom, list(SEVERITY_COLOR_MAPPING)), SEVERITY_COLOR_MAPPING))
+        GeoJsonPayload(payload, 'Accident Clusters').add_to(m)
 
     if map_type in ["Heatmap", "Both"]:
-        heat_data = data[['lat', 'lon']].dropna().values.tolist()
-        HeatMap(
-            heat_data,
-            radius=10,
-            blur=15,
-            max_zoom=1,
-            gradient={
-                0.2: 'blue',
-                0.4: 'lime',
-                0.6: 'yellow',
-                0.8: 'orange',
-                1.0: 'red'
-            },
-            name='Heatmap'
-        ).add_to(m)
+        payload = layer_cache.get_or_render((signature, 'heatmap', zoom), lambda: heatmap_payload(data, zoom))
+        HeatMapPayload(payload).add_to(m)
+
+# Serialized map layers shared between sessions, the default view of every map type is rendered at startup
+@st.cache_resource(max_entries=1)
+def load_layer_cache(version):
+    layer_cache = LayerCache()
+    filters = default_filters()
+    data = filter_index.filter(filters)
+    for map_type in MAP_TYPES:
+        add_layers(folium.Map(), layer_cache, FilterIndex.signature(filters), data, map_type, DEFAULT_ZOOM)
+    return layer_cache
 
+layer_cache = load_layer_cache(data_version)
+
+def create_folium_map(data, signature, map_type, zoom=DEFAULT_ZOOM, center=None):
+    if data.empty:
+        return folium.Map(location=[0, 0], zoom_start=2, tiles='CartoDB Positron')
+
+    if center is None:
+        center = [(MAP_BOUNDS['min_lat'] + MAP_BOUNDS['max_lat']) / 2, (MAP_BOUNDS['min_lon'] + MAP_BOUNDS['max_lon']) / 2]
+    m = folium.Map(location=center, zoom_start=zoom, tiles='CartoDB Positron')
+    add_layers(m, layer_cache, signature, data, map_type, zoom)
     folium.LayerControl().add_to(m)
     return m
 
@@ -114,7 +144,7 @@ st.sidebar.button("🔄 Reset Filters", on_click=reset_filters)
 
 # Date Filters
 with st.sidebar.expander("📅 Date Filters", expanded=False):
-    years = sorted(df['year'].unique())
+    years = filter_index.values('year')
     default_year = [years[-1]] if years else []
     selected_years = st.multiselect(
         "🗓️ Year",
@@ -123,7 +153,7 @@ with st.sidebar.expander("📅 Date Filters", expanded=False):
         help="Select the year(s) of the accidents."
     )
 
-    months = sorted(df['month'].unique())
+    months = filter_index.values('month')
     month_names = {1: "January", 2: "February", 3: "March", 4: "April",
                    5: "May", 6: "June", 7: "July", 8: "August",
                    9: "September", 10: "October", 11: "November", 12: "December"}
@@ -135,20 +165,19 @@ with st.sidebar.expander("📅 Date Filters", expanded=False):
         help="Select the month(s) of the accidents."
     )
 
-    weekdays = sorted(df['WeekdayDesc'].unique())
-    default_weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+    weekdays = filter_index.values('WeekdayDesc')
     selected_weekdays = st.multiselect(
         "📅 Weekday",
         options=weekdays,
-        default=default_weekdays,
+        default=DEFAULT_WEEKDAYS,
         help="Select the day(s) of the week when accidents occurred."
     )
 
 # Time Filters
 with st.sidebar.expander("⏰ Time Filters", expanded=False):
-    hours = sorted(df['hour'].unique())
-    min_hour = int(df['hour'].min())
-    max_hour = int(df['hour'].max())
+    hours = filter_index.values('hour')
+    min_hour = int(hours[0])
+    max_hour = int(hours[-1])
     selected_hours = st.slider(
         "🕒 Hour of Day",
         min_value=min_hour,
@@ -160,13 +189,8 @@ with st.sidebar.expander("⏰ Time Filters", expanded=False):
 
 # Accident Details Filters
 with st.sidebar.expander("🚗 Accident Details", expanded=False):
-    accident_types = sorted(df['AccidentTypeDesc'].unique())
-    default_accident_types = [
-        'Accident with rear-end collision',
-        'Accident involving pedestrian(s)',
-        'Accident when overtaking or changing lanes'
-    ]
-    default_accident_types = [atype for atype in default_accident_types if atype in accident_types]
+    accident_types = filter_index.values('AccidentTypeDesc')
+    default_accident_types = [atype for atype in DEFAULT_ACCIDENT_TYPES if atype in accident_types]
     selected_accident_types = st.multiselect(
         "🚦 Accident Type",
         options=accident_types,
@@ -174,12 +198,11 @@ with st.sidebar.expander("🚗 Accident Details", expanded=False):
         help="Select the type(s) of accidents to display."
     )
 
-    severity_cats = sorted(df['AccidentSeverityDesc'].unique())
-    default_severity_cats = ['Accident with fatalities', 'Accident with severe injuries']
+    severity_cats = filter_index.values('AccidentSeverityDesc')
     selected_severity_cats = st.multiselect(
         "⚠️ Accident Severity",
         options=severity_cats,
-        default=default_severity_cats,
+        default=DEFAULT_SEVERITY_CATS,
         help="Select the severity level(s) of accidents to display."
     )
 
@@ -194,12 +217,11 @@ with st.sidebar.expander("👥 Accident Involvements", expanded=False):
 
 # Road Type Filters
 with st.sidebar.expander("🛣️ Road Type", expanded=False):
-    road_types = sorted(df['RoadTypeDesc'].unique())
-    default_road_types = ['Principal road', 'Minor road']
+    road_types = filter_index.values('RoadTypeDesc')
     selected_road_types = st.multiselect(
         "🛤️ Road Type",
         options=road_types,
-        default=default_road_types,
+        default=DEFAULT_ROAD_TYPES,
         help="Select the road type(s) where accidents occurred."
     )
 
@@ -207,7 +229,7 @@ with st.sidebar.expander("🛣️ Road Type", expanded=False):
 with st.sidebar.expander("🗺️ Map Type", expanded=False):
     map_type = st.radio(
         "🌐 Choose Map Visualization",
-        options=["Markers", "Heatmap", "Both"],
+        options=MAP_TYPES,
         index=0,
         help="Select how you want to visualize the accidents on the map."
     )
@@ -219,30 +241,35 @@ if st.session_state.reset_filters:
 # --- Apply Filters ---
 selected_month_numbers = [month for month, name in month_names.items() if name in selected_months]
 
-filtered_df = df[
-    (df['year'].isin(selected_years) if selected_years else True) &
-    (df['month'].isin(selected_month_numbers) if selected_months else True) &
-    (df['WeekdayDesc'].isin(selected_weekdays) if selected_weekdays else True) &
-    (df['AccidentTypeDesc'].isin(selected_accident_types) if selected_accident_types else True) &
-    (df['AccidentSeverityDesc'].isin(selected_severity_cats) if selected_severity_cats else True) &
-    (df['RoadTypeDesc'].isin(selected_road_types) if selected_road_types else True) &
-    (df['hour'].between(selected_hours[0], selected_hours[1]))
-]
-
-# Apply involvement filters
-for label in selected_involvements:
-    col_name = involvement_options[label]
-    filtered_df = filtered_df[filtered_df[col_name] == 1]
+filters = build_filters(
+    selected_years, selected_month_numbers, selected_weekdays, selected_accident_types, selected_severity_cats,
+    selected_road_types, selected_hours, [involvement_options[label] for label in selected_involvements],
+)
+filtered_df = filter_index.filter(filters)
 
 # Display filtered results
 if filtered_df.empty:
     st.warning("⚠️ No accidents match the selected filters. Please adjust your selections.")
 else:
     st.success(f"**Number of accidents:** {len(filtered_df)}")
-    folium_map = create_folium_map(filtered_df, map_type)
+    # The zoom and center reported by the map on the last interaction, the aggregation follows the zoom
+    map_state = st.session_state.get("city_accidents_map") or {}
+    zoom = map_state.get("zoom") or DEFAULT_ZOOM
+    center = map_state.get("center")
+    if center:
+        center = [round(center['lat'], 3), round(center['lng'], 3)]
+    folium_map = create_folium_map(filtered_df, FilterIndex.signature(filters), map_type, zoom=zoom, center=center)
     st_folium(
         folium_map,
         width=1200,
         height=700,
-        key="city_accidents_map"
+        key="city_accidents_map",
+        returned_objects=["zoom", "center"]
+    )
+    cache_stats = layer_cache.stats()
+    st.caption(
+        f"Map layers: {cache_stats['hit_rate']:.0%} served from the layer cache "
+        f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['layers']} layers, "
+        f"{cache_stats['bytes'] / 2**20:.1f} MB), last layer in {cache_stats['last_seconds'] * 1000:.1f} ms, "
+        f"{cache_stats['mean_render_seconds'] * 1000:.0f} ms per render"
     )
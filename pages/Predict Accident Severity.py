@@ -1,16 +1,20 @@
 import streamlit as st
 import pandas as pd
-from pyproj import Transformer
 import folium
 from folium.plugins import MarkerCluster, HeatMap
 from streamlit_folium import st_folium
 import joblib
 from datetime import datetime, timedelta, date, time
 import random  # Import for random selection
-from modules.utils import assign_average_volume, transform, get_weather, get_road_type, translate_columns, convert_lv95_to_wgs84
+from modules.utils import assign_average_volume, build_volume_table, get_weather, get_road_type, translate_columns, convert_lv95_to_wgs84
+from modules.location_index import LocationIndex
+from modules.station_volume import load_station_volume_store
+from modules.forest_model import load_model as load_forest_model
+from modules.prediction_cache import get_prediction_cache
+from modules.scoring import load_threshold, predict_severity
+from config import MODEL_PATH
 from modules.open_meteo_api import open_meteo_request
 import numpy as np
-import pickle
 
 # --- Streamlit Page Configuration ---
 st.set_page_config(page_title="Predict Accidents Severity", layout="wide")
@@ -26,20 +30,22 @@ if "selected_time" not in st.session_state:
     st.session_state.selected_time = time(datetime.now().hour)
 
 # --- Load Pre-trained Model ---
-@st.cache_resource
-def load_model():
-    model = pickle.load(open("data/models/finalized_model.sav", "rb"))
-    return model
-
-model = load_model()
+# Loaded on the first prediction, not when the page opens. The model and the volume data are loaded again
+# whenever the fingerprint of the prediction cache changes, so new cache entries never come from old files
+@st.cache_resource(max_entries=1)
+def load_model(fingerprint):
+    return load_forest_model(MODEL_PATH)
 
 # --- Load Additional Data ---
-@st.cache_resource
-def load_volume():
+@st.cache_resource(max_entries=1)
+def load_volume(fingerprint):
     data = pd.read_csv('data/inference/average_volume.csv')
-    return data
+    return build_volume_table(data)
 
-average_volume = load_volume()
+@st.cache_resource(max_entries=1)
+def load_station_volume(fingerprint):
+    # Per-station averages, None until built with `python -m modules.station_volume`
+    return load_station_volume_store()
 
 @st.cache_resource
 def load_locations():
@@ -48,6 +54,12 @@ def load_locations():
 
 locations = load_locations()
 
+@st.cache_resource
+def load_location_index():
+    return LocationIndex(load_locations())
+
+location_index = load_location_index()
+
 # --- Define Mapping Dictionaries ---
 ACCIDENT_TYPE_MAPPING = {
     'at0': 'Accident with skidding or self-accident',
@@ -246,37 +258,55 @@ if submit_button:
                 # Extract x and y (longitude and latitude)
                 lon, lat = st.session_state.selected_location[1], st.session_state.selected_location[0]
 
-                # Get Road Type and closest training accident coordinates
-                roadtypes, closest_lons, closest_lats = get_road_type(lon, lat, locations, n=prediction_count)
-
-                # Construct the DataFrame with 'dateTime' included
-                input_data = {
-                    'dateTime': [selected_datetime] * prediction_count,
-                    'AccidentType': [accident_type] * prediction_count,
-                    'AccidentInvolvingPedestrian': [int(involving_pedestrian)] * prediction_count,
-                    'AccidentInvolvingBicycle': [int(involving_bicycle)] * prediction_count,
-                    'AccidentInvolvingMotorcycle': [int(involving_motorcycle)] * prediction_count,
-                    'RoadType': roadtypes,
-                    'month': [month] * prediction_count,
-                    'weekday': [weekday] * prediction_count,
-                    'hour': [hour] * prediction_count,
-                }
-
-                input_df = pd.DataFrame(input_data)
-
-                # Assign the average traffic and pedestrian volumes
-                input_df = assign_average_volume(input_df, average_volume, 3, 2)
-
-                # Get weather data
-                input_df = get_weather(input_df, selected_datetime)
-
-                # Transform input data using preprocessor
-                input_df_transformed = transform(input_df)
-
-                # Predict severity
-                optimal_threshold = 0.2
-                predictions = model.predict_proba(input_df_transformed)[:, 1]
-                predictions = (predictions >= optimal_threshold).astype(int)
+                def compute_prediction():
+                    # Get Road Type and closest training accident coordinates
+                    roadtypes, closest_lons, closest_lats = get_road_type(lon, lat, locations, n=prediction_count, index=location_index)
+
+                    # Construct the DataFrame with 'dateTime' included
+                    input_data = {
+                        'dateTime': [selected_datetime] * prediction_count,
+                        'AccidentType': [accident_type] * prediction_count,
+                        'AccidentInvolvingPedestrian': [int(involving_pedestrian)] * prediction_count,
+                        'AccidentInvolvingBicycle': [int(involving_bicycle)] * prediction_count,
+                        'AccidentInvolvingMotorcycle': [int(involving_motorcycle)] * prediction_count,
+                        'RoadType': roadtypes,
+                        'month': [month] * prediction_count,
+                        'weekday': [weekday] * prediction_count,
+                        'hour': [hour] * prediction_count,
+                    }
+
+                    input_df = pd.DataFrame(input_data)
+
+                    # Assign the traffic and pedestrian volumes of the stations closest to each location,
+                    # or the city-wide averages if the station volume store has not been built
+                    fingerprint = get_prediction_cache().fingerprint()
+                    station_volume = load_station_volume(fingerprint)
+                    if station_volume is not None:
+                        x, y = location_index.project(closest_lons, closest_lats)
+                        input_df = station_volume.assign(input_df, x, y, 3, 2)
+                    else:
+                        input_df = assign_average_volume(input_df, load_volume(fingerprint), 3, 2)
+
+                    # Get weather data
+                    input_df = get_weather(input_df, selected_datetime)
+
+                    # Transform input data using preprocessor and predict severity
+                    model = load_model(fingerprint)
+                    probabilities, _ = predict_severity(input_df, model)
+                    return {'closest_lats': closest_lats, 'closest_lons': closest_lons,
+                            'probabilities': probabilities, 'input_df': input_df}
+
+                # Requests for the same grid cell, hour and inputs are served from the prediction cache
+                prediction_cache = get_prediction_cache()
+                signature = prediction_cache.signature(
+                    lat, lon, selected_datetime, accident_type=accident_type, pedestrian=involving_pedestrian,
+                    bicycle=involving_bicycle, motorcycle=involving_motorcycle, count=prediction_count)
+                result, cached = prediction_cache.get_or_compute(signature, compute_prediction)
+                closest_lats, closest_lons, input_df = result['closest_lats'], result['closest_lons'], result['input_df']
+
+                # Threshold saved with the model by modules.training, 0.2 for the model of Modeling.ipynb
+                optimal_threshold = load_threshold()
+                predictions = (result['probabilities'] >= optimal_threshold).astype(int)
 
                 # Update session_state with predicted locations and predictions
                 predicted_locations = list(zip(closest_lats, closest_lons))  # List of (lat, lon)
@@ -296,6 +326,9 @@ if submit_button:
                            f"\nNumber of minor accidents: {minor_count}"
                            f"\nNumber of severe accidents: {severe_count}"
                            )
+                cache_stats = prediction_cache.stats()
+                st.caption(f"{'Served from' if cached else 'Added to'} the prediction cache "
+                           f"({cache_stats['hits']} hits, {cache_stats['misses']} misses since the app started).")
 
                 # --- Show Weather Data for First Period ---
                 # Extract weather columns for the first period
@@ -0,0 +1,26 @@
+# Contains the synthetic model inputs of the tests and benchmarks: accidents of June 2023 with the average volumes and weather
+# of the previous hours, in the columns that assemble_features returns
+import numpy as np
+import pandas as pd
+
+from modules.utils import WEATHER_FEATURES, assign_average_volume, assign_weather
+
+
+def make_inputs(rows, rng):
+    date_times = pd.Timestamp('2023-06-01') + pd.to_timedelta(rng.integers(0, 24 * 30, size=rows), unit='h')
+    df = pd.DataFrame({
+        'dateTime': date_times,
+        'AccidentType': rng.choice(['at0', 'at1', 'at2', 'at8'], size=rows),
+        'AccidentInvolvingPedestrian': rng.integers(0, 2, size=rows).astype(bool),
+        'AccidentInvolvingBicycle': rng.integers(0, 2, size=rows).astype(bool),
+        'AccidentInvolvingMotorcycle': rng.integers(0, 2, size=rows).astype(bool),
+        'RoadType': rng.choice(['rt432', 'rt433', 'rt439'], size=rows),
+        'month': date_times.month,
+        'weekday': date_times.isocalendar().day.to_numpy(),
+        'hour': date_times.hour,
+    })
+    df = assign_average_volume(df, pd.read_csv('data/inference/average_volume.csv'), 3, 2)
+    hours = pd.date_range('2023-05-31', '2023-07-01', freq='h')
+    weather = pd.DataFrame(rng.normal(size=(len(hours), len(WEATHER_FEATURES))), columns=WEATHER_FEATURES)
+    weather['dateTime'] = hours
+    return assign_weather(df, weather, 4, WEATHER_FEATURES)
@@ -0,0 +1,133 @@
+# Tests of modules/downloader.py against a local stand-in HTTP server: resume with a Range request, the ETag skip,
+# checksum mismatches, partial responses of another range and retries.
+# Run from the project root: python -m pytest tests
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from modules.downloader import Downloader
+
+CONTENT = bytes(range(256)) * 1000
+ETAG = '"' + hashlib.md5(CONTENT).hexdigest() + '"'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT at every path with ETag, Range/If-Range and If-None-Match support."""
+
+    # Statuses answered to the next requests before the content, and the start of the next partial responses
+    failures = []
+    range_starts = []
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.failures:
+            self.send_error(self.failures.pop(0))
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == ETAG:
+            start = self.range_starts.pop(0) if self.range_starts else int(range_header[6:].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(CONTENT) - start))
+        self.end_headers()
+        self.wfile.write(CONTENT[start:])
+
+
+@pytest.fixture
+def server():
+    StandInHandler.failures, StandInHandler.range_starts, StandInHandler.requests_seen = [], [], []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/resource.csv'
+    server.shutdown()
+    server.server_close()
+
+
+def write_partial(path, size):
+    with open(path + '.part', 'wb') as file:
+        file.write(CONTENT[:size])
+    with open(path + '.part.meta.json', 'w') as file:
+        json.dump({'etag': ETAG, 'last_modified': None}, file)
+
+
+def read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_interrupted_transfer_is_resumed_with_a_range_request(server, tmp_path):
+    path = str(tmp_path / 'resource.csv')
+    write_partial(path, 100_000)
+    result = Downloader(progress=False).download(server, path)
+    assert (result.status, result.bytes_transferred) == ('resumed', len(CONTENT) - 100_000)
+    assert StandInHandler.requests_seen[-1]['Range'] == 'bytes=100000-'
+    assert read(path) == CONTENT and not os.path.exists(path + '.part')
+
+
+def test_unchanged_file_is_skipped_after_304(server, tmp_path):
+    path = str(tmp_path / 'resource.csv')
+    downloader = Downloader(progress=False)
+    assert downloader.download(server, path).status == 'downloaded'
+    result = downloader.download(server, path)
+    assert (result.status, result.bytes_transferred) == ('skipped', 0)
+    assert StandInHandler.requests_seen[-1]['If-None-Match'] == ETAG
+    # With a matching checksum no request is made at all
+    assert downloader.download(server, path, 'md5:' + hashlib.md5(CONTENT).hexdigest()).status == 'skipped'
+    assert len(StandInHandler.requests_seen) == 2
+
+
+def test_checksum_mismatch_raises_and_removes_the_file(server, tmp_path):
+    path = str(tmp_path / 'resource.csv')
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        Downloader(progress=False).download(server, path, 'sha256:' + '0' * 64)
+    assert not os.path.exists(path)
+
+
+def test_partial_response_of_another_range_starts_over(server, tmp_path):
+    path = str(tmp_path / 'resource.csv')
+    write_partial(path, 100_000)
+    # The server answers the range request from byte 50,000: appending it would corrupt the file
+    StandInHandler.range_starts = [50_000]
+    result = Downloader(progress=False).download(server, path)
+    assert (result.status, result.bytes_transferred) == ('downloaded', len(CONTENT))
+    assert read(path) == CONTENT
+    assert 'Range' not in StandInHandler.requests_seen[-1]
+
+
+def test_failed_responses_are_retried_once_per_attempt(server, tmp_path):
+    path = str(tmp_path / 'resource.csv')
+    downloader = Downloader(retries=2, backoff=0, progress=False)
+    StandInHandler.failures = [503, 500]
+    assert downloader.download(server, path).status == 'downloaded'
+    assert len(StandInHandler.requests_seen) == 3
+
+    StandInHandler.requests_seen.clear()
+    StandInHandler.failures = [503] * 10
+    with pytest.raises(requests.HTTPError):
+        downloader.download(server, str(tmp_path / 'other.csv'))
+    assert len(StandInHandler.requests_seen) == 3
+
+    # Client errors are not retried
+    StandInHandler.requests_seen.clear()
+    StandInHandler.failures = [404]
+    with pytest.raises(requests.HTTPError):
+        downloader.download(server, str(tmp_path / 'missing.csv'))
+    assert len(StandInHandler.requests_seen) == 1
@@ -0,0 +1,46 @@
+# Tests of modules/forest_model.py: the exported bundle is served only while it belongs to the pickle next to it.
+# Run from the project root: python -m pytest tests
+import os
+import pickle
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from modules.forest_model import FlatForest, export_model, load_model
+
+
+def save_forest(path, seed):
+    rng = np.random.default_rng(seed)
+    model = RandomForestClassifier(n_estimators=5, max_depth=4, random_state=seed).fit(
+        rng.random((200, 4)), rng.integers(0, 2, 200))
+    with open(path, 'wb') as file:
+        pickle.dump(model, file)
+    return model
+
+
+def test_exported_bundle_is_served_while_it_matches_the_pickle(tmp_path):
+    path = str(tmp_path / 'finalized_model.sav')
+    save_forest(path, 0)
+    export_model(path)
+    assert isinstance(load_model(path), FlatForest)
+
+    # Copied with another modification time, the hash still matches
+    os.utime(path, ns=(0, 0))
+    assert isinstance(load_model(path), FlatForest)
+
+
+def test_pickle_saved_again_is_loaded_instead_of_the_old_bundle(tmp_path):
+    path = str(tmp_path / 'finalized_model.sav')
+    save_forest(path, 0)
+    export_model(path)
+    # Saved again from the notebook without exporting
+    model = save_forest(path, 1)
+    loaded = load_model(path)
+    assert isinstance(loaded, RandomForestClassifier)
+    X = np.random.default_rng(2).random((50, 4))
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+
+    export_model(path)
+    forest = load_model(path)
+    assert isinstance(forest, FlatForest)
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X))
@@ -0,0 +1,110 @@
+# Tests of modules/incremental_refresh.py on synthetic sources in the format of the raw data (the generators of
+# benchmarks/incremental_refresh_benchmark.py): interrupted exports, corrected accident rows and weather windows
+# fetched before their last days were in the archive.
+# Run from the project root: python -m pytest tests
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks.incremental_refresh_benchmark import make_accidents, write_sources
+from modules import incremental_refresh
+from modules.historic_data import write_historic_dataset
+from modules.incremental_refresh import load_merged_data, read_weather, refresh, weather_mark
+from modules.utils import WEATHER_FEATURES
+
+
+@pytest.fixture
+def sources(tmp_path):
+    rng = np.random.default_rng(0)
+    root = str(tmp_path)
+    paths = {
+        'raw_path': os.path.join(root, 'RoadTrafficAccidentLocations.csv'),
+        'traffic_path': os.path.join(root, 'traffic_data'),
+        'pedestrian_pattern': os.path.join(root, '{year}_verkehrszaehlungen_werte_fussgaenger_velo.csv'),
+        'weather_path': os.path.join(root, 'weather_data'),
+        'store_path': os.path.join(root, 'merged_data'),
+        'state_path': os.path.join(root, 'refresh_state.json'),
+        'csv_paths': [os.path.join(root, 'merged.csv')],
+        'dataset_path': None,
+        'locations_path': os.path.join(root, 'locations.csv'),
+    }
+    make_accidents(['2023-01-01', '2023-02-01'], 50, rng).to_csv(paths['raw_path'], index=False)
+    write_sources(root, '2023-01-01', '2023-02-28 23:00', 6, rng)
+    refresh(**paths)
+
+    def add_march():
+        make_accidents(['2023-03-01'], 50, rng).to_csv(paths['raw_path'], mode='a', header=False, index=False)
+        write_sources(root, '2023-03-01', '2023-03-31 23:00', 6, rng)
+
+    return paths, add_march
+
+
+def test_interrupted_append_is_not_appended_twice(sources, monkeypatch):
+    paths, add_march = sources
+    add_march()
+    # The refresh stops after appending March to the exported files, before its state is saved
+    with monkeypatch.context() as patch:
+        patch.setattr(incremental_refresh, '_save_refresh_state', lambda *args: (_ for _ in ()).throw(OSError))
+        with pytest.raises(OSError):
+            refresh(**paths)
+
+    assert refresh(**paths) == ['2023-03']
+    merged = load_merged_data(paths['store_path'])
+    assert len(pd.read_csv(paths['csv_paths'][0])) == len(pd.read_csv(paths['locations_path'])) == len(merged)
+
+
+def test_corrected_row_is_processed_again(sources):
+    paths, _ = sources
+    raw = pd.read_csv(paths['raw_path'])
+    # Same number of rows, one road type corrected
+    raw.loc[0, 'RoadType'] = 'rt439' if raw.loc[0, 'RoadType'] != 'rt439' else 'rt432'
+    raw.to_csv(paths['raw_path'], index=False)
+    assert refresh(**paths) == ['2023-01']
+    assert refresh(**paths) == []
+
+
+def test_artifact_gets_the_processed_months_replaced(sources, tmp_path, monkeypatch):
+    paths, add_march = sources
+    paths = {**paths, 'dataset_path': str(tmp_path / 'historic_data.feather')}
+    add_march()
+    assert refresh(**paths) == ['2023-03']
+    raw = pd.read_csv(paths['raw_path'])
+    raw.loc[0, 'RoadType'] = 'rt439' if raw.loc[0, 'RoadType'] != 'rt439' else 'rt432'
+    raw.to_csv(paths['raw_path'], index=False)
+    # The artifact is updated without loading the store, only the rewrite of the CSV files reads it
+    loads = []
+    monkeypatch.setattr(incremental_refresh, 'load_merged_data',
+                        lambda *args: loads.append(args) or load_merged_data(*args))
+    assert refresh(**paths) == ['2023-01']
+    assert len(loads) == 1
+
+    rebuilt = write_historic_dataset(load_merged_data(paths['store_path']), str(tmp_path / 'rebuilt.feather'))
+    pd.testing.assert_frame_equal(feather.read_feather(paths['dataset_path']), feather.read_feather(rebuilt),
+                                  check_categorical=False, check_dtype=False)
+
+
+def test_weather_mark_is_the_last_hour_with_values(tmp_path):
+    def write_part(start, end, empty_from=None):
+        times = pd.date_range(start, pd.Timestamp(end) + pd.Timedelta(hours=23), freq='h')
+        values = np.arange(len(times), dtype='float64')
+        if empty_from is not None:
+            values[times >= pd.Timestamp(empty_from)] = np.nan
+        pq.write_table(pa.table({'time': pa.array(times.to_numpy(dtype='datetime64[s]')),
+                                 **{feature: pa.array(values) for feature in WEATHER_FEATURES}}),
+                       os.path.join(tmp_path, f'{start}_{end}.parquet'))
+
+    # March was fetched on the 20th, the archive had the days up to the 14th
+    write_part('2023-03-01', '2023-03-31', empty_from='2023-03-15')
+    assert weather_mark(str(tmp_path)) == pd.Timestamp('2023-03-14 23:00')
+
+    # The next fetch starts after the mark, the overlapping hours of both parts are read once, with values
+    write_part('2023-03-15', '2023-03-31')
+    assert weather_mark(str(tmp_path)) == pd.Timestamp('2023-03-31 23:00')
+    weather = read_weather(pd.Timestamp('2023-03-01'), pd.Timestamp('2023-03-31 23:00'), str(tmp_path))
+    assert len(weather) == 31 * 24 and weather['dateTime'].is_unique
+    assert weather[WEATHER_FEATURES].notna().all().all()
@@ -0,0 +1,34 @@
+# Tests of the multi-process scorer of modules/parallel_scoring.py against in-process scoring.
+# Run from the project root: python -m pytest tests
+import os
+import pickle
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from modules.forest_model import export_model
+from modules.parallel_scoring import ParallelScorer
+from modules.preprocessing import get_preprocessing_service
+from modules.scoring import load_model, predict_severity
+from tests.inputs import make_inputs
+
+
+def test_partitions_come_back_in_order_with_the_in_process_results(tmp_path):
+    rng = np.random.default_rng(0)
+    X = get_preprocessing_service().transform_matrix(make_inputs(500, rng))
+    model = RandomForestClassifier(20, max_depth=8, random_state=0).fit(X, rng.integers(0, 2, X.shape[0]))
+    model_path = os.path.join(tmp_path, 'finalized_model.sav')
+    with open(model_path, 'wb') as file:
+        pickle.dump(model, file)
+    export_model(model_path)
+
+    # Partitions of different sizes, so the workers finish out of submission order
+    partitions = [make_inputs(size, np.random.default_rng(i)) for i, size in enumerate([900, 10, 500, 3, 200, 50])]
+    expected = [predict_severity(partition, load_model(model_path), 0.3) for partition in partitions]
+    with ParallelScorer(3, model_path=model_path, threshold=0.3, max_pending=4) as scorer:
+        results = list(scorer.score((partition, i) for i, partition in enumerate(partitions)))
+
+    assert [payload for payload, _, _ in results] == list(range(len(partitions)))
+    for (_, probabilities, predictions), (expected_probabilities, expected_predictions) in zip(results, expected):
+        np.testing.assert_array_equal(probabilities, expected_probabilities)
+        np.testing.assert_array_equal(predictions, expected_predictions)
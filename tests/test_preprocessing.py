@@ -0,0 +1,53 @@
+# Tests of the model inputs of modules/preprocessing.py for a forest fitted with feature names (the pickle of
+# Data Processing.ipynb) and for its flat forest, on synthetic inputs and the preprocessor in data/inference.
+# Run from the project root: python -m pytest tests
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+
+from tests.inputs import make_inputs
+from modules.forest_model import FlatForest
+from modules.preprocessing import get_preprocessing_service
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    service = get_preprocessing_service()
+    inputs = make_inputs(600, np.random.default_rng(0))
+    frame = service.transform(inputs, as_frame=True)
+    y = np.arange(len(frame)) % 2
+    return service, inputs, frame, RandomForestClassifier(10, random_state=0).fit(frame, y), y
+
+
+def test_model_with_feature_names_is_scored_without_warning(fitted):
+    service, inputs, frame, model, _ = fitted
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        probabilities = service.predict_proba(inputs, model)
+    np.testing.assert_array_equal(probabilities, model.predict_proba(frame))
+    flat = FlatForest.from_sklearn(model)
+    np.testing.assert_array_equal(flat.predict_proba(service.transform_for(inputs, flat)), probabilities)
+
+
+def test_model_fitted_on_other_columns_is_refused(fitted):
+    service, inputs, frame, _, y = fitted
+    swapped = frame[[frame.columns[1], frame.columns[0], *frame.columns[2:]]]
+    model = RandomForestClassifier(2, random_state=0).fit(swapped, y)
+    with pytest.raises(ValueError, match='from column 0 on'):
+        service.transform_for(inputs, model)
+    with pytest.raises(ValueError, match='from column 0 on'):
+        service.transform_for(inputs, FlatForest.from_sklearn(model))
+
+
+def test_models_get_the_matrix_of_the_preprocessor(fitted):
+    service, inputs, frame, model, y = fitted
+    # Dense output is not converted to CSR, sparse output is passed on as CSR
+    expected = sparse.csr_matrix if sparse.issparse(service.transform_many(inputs)) else np.ndarray
+    for fitted_model in [model, RandomForestClassifier(2, random_state=0).fit(frame.to_numpy(), y)]:
+        transformed = service.transform_for(inputs, fitted_model)
+        assert not isinstance(transformed, pd.DataFrame)
+        assert isinstance(transformed, expected)
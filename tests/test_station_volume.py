@@ -0,0 +1,119 @@
+# Tests of modules/station_volume.py against the per-timestamp KD-tree loop of Data Merging.ipynb, and of the
+# inference profiles against the hourly volumes the training features are built from
+# Run from the project root: python -m pytest tests
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from modules.station_volume import StationProfiles, StationVolumes, assign_closest_volume
+
+
+def legacy_assign(A, B, name, number_of_stations, number_of_periods):
+    """The loop of Data Merging.ipynb before modules.station_volume, without the progress bars."""
+    A = A.copy()
+    volume_columns = [f'{name}_volume_{station}_period_{period}'
+                      for period in range(number_of_periods)
+                      for station in range(number_of_stations)]
+    for col in volume_columns:
+        A[col] = np.full(len(A), np.nan, dtype='float64')
+
+    B_grouped = B.groupby('dateTime')
+    for period in range(number_of_periods):
+        adjusted_timestamps = A['dateTime'] - pd.to_timedelta(period, unit='h')
+        valid_timestamps = set(adjusted_timestamps.unique()).intersection(B_grouped.groups.keys())
+        timestamp_to_indices = adjusted_timestamps.groupby(adjusted_timestamps).groups
+        for timestamp in valid_timestamps:
+            idxs = timestamp_to_indices.get(timestamp, [])
+            B_filtered = B_grouped.get_group(timestamp)
+            kd_tree = cKDTree(B_filtered[['x', 'y']].values)
+            _, indices = kd_tree.query(A.loc[idxs, ['x', 'y']].values, k=number_of_stations)
+            if indices.ndim == 1:
+                indices = indices[:, np.newaxis]
+            volumes = B_filtered['volume'].values[indices]
+            for station in range(number_of_stations):
+                A.loc[idxs, f'{name}_volume_{station}_period_{period}'] = volumes[:, station]
+    A[volume_columns] = A[volume_columns].fillna(0)
+    return A
+
+
+def make_data(rng, accidents=300, stations=25, hours=24 * 20):
+    times = pd.date_range('2023-01-01', periods=hours, freq='h')
+    ids = np.repeat(np.arange(stations), len(times))
+    volume = pd.DataFrame({
+        'ID': ids,
+        'x': (2678000 + rng.random(stations) * 10000)[ids],
+        'y': (1242000 + rng.random(stations) * 10000)[ids],
+        'dateTime': np.tile(times, stations),
+        'volume': rng.integers(0, 1500, size=len(ids)).astype('float64'),
+    })
+    # Stations that start measuring later and single missing hours
+    first = rng.integers(0, len(times), size=stations) * (rng.random(stations) < 0.4)
+    missing = (np.arange(len(ids)) % len(times) < first[ids]) | (rng.random(len(ids)) < 0.1)
+    volume = volume[~missing].reset_index(drop=True)
+    df = pd.DataFrame({
+        'x': 2678000 + rng.random(accidents) * 10000,
+        'y': 1242000 + rng.random(accidents) * 10000,
+        'dateTime': times[rng.integers(0, len(times), size=accidents)],
+    })
+    return df, volume
+
+
+def test_matches_legacy_loop_with_one_row_per_station_and_hour():
+    df, volume = make_data(np.random.default_rng(0))
+    expected = legacy_assign(df, volume, 'traffic', 3, 2)
+    result = assign_closest_volume(df, volume, 'traffic', 3, 2).fillna(0)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_rows_of_a_station_in_the_same_hour_are_summed():
+    # Two counters of station A at 10:00, the legacy loop took them as two neighbours: [7, 5, 100]
+    volume = pd.DataFrame({
+        'ID': ['A', 'A', 'B', 'C'],
+        'x': [0.0, 0.0, 10.0, 20.0],
+        'y': [0.0, 0.0, 0.0, 0.0],
+        'dateTime': pd.to_datetime(['2023-05-01 10:00'] * 4),
+        'volume': [5.0, 7.0, 100.0, 200.0],
+    })
+    df = pd.DataFrame({'x': [1.0], 'y': [0.0], 'dateTime': pd.to_datetime(['2023-05-01 10:00'])})
+    result = assign_closest_volume(df, volume, 'traffic', 3, 1)
+    assert result[['traffic_volume_0_period_0', 'traffic_volume_1_period_0',
+                   'traffic_volume_2_period_0']].to_numpy().tolist() == [[12.0, 100.0, 200.0]]
+
+
+def test_rows_off_the_hour_are_left_out():
+    volume = pd.DataFrame({'ID': ['A', 'A'], 'x': [0.0, 0.0], 'y': [0.0, 0.0],
+                           'dateTime': pd.to_datetime(['2023-05-01 10:00', '2023-05-01 10:15']),
+                           'volume': [5.0, 9.0]})
+    volumes = StationVolumes(volume)
+    assert volumes.closest([0.0], [0.0], pd.to_datetime(['2023-05-01 10:00']), 1, 1).tolist() == [[[5.0]]]
+
+
+def test_profiles_average_the_hourly_volumes_of_training():
+    rng = np.random.default_rng(1)
+    _, volume = make_data(rng, stations=8, hours=24 * 60)
+    # A second counter at some stations and quarter-hour rows, like the pedestrian counts
+    extra = volume.sample(frac=0.3, random_state=1).assign(volume=lambda frame: frame['volume'] / 3)
+    quarter = volume.sample(frac=0.3, random_state=2).assign(dateTime=lambda frame: frame['dateTime']
+                                                             + pd.Timedelta(minutes=15))
+    volume = pd.concat([volume, extra, quarter], ignore_index=True)
+
+    hourly, profiles = StationVolumes(volume), StationProfiles.from_volume(volume)
+    hours = hourly.start + np.arange(len(hourly.values) - 1)
+    slots = StationProfiles.slot_positions(hours, 1)[:, 0]
+    expected = np.full(profiles.values.shape, np.nan)
+    frame = pd.DataFrame(hourly.values[:-1, :-1].astype('float64'))
+    frame['slot'] = slots
+    means = frame.groupby('slot').mean()
+    expected[means.index.to_numpy(), :-1] = means.to_numpy()
+    np.testing.assert_allclose(profiles.values, expected, rtol=1e-6)
+
+
+def test_profiles_sum_the_rows_of_a_station_in_the_same_hour():
+    volume = pd.DataFrame({'ID': ['A', 'A', 'A'], 'x': [0.0, 0.0, 0.0], 'y': [0.0, 0.0, 0.0],
+                           'dateTime': pd.to_datetime(['2023-05-01 10:00', '2023-05-01 10:00',
+                                                       '2023-05-01 10:15']),
+                           'volume': [5.0, 7.0, 30.0]})
+    when = pd.to_datetime(['2023-05-01 10:00'])
+    training = StationVolumes(volume).closest([0.0], [0.0], when, 1, 1)
+    inference = StationProfiles.from_volume(volume).closest([0.0], [0.0], when, 1, 1)
+    assert training.tolist() == inference.tolist() == [[[12.0]]]
@@ -0,0 +1,28 @@
+# Tests of modules/training.py: the threshold is chosen on the training rows, the test set is only reported on.
+# Run from the project root: python -m pytest tests
+import json
+
+import numpy as np
+
+from modules.training import save_training_data, train
+
+DISTRIBUTIONS = {'n_estimators': [10], 'max_depth': [3, 5], 'min_samples_leaf': [1, 5]}
+
+
+def test_threshold_does_not_depend_on_the_test_set(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.random((600, 5))
+    y = (X[:, 0] + 0.5 * rng.random(600) > 0.8).astype(int)
+    X_train, X_test, y_train, y_test = X[:400], X[400:], y[:400], y[400:]
+
+    summaries = []
+    for i, labels in enumerate([y_test, 1 - y_test]):
+        data_path = str(tmp_path / f'training_{i}.npz')
+        save_training_data(X_train, X_test, y_train, labels, [f'f{j}' for j in range(5)], path=data_path)
+        summaries.append(train(data_path, str(tmp_path / f'model_{i}.sav'), str(tmp_path / f'threshold_{i}.json'),
+                               trials_path=None, n_candidates=4, n_splits=3, n_jobs=1, distributions=DISTRIBUTIONS))
+
+    assert summaries[0]['threshold'] == summaries[1]['threshold']
+    assert summaries[0]['test_roc_auc'] == 1 - summaries[1]['test_roc_auc']
+    with open(tmp_path / 'threshold_0.json') as file:
+        assert json.load(file)['threshold'] == summaries[0]['threshold']
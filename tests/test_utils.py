@@ -0,0 +1,48 @@
+# Tests of the average volume lookup of modules/utils.py against the per-period merge it replaced.
+# Run from the project root: python -m pytest tests
+import numpy as np
+import pandas as pd
+
+from modules.utils import assign_average_volume, build_volume_table
+
+
+def merge_assign_average_volume(df, volume, number_of_stations, number_of_periods):
+    """The former implementation: one merge per period and one column assignment per station."""
+    result_df = df.copy()
+    for p in range(number_of_periods):
+        temp_merge_df = result_df[['month', 'weekday']].copy()
+        temp_merge_df['hour_shifted'] = (result_df['hour'] + p) % 24
+        merged = temp_merge_df.merge(volume, how='left',
+                                     left_on=['month', 'weekday', 'hour_shifted'],
+                                     right_on=['month', 'weekday', 'hour'])
+        for s in range(number_of_stations):
+            result_df[f"traffic_volume_{s}_period_{p}"] = merged['traffic']
+            result_df[f"pedestrian_volume_{s}_period_{p}"] = merged['pedestrian']
+    return result_df
+
+
+def make_volume(rng):
+    keys = pd.MultiIndex.from_product([range(1, 13), range(1, 8), range(24)], names=['month', 'weekday', 'hour'])
+    volume = keys.to_frame(index=False)
+    volume['traffic'], volume['pedestrian'] = rng.random(len(volume)) * 1000, rng.random(len(volume)) * 100
+    return volume
+
+
+def test_keys_outside_of_the_table_get_nan_like_the_merge():
+    rng = np.random.default_rng(0)
+    volume = make_volume(rng)
+    # Valid keys, month 0 and weekday 0 without averages, and months and weekdays outside of the table
+    df = pd.DataFrame({'month': [3, 0, 13, -1, 5, 12, 7], 'weekday': [2, 4, 1, 3, 8, -2, 0],
+                       'hour': [23, 5, 5, 5, 5, 5, 30]})
+    expected = merge_assign_average_volume(df, volume, 2, 3)
+    result = assign_average_volume(df, build_volume_table(volume), 2, 3)
+    pd.testing.assert_frame_equal(result[expected.columns], expected)
+    assert result.iloc[2:6, 3:].isna().all().all()
+
+
+def test_volume_rows_outside_of_the_table_are_left_out():
+    volume = pd.concat([make_volume(np.random.default_rng(1)),
+                        pd.DataFrame({'month': [14], 'weekday': [9], 'hour': [24], 'traffic': [1.0],
+                                      'pedestrian': [1.0]})], ignore_index=True)
+    table = build_volume_table(volume)
+    assert np.isnan(table[0]).all() and np.isfinite(table[1:, 1:]).all()
@@ -0,0 +1,72 @@
+# Tests of modules/weather_backfill.py: the CSV export with parts of runs with other windows and start dates, and
+# the windows fetched before the archive had their last days.
+# Run from the project root: python -m pytest tests
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules import weather_backfill
+from modules.weather_backfill import backfill_weather, export_csv, last_hours
+
+
+def archive(start_date, end_date, hourly=None, blocking=False, **kwargs):
+    times = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(hours=23), freq='h')
+    return {'time': times.strftime('%Y-%m-%dT%H:%M').tolist(),
+            **{variable: np.arange(len(times), dtype='float64').tolist() for variable in hourly}}
+
+
+def test_overlapping_parts_are_exported_once(tmp_path):
+    parts, csv_path = str(tmp_path / 'parts'), str(tmp_path / 'weather_data.csv')
+    backfill_weather('2023-01-01', '2023-03-31', path=parts, window='month', fetch=archive, hourly=['rain'])
+    backfill_weather('2023-01-01', '2023-12-31', path=parts, window='year', fetch=archive, hourly=['rain'])
+    backfill_weather('2023-02-15', '2023-02-28', path=parts, window='month', fetch=archive, hourly=['rain'])
+    assert len([name for name in os.listdir(parts) if name.endswith('.parquet')]) == 5
+
+    assert export_csv(parts, csv_path) == 365 * 24
+    weather = pd.read_csv(csv_path)
+    assert weather['time'].is_unique and weather['time'].is_monotonic_increasing
+    assert weather['time'].iloc[0] == '2023-01-01T00:00' and weather['time'].iloc[-1] == '2023-12-31T23:00'
+
+
+def test_export_of_a_date_range(tmp_path):
+    parts, csv_path = str(tmp_path / 'parts'), str(tmp_path / 'weather_data.csv')
+    backfill_weather('2023-01-01', '2023-12-31', path=parts, window='month', fetch=archive, hourly=['rain'])
+    assert export_csv(parts, csv_path, '2023-02-10', '2023-03-05') == 24 * 24
+    weather = pd.read_csv(csv_path)
+    assert (weather['time'].iloc[0], weather['time'].iloc[-1]) == ('2023-02-10T00:00', '2023-03-05T23:00')
+
+
+def test_window_with_empty_last_hours_is_fetched_again(tmp_path):
+    parts = str(tmp_path / 'parts')
+    calls = []
+
+    def lagging_archive(start_date, end_date, hourly=None, blocking=False, **kwargs):
+        # The first request of March comes before the archive has the days after the 14th
+        calls.append(start_date)
+        data = archive(start_date, end_date, hourly)
+        if calls.count(start_date) == 1 and start_date == '2023-03-01':
+            data['rain'][14 * 24:] = [None] * (len(data['rain']) - 14 * 24)
+        return data
+
+    backfill_weather('2023-02-01', '2023-03-31', path=parts, fetch=lagging_archive, hourly=['rain'])
+    assert last_hours(parts)['2023-03-01_2023-03-31.parquet'] == pd.Timestamp('2023-03-14 23:00')
+    backfill_weather('2023-02-01', '2023-03-31', path=parts, fetch=lagging_archive, hourly=['rain'])
+    assert calls == ['2023-02-01', '2023-03-01', '2023-03-01']
+    assert last_hours(parts)['2023-03-01_2023-03-31.parquet'] == pd.Timestamp('2023-03-31 23:00')
+    backfill_weather('2023-02-01', '2023-03-31', path=parts, fetch=lagging_archive, hourly=['rain'])
+    assert len(calls) == 3
+
+
+def test_export_streams_the_parts(tmp_path, monkeypatch):
+    parts, csv_path = str(tmp_path / 'parts'), str(tmp_path / 'weather_data.csv')
+    backfill_weather('2023-01-01', '2023-12-31', path=parts, window='month', fetch=archive, hourly=['rain'])
+    backfill_weather('2023-03-10', '2023-03-20', path=parts, window='month', fetch=archive, hourly=['rain'])
+    combined = []
+    deduplicate = weather_backfill.deduplicate_hours
+    monkeypatch.setattr(weather_backfill, 'deduplicate_hours',
+                        lambda weather: combined.append(len(weather)) or deduplicate(weather))
+    assert export_csv(parts, csv_path) == 365 * 24
+    # Only the held back hours of the previous part are combined with a part, never all of them
+    assert max(combined) <= 2 * 31 * 24
+    assert pd.read_csv(csv_path)['time'].is_unique